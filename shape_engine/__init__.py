@@ -1,98 +1,113 @@
 from django.db.models import CharField, TextField, NullBooleanField, BooleanField, URLField, ImageField, ForeignKey, OneToOneField, EmailField, FileField, SlugField, SmallIntegerField, IntegerField, BigIntegerField, DecimalField, FloatField, DateField, TimeField, DateTimeField, PositiveIntegerField, AutoField
-# Defining the possible mapping types
-ENGINE_FIONA_MAPPING = {}
-ENGINE_NATIVE_MAPPING = {}
-ENGINE_CTYPES_MAPPING = {}
-
-try:
-    import fiona
-    from fiona.crs import from_epsg
-
-    HAS_FIONA = True
-    ENGINE_FIONA_MAPPING = { CharField: "str",
-                             TextField: "str",
-                             NullBooleanField: "str",
-                             BooleanField: "str",
-                             URLField: "str",
-                             ImageField: "str",
-                             ForeignKey: "str",
-                             OneToOneField: "str",
-                             EmailField: "str",
-                             FileField: "str",
-                             SlugField: "str",
-                             AutoField: "int",
-                             SmallIntegerField: "int",
-                             PositiveIntegerField: "int",
-                             IntegerField: "int",
-                             BigIntegerField: "int",
-
-                             DecimalField: "float",
-                             FloatField: "float",
-
-                             DateField: "date",
-                             TimeField: "time",
-                             DateTimeField: "datetime"}
-
-except ImportError:
-    HAS_FIONA = False
-
-    try:
-        from osgeo import ogr, osr
-
-        HAS_NATIVE_BINDINGS = True
-        ENGINE_NATIVE_MAPPING = {CharField: ogr.OFTString,
-                                 TextField: ogr.OFTString,
-                                 NullBooleanField: ogr.OFTString,
-                                 BooleanField: ogr.OFTString,
-                                 URLField: ogr.OFTString,
-                                 ImageField: ogr.OFTString,
-                                 ForeignKey: ogr.OFTString,
-                                 OneToOneField: ogr.OFTString,
-                                 EmailField: ogr.OFTString,
-                                 FileField: ogr.OFTString,
-                                 SlugField: ogr.OFTString,
-
-                                 AutoField: ogr.OFTInteger,
-                                 SmallIntegerField: ogr.OFTInteger,
-                                 PositiveIntegerField: ogr.OFTInteger,
-                                 IntegerField: ogr.OFTInteger,
-                                 BigIntegerField: ogr.OFTInteger,
-
-                                 DecimalField: ogr.OFTReal,
-                                 FloatField: ogr.OFTReal,
-
-                                 DateField: ogr.OFTDate,
-                                 TimeField: ogr.OFTTime,
-                                 DateTimeField: ogr.OFTDateTime}
-    except ImportError:
-
-        HAS_NATIVE_BINDINGS = False
-        from django.contrib.gis.gdal.libgdal import lgdal
-        from django.contrib.gis.gdal import Driver, OGRGeometry, check_err
-        ENGINE_CTYPES_MAPPING = {CharField: ogr.OFTString,
-                                 TextField: ogr.OFTString,
-                                 NullBooleanField: ogr.OFTString,
-                                 BooleanField: ogr.OFTString,
-                                 URLField: ogr.OFTString,
-                                 ImageField: ogr.OFTString,
-                                 ForeignKey: ogr.OFTString,
-                                 OneToOneField: ogr.OFTString,
-                                 EmailField: ogr.OFTString,
-                                 FileField: ogr.OFTString,
-                                 SlugField: ogr.OFTString,
-
-                                 AutoField: ogr.OFTInteger,
-                                 SmallIntegerField: ogr.OFTInteger,
-                                 PositiveIntegerField: ogr.OFTInteger,
-                                 IntegerField: ogr.OFTInteger,
-                                 BigIntegerField: ogr.OFTInteger,
-
-                                 DecimalField: ogr.OFTReal,
-                                 FloatField: ogr.OFTReal,
-
-                                 DateField: ogr.OFTDate,
-                                 TimeField: ogr.OFTTime,
-                                 DateTimeField: ogr.OFTDateTime}
+from .registry import engines
+
+# Defining the possible mapping types. The ones of the native and
+# ctypes engines hold the names of the OGR field types, resolved when
+# the field is mapped, so no GDAL binding is imported here
+ENGINE_FIONA_MAPPING = { CharField: "str",
+                         TextField: "str",
+                         NullBooleanField: "str",
+                         BooleanField: "str",
+                         URLField: "str",
+                         ImageField: "str",
+                         ForeignKey: "str",
+                         OneToOneField: "str",
+                         EmailField: "str",
+                         FileField: "str",
+                         SlugField: "str",
+                         AutoField: "int",
+                         SmallIntegerField: "int",
+                         PositiveIntegerField: "int",
+                         IntegerField: "int",
+                         BigIntegerField: "int",
+
+                         DecimalField: "float",
+                         FloatField: "float",
+
+                         DateField: "date",
+                         TimeField: "time",
+                         DateTimeField: "datetime"}
+
+ENGINE_OGR_MAPPING = {CharField: "OFTString",
+                      TextField: "OFTString",
+                      NullBooleanField: "OFTString",
+                      BooleanField: "OFTString",
+                      URLField: "OFTString",
+                      ImageField: "OFTString",
+                      ForeignKey: "OFTString",
+                      OneToOneField: "OFTString",
+                      EmailField: "OFTString",
+                      FileField: "OFTString",
+                      SlugField: "OFTString",
+
+                      AutoField: "OFTInteger",
+                      SmallIntegerField: "OFTInteger",
+                      PositiveIntegerField: "OFTInteger",
+                      IntegerField: "OFTInteger",
+                      BigIntegerField: "OFTInteger64",
+
+                      DecimalField: "OFTReal",
+                      FloatField: "OFTReal",
+
+                      DateField: "OFTDate",
+                      TimeField: "OFTTime",
+                      DateTimeField: "OFTDateTime"}
+
+# dbf type, length and decimals. Lengths of None are taken from the
+# field, and the text ones are capped to the dbf limit of 254
+ENGINE_DIRECT_MAPPING = {CharField: ("C", None, 0),
+                         TextField: ("C", 254, 0),
+                         NullBooleanField: ("C", 5, 0),
+                         BooleanField: ("C", 5, 0),
+                         URLField: ("C", None, 0),
+                         ImageField: ("C", None, 0),
+                         ForeignKey: ("C", 254, 0),
+                         OneToOneField: ("C", 254, 0),
+                         EmailField: ("C", None, 0),
+                         FileField: ("C", None, 0),
+                         SlugField: ("C", None, 0),
+
+                         AutoField: ("N", 11, 0),
+                         SmallIntegerField: ("N", 6, 0),
+                         PositiveIntegerField: ("N", 10, 0),
+                         IntegerField: ("N", 11, 0),
+                         BigIntegerField: ("N", 20, 0),
+
+                         DecimalField: ("N", None, None),
+                         FloatField: ("N", 24, 15),
+
+                         DateField: ("D", 8, 0),
+                         TimeField: ("C", 15, 0),
+                         DateTimeField: ("C", 32, 0)}
+
+# NumPy dtypes of the columns handed to pyogrio
+ENGINE_PYOGRIO_MAPPING = {CharField: "object",
+                          TextField: "object",
+                          NullBooleanField: "object",
+                          BooleanField: "object",
+                          URLField: "object",
+                          ImageField: "object",
+                          ForeignKey: "object",
+                          OneToOneField: "object",
+                          EmailField: "object",
+                          FileField: "object",
+                          SlugField: "object",
+
+                          AutoField: "int64",
+                          SmallIntegerField: "int64",
+                          PositiveIntegerField: "int64",
+                          IntegerField: "int64",
+                          BigIntegerField: "int64",
+
+                          DecimalField: "float64",
+                          FloatField: "float64",
+
+                          DateField: "object",
+                          TimeField: "object",
+                          DateTimeField: "object"}
+
+ENGINE_NATIVE_MAPPING = ENGINE_OGR_MAPPING
+ENGINE_CTYPES_MAPPING = ENGINE_OGR_MAPPING
 
 try:
     from cStringIO import StringIO
@@ -104,11 +119,88 @@ DEFAULT_FIELD_NAME_LENGTH = 10
 ENGINE_FIONA = "FIONA"
 ENGINE_NATIVE = "NATIVE"
 ENGINE_CTYPES = "CTYPES"
-
+ENGINE_DIRECT = "DIRECT"
+ENGINE_PYOGRIO = "PYOGRIO"
+
+# the output formats written through GDAL
+OGR_FORMATS = ("ESRI Shapefile", "GPKG", "FlatGeobuf", "GeoJSONSeq")
+
+# the ctypes engine goes through GeoDjango's own GDAL bindings,
+# so it is always available
+engines.register(ENGINE_FIONA,
+                 requires=("fiona",),
+                 mapping=ENGINE_FIONA_MAPPING,
+                 writer="shape_engine.engine.FionaShapefileWriter",
+                 mapper="shape_engine.field_map.FionaFieldMapper",
+                 priority=20,
+                 formats=OGR_FORMATS,
+                 options=("dimensions", "promote_to_multi", "split_geometry_types", "pipelined", "max_size",
+                          "spatial_index", "spatial_sort"),
+                 streaming=True,
+                 parallel_safe=True,
+                 in_memory=True)
+engines.register(ENGINE_NATIVE,
+                 requires=("osgeo.ogr", "osgeo.osr"),
+                 mapping=ENGINE_NATIVE_MAPPING,
+                 writer="shape_engine.engine.NativeShapefileWriter",
+                 mapper="shape_engine.field_map.NativeFieldMapper",
+                 priority=10,
+                 formats=OGR_FORMATS,
+                 options=("dimensions", "promote_to_multi", "max_size", "spatial_index", "spatial_sort"),
+                 streaming=True,
+                 parallel_safe=True,
+                 in_memory=True)
+engines.register(ENGINE_CTYPES,
+                 mapping=ENGINE_CTYPES_MAPPING,
+                 writer="shape_engine.engine.CtypesShapefileWriter",
+                 mapper="shape_engine.field_map.CtypesFieldMapper",
+                 priority=0,
+                 formats=OGR_FORMATS,
+                 options=("dimensions", "promote_to_multi", "max_size", "spatial_index", "spatial_sort"),
+                 streaming=True,
+                 parallel_safe=True,
+                 in_memory=True)
+# writes the files itself, so it only handles the simple geometry
+# types. Fiona stays the default, this one is used without it
+engines.register(ENGINE_DIRECT,
+                 mapping=ENGINE_DIRECT_MAPPING,
+                 writer="shape_engine.engine.DirectShapefileWriter",
+                 mapper="shape_engine.field_map.DirectFieldMapper",
+                 priority=15,
+                 formats=("ESRI Shapefile", "GeoJSONSeq"),
+                 options=("dimensions", "promote_to_multi", "pipelined", "max_size", "spatial_index",
+                          "spatial_sort"),
+                 geometry_types=("Point", "MultiPoint", "LineString", "MultiLineString",
+                                 "Polygon", "MultiPolygon"),
+                 streaming=True,
+                 parallel_safe=True,
+                 iter_records=True)
+
+# the built in engines. The pyogrio one isn't registered, as
+# pyogrio needs Python 3 (see register_pyogrio)
 ENGINES = [ENGINE_FIONA,
            ENGINE_NATIVE,
-           ENGINE_CTYPES]
-
-ENGINE_MAPPINGS = {ENGINE_FIONA: ENGINE_FIONA_MAPPING,
-                   ENGINE_NATIVE: ENGINE_NATIVE_MAPPING,
-                   ENGINE_CTYPES: ENGINE_CTYPES_MAPPING}
\ No newline at end of file
+           ENGINE_CTYPES,
+           ENGINE_DIRECT]
+
+
+def register_pyogrio(registry=engines, priority=18):
+
+    """
+    Registers the pyogrio engine, which hands the rows to GDAL
+    in chunks of NumPy columns, below Fiona by default
+    """
+
+    return registry.register(ENGINE_PYOGRIO,
+                             requires=("pyogrio", "numpy"),
+                             mapping=ENGINE_PYOGRIO_MAPPING,
+                             writer="shape_engine.engine.PyogrioShapefileWriter",
+                             mapper="shape_engine.field_map.PyogrioFieldMapper",
+                             priority=priority,
+                             formats=OGR_FORMATS,
+                             options=("dimensions", "promote_to_multi", "spatial_index", "spatial_sort"),
+                             streaming=True,
+                             parallel_safe=True)
+
+HAS_FIONA = engines.is_available(ENGINE_FIONA)
+HAS_NATIVE_BINDINGS = engines.is_available(ENGINE_NATIVE)
@@ -0,0 +1,595 @@
+# coding: utf-8
+"""
+Writes shapefiles without going through OGR: the geometries are
+packed from their WKB into the .shp and .shx layouts of the ESRI
+Shapefile Technical Description, and the attributes into the fixed
+width records of a dBASE III file. NumPy, when installed, is used
+to read the coordinates.
+"""
+import codecs
+import datetime
+import struct
+
+from .registry import lazy_import, module_exists
+
+numpy = lazy_import("numpy") if module_exists("numpy") else None
+
+
+WKB_POINT = 1
+WKB_LINESTRING = 2
+WKB_POLYGON = 3
+WKB_MULTIPOINT = 4
+WKB_MULTILINESTRING = 5
+WKB_MULTIPOLYGON = 6
+
+# flags of the geometry type in EWKB, ISO WKB uses +1000 for Z
+EWKB_Z = 0x80000000
+EWKB_M = 0x40000000
+EWKB_SRID = 0x20000000
+
+SHP_NULL = 0
+SHP_POINT = 1
+SHP_POLYLINE = 3
+SHP_POLYGON = 5
+SHP_MULTIPOINT = 8
+SHP_Z = 10
+
+SHP_FILE_CODE = 9994
+SHP_VERSION = 1000
+SHP_HEADER_SIZE = 100
+
+# shape type of the layer, by OGR name of its geometry type
+SHAPE_TYPES = {"Point": SHP_POINT,
+               "MultiPoint": SHP_MULTIPOINT,
+               "LineString": SHP_POLYLINE,
+               "MultiLineString": SHP_POLYLINE,
+               "Polygon": SHP_POLYGON,
+               "MultiPolygon": SHP_POLYGON}
+
+GEOJSON_TYPES = {WKB_POINT: "Point",
+                 WKB_LINESTRING: "LineString",
+                 WKB_POLYGON: "Polygon",
+                 WKB_MULTIPOINT: "MultiPoint",
+                 WKB_MULTILINESTRING: "MultiLineString",
+                 WKB_MULTIPOLYGON: "MultiPolygon"}
+
+# how much larger than the WKB of a geometry the content of its
+# record can be: points have none, the other shapes a bbox
+SHP_CONTENT_OVERHEAD = {SHP_POINT: 0,
+                        SHP_POINT + SHP_Z: 0}
+SHP_MAX_CONTENT_OVERHEAD = 55
+
+DBF_VERSION = 0x03
+DBF_END_OF_HEADER = b'\x0d'
+DBF_END_OF_FILE = b'\x1a'
+
+# code pages of the .cpg file, by python codec
+CODE_PAGES = {"utf-8": "UTF-8",
+              "iso8859-1": "ISO-8859-1",
+              "cp1252": "1252"}
+
+
+class Coordinates(object):
+
+    """
+    A sequence of coordinates read from WKB, as a NumPy
+    array when available or as tuples of the x, y and z
+    """
+
+    def __init__(self, data, offset, count, dims, byte_order):
+        self.count = count
+        self.dims = dims
+
+        if numpy is not None:
+            self.array = numpy.frombuffer(data, dtype=byte_order + "f8", count=count * dims,
+                                          offset=offset).reshape(count, dims)
+        else:
+            values = struct.unpack_from("%s%dd" % (byte_order, count * dims), data, offset)
+            self.array = None
+            self.xs = values[0::dims]
+            self.ys = values[1::dims]
+            self.zs = values[2::dims] if dims > 2 else None
+
+    def bounds(self):
+        if self.array is not None:
+            mins = self.array.min(axis=0)
+            maxs = self.array.max(axis=0)
+            return float(mins[0]), float(mins[1]), float(maxs[0]), float(maxs[1])
+
+        return min(self.xs), min(self.ys), max(self.xs), max(self.ys)
+
+    def z_bounds(self):
+        if self.dims < 3:
+            return 0.0, 0.0
+
+        if self.array is not None:
+            return float(self.array[:, 2].min()), float(self.array[:, 2].max())
+
+        return min(self.zs), max(self.zs)
+
+    def is_clockwise(self):
+
+        """
+        Tells whether a ring goes clockwise, by the
+        sign of its area (shoelace formula)
+        """
+
+        if self.array is not None:
+            xs = self.array[:, 0]
+            ys = self.array[:, 1]
+            area = float((xs[:-1] * ys[1:] - xs[1:] * ys[:-1]).sum())
+        else:
+            xs, ys = self.xs, self.ys
+            area = sum(x0 * y1 - x1 * y0 for x0, y0, x1, y1 in zip(xs, ys, xs[1:], ys[1:]))
+
+        return area < 0
+
+    def reverse(self):
+        if self.array is not None:
+            self.array = self.array[::-1]
+        else:
+            self.xs = self.xs[::-1]
+            self.ys = self.ys[::-1]
+            if self.zs is not None:
+                self.zs = self.zs[::-1]
+
+    def to_list(self):
+
+        """
+        Returns the coordinates as lists of their x, y and
+        z, the positions of GeoJSON
+        """
+
+        if self.array is not None:
+            return self.array[:, :min(self.dims, 3)].tolist()
+
+        if self.zs is not None:
+            return [list(position) for position in zip(self.xs, self.ys, self.zs)]
+
+        return [list(position) for position in zip(self.xs, self.ys)]
+
+    def pack_xy(self):
+        if self.array is not None:
+            return numpy.ascontiguousarray(self.array[:, :2], dtype="<f8").tobytes()
+
+        values = [None] * (self.count * 2)
+        values[0::2] = self.xs
+        values[1::2] = self.ys
+        return struct.pack("<%dd" % len(values), *values)
+
+    def pack_z(self):
+        if self.dims < 3:
+            return b"\0" * (8 * self.count)
+
+        if self.array is not None:
+            return numpy.ascontiguousarray(self.array[:, 2], dtype="<f8").tobytes()
+
+        return struct.pack("<%dd" % self.count, *self.zs)
+
+
+def read_wkb(data, offset=0):
+
+    """
+    Reads a (E)WKB point, line, polygon or multi geometry.
+    Returns its WKB type, the list of its parts, each a list of
+    Coordinates (the rings of polygons, a single sequence
+    otherwise) and the offset where the geometry ends
+    """
+
+    byte_order = "<" if data[offset:offset + 1] == b"\x01" else ">"
+    wkb_type, = struct.unpack_from(byte_order + "I", data, offset + 1)
+    offset += 5
+
+    # the measures would be taken for the z of the coordinates
+    if wkb_type & EWKB_M or (wkb_type & 0x0fffffff) // 1000 in (2, 3):
+        raise ValueError("Measured geometries can't be written by the direct engine.")
+
+    dims = 2
+    if wkb_type & EWKB_Z:
+        dims += 1
+    if wkb_type & EWKB_SRID:
+        offset += 4
+
+    wkb_type &= 0x0fffffff
+    if wkb_type >= 1000:
+        dims += 1
+        wkb_type %= 1000
+
+    if wkb_type == WKB_POINT:
+        return wkb_type, [[Coordinates(data, offset, 1, dims, byte_order)]], offset + 8 * dims
+
+    if wkb_type == WKB_LINESTRING:
+        count, = struct.unpack_from(byte_order + "I", data, offset)
+        coordinates = Coordinates(data, offset + 4, count, dims, byte_order)
+        return wkb_type, [[coordinates]], offset + 4 + 8 * dims * count
+
+    if wkb_type == WKB_POLYGON:
+        num_rings, = struct.unpack_from(byte_order + "I", data, offset)
+        offset += 4
+        rings = []
+        for i in range(num_rings):
+            count, = struct.unpack_from(byte_order + "I", data, offset)
+            rings.append(Coordinates(data, offset + 4, count, dims, byte_order))
+            offset += 4 + 8 * dims * count
+        return wkb_type, [rings], offset
+
+    if wkb_type in (WKB_MULTIPOINT, WKB_MULTILINESTRING, WKB_MULTIPOLYGON):
+        num_geometries, = struct.unpack_from(byte_order + "I", data, offset)
+        offset += 4
+        parts = []
+        for i in range(num_geometries):
+            member_type, member_parts, offset = read_wkb(data, offset)
+            parts.extend(member_parts)
+        return wkb_type, parts, offset
+
+    raise ValueError("Geometry type %d can't be written to a shapefile." % wkb_type)
+
+
+def wkb_to_geojson(wkb):
+
+    """
+    Returns the GeoJSON geometry object of a (E)WKB
+    point, line, polygon or multi geometry
+    """
+
+    wkb_type, parts, end = read_wkb(bytes(wkb))
+
+    if wkb_type == WKB_POINT:
+        coordinates = parts[0][0].to_list()[0]
+    elif wkb_type == WKB_LINESTRING:
+        coordinates = parts[0][0].to_list()
+    elif wkb_type == WKB_POLYGON:
+        coordinates = [ring.to_list() for ring in parts[0]]
+    elif wkb_type == WKB_MULTIPOINT:
+        coordinates = [part[0].to_list()[0] for part in parts]
+    elif wkb_type == WKB_MULTILINESTRING:
+        coordinates = [part[0].to_list() for part in parts]
+    else:
+        coordinates = [[ring.to_list() for ring in part] for part in parts]
+
+    return {"type": GEOJSON_TYPES[wkb_type], "coordinates": coordinates}
+
+
+def get_wkb_size(geometry):
+
+    """
+    Returns the size of the WKB of a GeoJSON geometry object
+    """
+
+    geometry_type = geometry["type"]
+
+    if geometry_type == "GeometryCollection":
+        return 9 + sum(get_wkb_size(member) for member in geometry["geometries"])
+
+    coordinates = geometry["coordinates"]
+
+    if geometry_type.startswith("Multi"):
+        member_type = geometry_type[len("Multi"):]
+        return 9 + sum(get_wkb_size({"type": member_type, "coordinates": member}) for member in coordinates)
+
+    if geometry_type == "Point":
+        return 5 + 8 * len(coordinates)
+
+    if geometry_type == "LineString":
+        return 9 + sum(8 * len(point) for point in coordinates)
+
+    return 9 + sum(4 + sum(8 * len(point) for point in ring) for ring in coordinates)
+
+
+def estimate_shp_record_size(wkb_size, shape_type=None):
+
+    """
+    Returns an upper bound of the size in the .shp, record
+    header included, of a geometry of wkb_size bytes of WKB
+    """
+
+    return 8 + wkb_size + SHP_CONTENT_OVERHEAD.get(shape_type, SHP_MAX_CONTENT_OVERHEAD)
+
+
+class ShpWriter(object):
+
+    """
+    Streams the records of a layer to its .shp and .shx files.
+    The headers, which hold the length and extent of the whole
+    layer, are written when the writer is closed
+    """
+
+    def __init__(self, shp, shx, shape_type):
+        self.shape_type = shape_type
+        self.has_z = shape_type > SHP_Z
+        self.base_type = shape_type - SHP_Z if self.has_z else shape_type
+
+        self.start(shp, shx)
+
+    def start(self, shp, shx):
+
+        """
+        Starts writing to new files, once the
+        previous ones, if any, are closed
+        """
+
+        self.shp = shp
+        self.shx = shx
+        self.num_records = 0
+        self.shp_length = SHP_HEADER_SIZE
+        self.bbox = None
+        self.z_range = None
+
+        self.shp.write(b"\0" * SHP_HEADER_SIZE)
+        self.shx.write(b"\0" * SHP_HEADER_SIZE)
+
+    def write(self, wkb):
+
+        """
+        Writes the record of a geometry, given as WKB.
+        None and empty geometries are written as null shapes
+        """
+
+        self.write_content(self.pack(wkb))
+
+    def pack(self, wkb):
+
+        """
+        Returns the content of the record of a geometry. Packing
+        doesn't change the writer, records can be packed in
+        other threads
+        """
+
+        if wkb is None:
+            return struct.pack("<i", SHP_NULL)
+
+        wkb_type, parts, end = read_wkb(bytes(wkb))
+        coordinates = [c for part in parts for c in part if c.count]
+
+        if not coordinates:
+            return struct.pack("<i", SHP_NULL)
+
+        return self._pack(wkb_type, parts, coordinates)
+
+    def write_content(self, content):
+        self._extend(content)
+        self.num_records += 1
+        length = len(content) // 2
+
+        self.shx.write(struct.pack(">2i", self.shp_length // 2, length))
+        self.shp.write(struct.pack(">2i", self.num_records, length))
+        self.shp.write(content)
+        self.shp_length += 8 + len(content)
+
+    def _pack(self, wkb_type, parts, coordinates):
+        bounds = [c.bounds() for c in coordinates]
+        bbox = (min(b[0] for b in bounds), min(b[1] for b in bounds),
+                max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+        if self.base_type == SHP_POINT:
+            if wkb_type not in (WKB_POINT, WKB_MULTIPOINT):
+                raise ValueError("Only points can be written to a point shapefile.")
+            if len(coordinates) != 1:
+                raise ValueError("Only single points can be written to a point shapefile.")
+
+            content = struct.pack("<i", self.shape_type) + coordinates[0].pack_xy()
+            if self.has_z:
+                # the measure is left out, as GDAL does, otherwise
+                # readers take the shapefile for a measured one
+                content += coordinates[0].pack_z()
+            return content
+
+        if self.base_type == SHP_MULTIPOINT:
+            if wkb_type not in (WKB_POINT, WKB_MULTIPOINT):
+                raise ValueError("Only points can be written to a multipoint shapefile.")
+            return self._pack_parts(bbox, coordinates, parts_index=False)
+
+        if self.base_type == SHP_POLYLINE:
+            if wkb_type not in (WKB_LINESTRING, WKB_MULTILINESTRING):
+                raise ValueError("Only lines can be written to a polyline shapefile.")
+            return self._pack_parts(bbox, coordinates)
+
+        if wkb_type not in (WKB_POLYGON, WKB_MULTIPOLYGON):
+            raise ValueError("Only polygons can be written to a polygon shapefile.")
+
+        # outer rings go clockwise and holes counterclockwise
+        for polygon in parts:
+            for i, ring in enumerate(polygon):
+                if ring.count and ring.is_clockwise() != (i == 0):
+                    ring.reverse()
+
+        return self._pack_parts(bbox, coordinates)
+
+    def _pack_parts(self, bbox, coordinates, parts_index=True):
+        num_points = sum(c.count for c in coordinates)
+
+        if parts_index:
+            starts = []
+            start = 0
+            for c in coordinates:
+                starts.append(start)
+                start += c.count
+
+            header = struct.pack("<i4d2i%di" % len(starts), self.shape_type, bbox[0], bbox[1],
+                                 bbox[2], bbox[3], len(starts), num_points, *starts)
+        else:
+            header = struct.pack("<i4di", self.shape_type, bbox[0], bbox[1], bbox[2], bbox[3],
+                                 num_points)
+
+        content = [header]
+        content.extend(c.pack_xy() for c in coordinates)
+
+        if self.has_z:
+            z_bounds = [c.z_bounds() for c in coordinates]
+            content.append(struct.pack("<2d", min(z[0] for z in z_bounds), max(z[1] for z in z_bounds)))
+            content.extend(c.pack_z() for c in coordinates)
+
+        return b"".join(content)
+
+    def _extend(self, content):
+
+        """
+        Extends the extent of the layer with
+        the one written in a record
+        """
+
+        if struct.unpack_from("<i", content)[0] == SHP_NULL:
+            return
+
+        if self.base_type == SHP_POINT:
+            x, y = struct.unpack_from("<2d", content, 4)
+            bbox = (x, y, x, y)
+            z_offset = 20
+        elif self.base_type == SHP_MULTIPOINT:
+            bbox = struct.unpack_from("<4d", content, 4)
+            z_offset = 40 + 16 * struct.unpack_from("<i", content, 36)[0]
+        else:
+            bbox = struct.unpack_from("<4d", content, 4)
+            num_parts, num_points = struct.unpack_from("<2i", content, 36)
+            z_offset = 44 + 4 * num_parts + 16 * num_points
+
+        if self.bbox is None:
+            self.bbox = bbox
+        else:
+            self.bbox = (min(self.bbox[0], bbox[0]), min(self.bbox[1], bbox[1]),
+                         max(self.bbox[2], bbox[2]), max(self.bbox[3], bbox[3]))
+
+        if self.has_z:
+            if self.base_type == SHP_POINT:
+                z_range = struct.unpack_from("<d", content, z_offset) * 2
+            else:
+                z_range = struct.unpack_from("<2d", content, z_offset)
+
+            if self.z_range is None:
+                self.z_range = z_range
+            else:
+                self.z_range = (min(self.z_range[0], z_range[0]), max(self.z_range[1], z_range[1]))
+
+    def _header(self, length):
+        bbox = self.bbox or (0.0, 0.0, 0.0, 0.0)
+        z_range = self.z_range or (0.0, 0.0)
+
+        return (struct.pack(">7i", SHP_FILE_CODE, 0, 0, 0, 0, 0, length // 2) +
+                struct.pack("<2i", SHP_VERSION, self.shape_type) +
+                struct.pack("<8d", bbox[0], bbox[1], bbox[2], bbox[3],
+                            z_range[0], z_range[1], 0.0, 0.0))
+
+    def close(self):
+        self.shp.seek(0)
+        self.shp.write(self._header(self.shp_length))
+        self.shx.seek(0)
+        self.shx.write(self._header(SHP_HEADER_SIZE + 8 * self.num_records))
+
+
+class DbfField(object):
+
+    """
+    A field of a dBASE III file
+    """
+
+    def __init__(self, name, type, length, decimals=0):
+        self.name = name
+        self.type = type
+        self.length = length
+        self.decimals = decimals
+
+    def format(self, value, encoding):
+
+        """
+        Returns the value as the bytes of the field,
+        padded to its length
+        """
+
+        length = self.length
+
+        if value is None or value == "":
+            return b" " * length
+
+        if self.type == "N":
+            if self.decimals:
+                text = "%.*f" % (self.decimals, float(value))
+            else:
+                text = "%d" % int(value)
+
+            if len(text) > length:
+                return b"*" * length
+
+            return text.rjust(length).encode("ascii")
+
+        if self.type == "D":
+            return ("%04d%02d%02d" % (value.year, value.month, value.day)).encode("ascii")
+
+        if self.type == "L":
+            return b"T" if value else b"F"
+
+        if isinstance(value, bytes):
+            value = value.decode(encoding, "replace")
+        elif not isinstance(value, type(u"")):
+            value = u"%s" % (value,)
+
+        data = value.encode(encoding, "replace")
+        if len(data) > length:
+            # characters of more than a byte aren't cut in half
+            data = data[:length].decode(encoding, "ignore").encode(encoding)
+
+        return data + b" " * (length - len(data))
+
+
+class DbfWriter(object):
+
+    """
+    Streams fixed width records to a dBASE III file. The number
+    of records, in the header, is written when it's closed
+    """
+
+    def __init__(self, dbf, fields, encoding="utf-8"):
+        self.fields = fields
+        self.encoding = encoding
+
+        self.header_length = 32 + 32 * len(fields) + 1
+        self.record_length = 1 + sum(field.length for field in fields)
+
+        self.start(dbf)
+
+    def start(self, dbf):
+
+        """
+        Starts writing to a new file, once the
+        previous one, if any, is closed
+        """
+
+        self.dbf = dbf
+        self.num_records = 0
+
+        self.dbf.write(self._header())
+        for field in self.fields:
+            name = field.name.encode("ascii", "replace")[:10]
+            self.dbf.write(struct.pack("<11sc4xBB14x", name, field.type.encode("ascii"),
+                                       field.length, field.decimals))
+        self.dbf.write(DBF_END_OF_HEADER)
+
+    def _header(self):
+        today = datetime.date.today()
+        return struct.pack("<4BIHH20x", DBF_VERSION, today.year - 1900, today.month, today.day,
+                           self.num_records, self.header_length, self.record_length)
+
+    def write(self, values):
+        self.write_record(self.pack(values))
+
+    def pack(self, values):
+        encoding = self.encoding
+        return b" " + b"".join(field.format(value, encoding) for field, value in zip(self.fields, values))
+
+    def write_record(self, record):
+        self.dbf.write(record)
+        self.num_records += 1
+
+    def close(self):
+        self.dbf.write(DBF_END_OF_FILE)
+        self.dbf.seek(0)
+        self.dbf.write(self._header())
+
+
+def get_code_page(encoding):
+
+    """
+    Returns the content of the .cpg file of an encoding
+    """
+
+    name = codecs.lookup(encoding).name
+    return CODE_PAGES.get(name, name.upper())
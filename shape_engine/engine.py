@@ -1,23 +1,80 @@
 # coding: utf-8
+import codecs
+import os
 import json
-from django.contrib.gis.gdal import OGRGeomType, SpatialReference, CoordTransform
+from itertools import islice
+from django.contrib.gis.gdal import OGRGeomType, SpatialReference, CoordTransform, Driver, OGRGeometry, GDALException, check_err
+from django.contrib.gis.gdal.prototypes import ds as ogr_capi
+from django.contrib.gis.geos import Point
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import six
+from django.utils.encoding import force_bytes, force_text
 from . import *
+from . import prototypes as ogr_write_capi
+from .direct import (
+    SHAPE_TYPES,
+    SHP_Z,
+    DbfWriter,
+    ShpWriter,
+    estimate_shp_record_size,
+    get_code_page,
+    get_wkb_size,
+    wkb_to_geojson,
+)
 from .field_map import FieldMapper
+from .formats import get_format
+from .functions import (
+    GEOHASH_SRID,
+    get_as_wkb_function,
+    get_extent_aggregate,
+    get_force_dimension_function,
+    get_spatial_order,
+    get_transform_function,
+)
+from .pipeline import DEFAULT_QUEUE_SIZE, Pipeline
+from .registry import lazy_import
+from .utils import (
+    DEFAULT_SORT_CURVE,
+    SORT_CURVES,
+    GeometryCoercer,
+    SizeLimit,
+    external_sort,
+    geohash,
+    get_center,
+    get_hilbert_key,
+    get_multi_geometry_type,
+    get_part_path,
+    split_parts,
+)
+
+COERCED_GEOMETRY_ATTR = "shape_engine_geometry"
+TRANSFORMED_GEOMETRY_ATTR = "shape_engine_transformed"
+WKB_GEOMETRY_ATTR = "shape_engine_wkb"
+
+# RFC 7946 coordinates are always WGS 84
+GEOJSON_SRID = 4326
+
+# the dbf widths GDAL gives the fiona types without one
+FIONA_FIELD_WIDTHS = {"str": 80,
+                      "int": 18,
+                      "float": 24,
+                      "date": 8}
+DBF_MAX_FIELD_WIDTH = 254
+
+# the libraries of the engines are imported on first use
+fiona = lazy_import("fiona")
+fiona_crs = lazy_import("fiona.crs")
+ogr = lazy_import("osgeo.ogr")
+osr = lazy_import("osgeo.osr")
+numpy = lazy_import("numpy")
+pyogrio_raw = lazy_import("pyogrio.raw")
 
 
 class ShapefileWriter(object):
 
     @staticmethod
-    def create(engine):
-
-        if engine == ENGINE_FIONA:
-            return FionaShapefileWriter(engine)
-
-        if engine == ENGINE_CTYPES:
-            return CtypesShapefileWriter(engine)
-
-        if engine == ENGINE_NATIVE:
-            return NativeShapefileWriter(engine)
+    def create(engine, **kwargs):
+        return engines.get_writer_class(engine)(engine, **kwargs)
 
 
 class BaseShapefileWriter(object):
@@ -25,9 +82,22 @@ class BaseShapefileWriter(object):
     model_field_names = []
     driver_name = None
     choice_display = False
+    geometry_attr = None
+    coerce_dimensions = None
+    promote_to_multi = False
+    out_srid = None
+    wkb_attr = None
+    pipelined = False
+    queue_size = DEFAULT_QUEUE_SIZE
+    sort_curve = None
+    # the sort keys held in memory before they are spilled to disk
+    sort_chunk_size = 100000
+    # the items fetched by primary key per query, SQLite
+    # takes at most 999 parameters
+    fetch_size = 500
 
     def __init__(self, engine=ENGINE_FIONA, driver_name="ESRI Shapefile"):
-        if engine not in ENGINES:
+        if engine not in engines:
             raise AttributeError("Engine not supported")
 
         self.engine = engine
@@ -36,9 +106,162 @@ class BaseShapefileWriter(object):
     def _reset_writer_state(self):
         self.model_field_names = []
         self.id_counter = 1
+        self.geometry_attr = None
+        self.coerce_dimensions = None
+        self.promote_to_multi = False
+        self.out_srid = None
+        self.wkb_attr = None
+        self.pipelined = False
+        self.sort_curve = None
+        self.coercer = GeometryCoercer()
+
+    def _get_export_queryset(self, queryset, geofield, dimensions=None):
+
+        """
+        Returns the queryset that will be exported. If a
+        target dimensionality is requested, the geometries
+        are coerced by the database when it supports it,
+        otherwise they are coerced while writing
+        """
+
+        self.geometry_attr = geofield.name
+
+        if dimensions is None:
+            return queryset
+
+        force_dimensions = get_force_dimension_function(queryset.db, dimensions)
+
+        if force_dimensions is None:
+            self.coerce_dimensions = dimensions
+            return queryset
+
+        self.geometry_attr = COERCED_GEOMETRY_ATTR
+        return queryset.annotate(**{COERCED_GEOMETRY_ATTR: force_dimensions(geofield.name)})
+
+    def _get_wkb_queryset(self, queryset, geofield, in_srid, out_srid):
+
+        """
+        Returns the queryset with the geometries fetched as
+        WKB, reprojected by the database, so that no GEOS
+        geometry is built while writing. Returns None if the
+        database can't do it
+        """
+
+        as_wkb = get_as_wkb_function(queryset.db)
+
+        if as_wkb is None:
+            return None
+
+        geometry = self.geometry_attr or geofield.name
+
+        if out_srid != in_srid:
+            transform = get_transform_function(queryset.db)
+
+            if transform is None:
+                return None
+
+            geometry = transform(geometry, out_srid)
+
+        self.wkb_attr = WKB_GEOMETRY_ATTR
+        return queryset.defer(geofield.name).annotate(**{WKB_GEOMETRY_ATTR: as_wkb(geometry)})
+
+    def _get_transformed_queryset(self, queryset, in_srid, out_srid):
+
+        """
+        Reprojects the geometries in the database when it
+        can, otherwise they are reprojected while writing
+        """
+
+        self.out_srid = None
+
+        if not out_srid or out_srid == in_srid:
+            return queryset
+
+        transform = get_transform_function(queryset.db)
+
+        if transform is None:
+            self.out_srid = out_srid
+            return queryset
+
+        queryset = queryset.annotate(**{TRANSFORMED_GEOMETRY_ATTR: transform(self.geometry_attr, out_srid)})
+        self.geometry_attr = TRANSFORMED_GEOMETRY_ATTR
+        return queryset
+
+    def _get_geometry(self, item):
+
+        """
+        Returns the geometry of the item, coerced to
+        the requested dimensions and promoted to its
+        Multi counterpart if needed
+        """
+
+        return self._coerce_geometry(getattr(item, self.geometry_attr))
+
+    def _coerce_geometry(self, geometry):
+
+        if geometry and self.coerce_dimensions:
+            geometry = self.coercer.coerce(geometry, dimensions=self.coerce_dimensions)
+
+        if geometry and self.promote_to_multi:
+            geometry = self.coercer.promote(geometry)
+
+        return geometry
+
+    def _get_wkb(self, geometry):
+
+        """
+        Returns the WKB of a geometry fetched without the
+        wkb queryset, reprojecting it if the database didn't
+        """
+
+        if not geometry:
+            return None
+
+        if self.out_srid:
+            geometry = geometry.transform(self.out_srid, clone=True)
+
+        return geometry.wkb
+
+    def _get_dimensions(self, geofield, dimensions=None):
+
+        if dimensions:
+            return dimensions
+
+        return getattr(geofield, "dim", 2)
+
+    def _get_geometry_type_name(self, geofield):
+
+        """
+        Returns the OGR name of the geometry type
+        of the layer
+        """
+
+        if hasattr(geofield, 'geom_type'):
+            geometry_type = OGRGeomType(geofield.geom_type).name
+        else:
+            geometry_type = OGRGeomType(geofield._geom).name
+
+        if self.promote_to_multi:
+            geometry_type = get_multi_geometry_type(geometry_type)
+
+        return geometry_type
+
+    def _get_shape_type(self, geofield, dimensions=None):
+
+        """
+        Returns the shape type of the layer, None
+        if the shapefile takes any type
+        """
+
+        shape_type = SHAPE_TYPES.get(self._get_geometry_type_name(geofield))
+
+        if shape_type and self._get_dimensions(geofield, dimensions) == 3:
+            shape_type += SHP_Z
+
+        return shape_type
 
     # override
-    def _get_geometry_type(self, geofield):
+    def _get_geometry_type(self, geofield, dimensions=None):
         raise NotImplemented
 
     # override
@@ -46,9 +269,210 @@ class BaseShapefileWriter(object):
         raise NotImplemented
 
     # override
-    def _create_layer(self, tmp_name, fieldmapping, geofield, output_srid, encodign="utf-8", layer_name=""):
+    def _create_layer(self, tmp_name, fieldmapping, geofield, output_srid, encodign="utf-8", layer_name="", dimensions=None):
         raise NotImplemented
 
+    def _get_format(self):
+        return get_format(self.driver_name)
+
+    def _map_fields(self, fields):
+
+        """
+        Maps the fields with the mapper of the engine, truncating
+        their names only if the output format needs it
+        """
+
+        field_mapper = FieldMapper.create(engine=self.engine)
+        return field_mapper.map_fields(fields, size=self._get_format().field_name_length,
+                                       choice_display=self.choice_display)
+
+    def _get_size_limit(self, max_size, num_fields, record_length):
+
+        """
+        Returns the size limit of the parts of the export, or
+        None if the format isn't split. max_size, when given,
+        replaces the limit of the format
+        """
+
+        format_max_size = self._get_format().max_size
+
+        if not format_max_size:
+            return None
+
+        return SizeLimit(max_size or format_max_size, 32 + 32 * num_fields + 1, record_length)
+
+    def _get_sorted_queryset(self, queryset, geofield, curve):
+
+        """
+        Orders the queryset along a space filling curve through
+        the centers of the bounding boxes of its geometries,
+        either a Hilbert curve or their geohashes. When the
+        database can't order it, the features are sorted
+        while they are fetched
+        """
+
+        if curve is True:
+            curve = DEFAULT_SORT_CURVE
+
+        if curve not in SORT_CURVES:
+            raise ValueError("Unknown spatial sort '%s', the curves available are: %s" % (
+                curve, ", ".join(SORT_CURVES)))
+
+        srid = geofield.srid if hasattr(geofield, "srid") else geofield._srid
+        order = get_spatial_order(queryset.db, geofield.name, curve, srid)
+
+        if order is None:
+            self.sort_curve = curve
+            return queryset
+
+        return queryset.order_by(order)
+
+    def _iter_queryset(self, queryset, geofield, values=None):
+
+        """
+        Iterates the items of the queryset, or the rows of its
+        `values`, in the order of the spatial sort the database
+        couldn't do. The sort keys are sorted apart, spilling to
+        disk, and the items are then fetched by primary key
+        """
+
+        if not self.sort_curve:
+            rows = queryset.values_list(*values) if values is not None else queryset
+            return rows.iterator()
+
+        keys = self._iter_sort_keys(queryset, geofield)
+        pks = (pk for key, pk in external_sort(keys, self.sort_chunk_size))
+
+        return self._iter_by_pk(queryset, pks, values)
+
+    def _iter_sort_keys(self, queryset, geofield):
+
+        """
+        Yields the sort key and the primary key of every item.
+        Items without geometry go first
+        """
+
+        geometries = queryset.values_list("pk", geofield.name).iterator()
+
+        if self.sort_curve == "geohash":
+            srid = geofield.srid if hasattr(geofield, "srid") else geofield._srid
+            transform = None
+
+            if srid != GEOHASH_SRID:
+                transform = CoordTransform(SpatialReference(srid), SpatialReference(GEOHASH_SRID))
+
+            for pk, geometry in geometries:
+                if geometry is None or geometry.empty:
+                    yield "", pk
+                    continue
+
+                center = Point(*get_center(geometry.extent), srid=srid)
+
+                if transform is not None:
+                    center.transform(transform)
+
+                yield geohash(center.x, center.y), pk
+
+            return
+
+        extent = self._get_extent(queryset, geofield)
+
+        for pk, geometry in geometries:
+            if geometry is None or geometry.empty:
+                yield -1, pk
+                continue
+
+            x, y = get_center(geometry.extent)
+            yield get_hilbert_key(x, y, extent), pk
+
+    def _get_extent(self, queryset, geofield):
+
+        """
+        Returns the extent of the geometries of the queryset,
+        computed by the database when it can
+        """
+
+        aggregate = get_extent_aggregate(queryset.db)
+
+        if aggregate is not None:
+            return queryset.order_by().aggregate(extent=aggregate(geofield.name))["extent"]
+
+        extent = None
+
+        for geometry in queryset.values_list(geofield.name, flat=True).iterator():
+            if geometry is None or geometry.empty:
+                continue
+
+            xmin, ymin, xmax, ymax = geometry.extent
+
+            if extent is None:
+                extent = (xmin, ymin, xmax, ymax)
+            else:
+                extent = (min(extent[0], xmin), min(extent[1], ymin), max(extent[2], xmax), max(extent[3], ymax))
+
+        return extent
+
+    def _iter_by_pk(self, queryset, pks, values=None):
+
+        """
+        Fetches the items, or the rows of `values`, in the
+        order of their primary keys, a batch at a time
+        """
+
+        rows = queryset.order_by()
+
+        if values is not None:
+            rows = rows.values_list("pk", *values)
+
+        pks = iter(pks)
+
+        while True:
+            batch = list(islice(pks, self.fetch_size))
+
+            if not batch:
+                return
+
+            fetched = rows.filter(pk__in=batch)
+
+            if values is not None:
+                items = dict((row[0], row[1:]) for row in fetched)
+            else:
+                items = dict((item.pk, item) for item in fetched)
+
+            for pk in batch:
+                if pk in items:
+                    yield items[pk]
+
+    def _create_spatial_indexes(self, paths):
+
+        """
+        Writes the .qix quadtree index of every written
+        shapefile, which MapServer, QGIS and GDAL read
+        instead of building their own. The other formats
+        are indexed by GDAL as they are written
+        """
+
+        if self.driver_name != "ESRI Shapefile":
+            return
+
+        Driver.ensure_registered()
+
+        for path in paths:
+            layer_name = os.path.splitext(os.path.basename(path))[0]
+            datasource = ogr_capi.open_ds(force_bytes(path), 1, None)
+
+            try:
+                result = ogr_write_capi.execute_sql(datasource,
+                                                    force_bytes('CREATE SPATIAL INDEX ON "%s"' % layer_name),
+                                                    None, None)
+                if result:
+                    ogr_write_capi.release_result_set(datasource, result)
+            finally:
+                ogr_capi.destroy_ds(datasource)
+
+            if not os.path.exists(os.path.splitext(path)[0] + ".qix"):
+                raise GDALException("Could not create the spatial index of %s." % path)
+
     def _get_fields_from_atributes(self, queryset, attributes):
 
         """
@@ -66,7 +490,12 @@ class BaseShapefileWriter(object):
                       tmp_name="output_shapefile",
                       out_srid=None,
                       choice_display=True,
-                      encoding="utf-8"):
+                      encoding="utf-8",
+                      dimensions=None,
+                      promote_to_multi=False,
+                      max_size=None,
+                      spatial_index=False,
+                      spatial_sort=False):
 
         if hasattr(geofield, "srid"):
             in_srid = SpatialReference(geofield.srid)
@@ -75,27 +504,73 @@ class BaseShapefileWriter(object):
 
         self._reset_writer_state()
 
+        if spatial_sort:
+            queryset = self._get_sorted_queryset(queryset, geofield, spatial_sort)
+
         self.model_field_names = [f.name for f in queryset.model._meta.get_fields()]
         self.choice_display = choice_display
-
-        features = []
+        self.promote_to_multi = promote_to_multi
+        out_srid = getattr(out_srid, "srid", out_srid) or in_srid.srid
+        queryset = self._get_export_queryset(queryset, geofield, dimensions)
+        queryset = self._get_transformed_queryset(queryset, in_srid.srid, out_srid)
 
         export_fields = self._get_fields_from_atributes(queryset, attributes)
 
-        field_mapper = FieldMapper.create(self.engine)
-        fieldmapping = field_mapper.map_fields(export_fields)
-        layer, datasource = self._create_layer(tmp_name, fieldmapping, geofield, out_srid, encoding)
+        fieldmapping = self._map_fields(export_fields)
+        layer, datasource = self._create_layer(tmp_name, fieldmapping, geofield, out_srid, encoding, dimensions=dimensions)
+        paths = [tmp_name]
+
+        try:
+            features = self._iter_features(self._iter_queryset(queryset, geofield), fieldmapping, geofield, layer,
+                                           in_srid, out_srid)
+            shape_type = self._get_shape_type(geofield, dimensions)
+            size_limit = self._get_size_limit(max_size, len(fieldmapping.field_maps), self._get_record_length(layer))
+            parts = split_parts(features, size_limit,
+                                lambda feature: estimate_shp_record_size(self._get_wkb_size(feature), shape_type))
+
+            for index, part in enumerate(parts):
+
+                if index:
+                    # the export goes on in the next part
+                    self._flush(layer, datasource)
+                    self._close(layer, datasource)
+                    layer = datasource = None
+
+                    paths.append(get_part_path(tmp_name, index))
+                    layer, datasource = self._create_layer(paths[-1], fieldmapping, geofield, out_srid, encoding,
+                                                           dimensions=dimensions)
+
+                self._write_part(part, layer)
 
-        self._write_records(queryset, fieldmapping, geofield, layer, in_srid, out_srid)
+            self._flush(layer, datasource)
+        finally:
+            self._close(layer, datasource)
 
-        self._flush(layer, datasource)
-        self._close(layer, datasource)
+        if spatial_index:
+            self._create_spatial_indexes(paths)
+
+        return paths
 
     # override
     def _write_records(self, queryset, fieldmapping, geofield, layer, in_srid, out_srid):
 
         raise NotImplemented
 
+    # override
+    def _write_part(self, features, layer):
+
+        raise NotImplemented
+
+    # override
+    def _get_record_length(self, layer):
+
+        raise NotImplemented
+
+    # override
+    def _get_wkb_size(self, feature):
+
+        raise NotImplemented
+
     # override
     def _flush(self, layer, datasource=None):
 
@@ -172,7 +647,7 @@ class BaseShapefileWriter(object):
 
         if self.choice_display:
 
-            return getattr(item, "get_%s_display" % field_name)
+            return getattr(item, "get_%s_display" % field_name)()
 
         else:
 
@@ -180,12 +655,25 @@ class BaseShapefileWriter(object):
 
     def _create_features(self, queryset, fieldmapping, geofield, layer, in_srid, out_srid):
 
-        features = []
+        return list(self._iter_features(queryset, fieldmapping, geofield, layer, in_srid, out_srid))
 
-        for item in queryset:
-            features.append(self._create_feature(item, fieldmapping, geofield, layer, in_srid, out_srid))
+    def _iter_features(self, queryset, fieldmapping, geofield, layer, in_srid, out_srid):
 
-        return features
+        """
+        Lazily creates the features of the queryset,
+        skipping the items without geometry. When pipelined,
+        the queryset is fetched and the features are created
+        in their own threads, while the caller writes them
+        """
+
+        def create_feature(item):
+            return self._create_feature(item, fieldmapping, geofield, layer, in_srid, out_srid)
+
+        if self.pipelined:
+            return Pipeline(queryset, [create_feature], self.queue_size)
+
+        features = (create_feature(item) for item in queryset)
+        return (feature for feature in features if feature is not None)
 
     # override
     def _create_feature(self, item, fieldmapping, geofield, layer, in_srid, out_srid):
@@ -194,11 +682,14 @@ class BaseShapefileWriter(object):
 
 class FionaShapefileWriter(BaseShapefileWriter):
 
-    def _get_geometry_type(self, geofield):
-        if hasattr(geofield, 'geom_type'):
-            geometry_type = OGRGeomType(geofield.geom_type).name
-        else:
-            geometry_type = OGRGeomType(geofield._geom).name
+    def _get_geometry_type(self, geofield, dimensions=None):
+        geometry_type = self._get_geometry_type_name(geofield)
+
+        return self._get_schema_geometry_type(geometry_type, self._get_dimensions(geofield, dimensions))
+
+    def _get_schema_geometry_type(self, geometry_type, dimensions):
+        if dimensions == 3:
+            geometry_type = "3D %s" % geometry_type
 
         return geometry_type
 
@@ -208,9 +699,9 @@ class FionaShapefileWriter(BaseShapefileWriter):
         else:
             out_srs = SpatialReference(in_srid)
 
-        return from_epsg(out_srs.srid)
+        return fiona_crs.from_epsg(out_srs.srid)
 
-    def _create_layer(self, tmp_name, fieldmapping, geofield, output_srid, encoding="utf-8", layer_name=""):
+    def _create_layer(self, tmp_name, fieldmapping, geofield, output_srid, encoding="utf-8", layer_name="", dimensions=None):
         if hasattr(geofield, 'srid'):
             in_srs = SpatialReference(geofield.srid)
         else:
@@ -221,10 +712,10 @@ class FionaShapefileWriter(BaseShapefileWriter):
         else:
             out_srs = in_srs
 
-        crs = from_epsg(out_srs.srid)
+        crs = fiona_crs.from_epsg(out_srs.srid)
 
         properties = fieldmapping.get_fiona_schema()
-        schema = {"geometry" : self._get_geometry_type(geofield),
+        schema = {"geometry" : self._get_geometry_type(geofield, dimensions),
                   "properties": properties}
 
         shapefile = fiona.open(tmp_name,
@@ -243,7 +734,7 @@ class FionaShapefileWriter(BaseShapefileWriter):
 
     def _get_geometry_value(self, item, geofield, in_srid, out_srid):
 
-        geometry = getattr(item, geofield.name)
+        geometry = self._get_geometry(item)
 
         if geometry:
 
@@ -293,7 +784,14 @@ class FionaShapefileWriter(BaseShapefileWriter):
                       tmp_name="output_shapefile",
                       out_srid=None,
                       choice_display=True,
-                      encoding="utf-8"):
+                      encoding="utf-8",
+                      dimensions=None,
+                      promote_to_multi=False,
+                      split_geometry_types=False,
+                      pipelined=False,
+                      max_size=None,
+                      spatial_index=False,
+                      spatial_sort=False):
 
         if hasattr(geofield, "srid"):
             in_srid = SpatialReference(geofield.srid)
@@ -302,12 +800,18 @@ class FionaShapefileWriter(BaseShapefileWriter):
 
         self._reset_writer_state()
 
+        if spatial_sort:
+            queryset = self._get_sorted_queryset(queryset, geofield, spatial_sort)
+
         self.model_field_names = [f.name for f in queryset.model._meta.get_fields()]
         self.choice_display = choice_display
+        self.promote_to_multi = promote_to_multi
+        # the reader thread wouldn't see the changes of a transaction
+        self.pipelined = pipelined and Pipeline.is_safe(queryset.db)
+        queryset = self._get_export_queryset(queryset, geofield, dimensions)
 
         export_fields = self._get_fields_from_atributes(queryset, attributes)
-        field_mapper = FieldMapper.create(engine=ENGINE_FIONA, mapping=None)
-        fieldmapping = field_mapper.map_fields(export_fields)
+        fieldmapping = self._map_fields(export_fields)
 
         if hasattr(geofield, 'srid'):
             in_srs = SpatialReference(geofield.srid)
@@ -319,58 +823,281 @@ class FionaShapefileWriter(BaseShapefileWriter):
         else:
             out_srs = in_srs
 
-        crs = from_epsg(out_srs.srid)
+        crs = fiona_crs.from_epsg(out_srs.srid)
 
         properties = fieldmapping.get_fiona_schema()
-        schema = {"geometry" : self._get_geometry_type(geofield),
+
+        if split_geometry_types:
+            features = self._iter_features(self._iter_queryset(queryset, geofield), fieldmapping, geofield, None,
+                                           in_srid, out_srid)
+            paths = self._write_split_records(features, tmp_name, crs, properties, encoding,
+                                              self._get_dimensions(geofield, dimensions))
+            if spatial_index:
+                self._create_spatial_indexes(paths)
+
+            return paths
+
+        schema = {"geometry" : self._get_geometry_type(geofield, dimensions),
                   "properties": properties}
-        datasource = None
+        layer = fiona.open(tmp_name, "w", driver=self.driver_name, crs=crs, schema=schema, encoding=encoding)
+        paths = [tmp_name]
 
-        with fiona.open(tmp_name,
-                        "w",
-                        driver=self.driver_name,
-                        crs=crs,
-                        schema=schema,
-                        encoding=encoding) as layer:
+        try:
+            features = self._iter_features(self._iter_queryset(queryset, geofield), fieldmapping, geofield, None,
+                                           in_srid, out_srid)
+            shape_type = self._get_shape_type(geofield, dimensions)
+            size_limit = self._get_size_limit(max_size, len(properties), self._get_record_length(layer))
+            parts = split_parts(features, size_limit,
+                                lambda feature: estimate_shp_record_size(get_wkb_size(feature["geometry"]), shape_type))
 
-            self._write_records(queryset, fieldmapping, geofield, layer, in_srid, out_srid)
+            for index, part in enumerate(parts):
 
-    def _write_records(self, queryset, fieldmapping, geofield, layer, in_srid, out_srid):
+                if index:
+                    # the export goes on in the next part
+                    layer.close()
+                    paths.append(get_part_path(tmp_name, index))
+                    layer = fiona.open(paths[-1], "w", driver=self.driver_name, crs=crs, schema=schema,
+                                       encoding=encoding)
 
-        features = self._create_features(queryset, fieldmapping, geofield, layer, in_srid, out_srid)
+                self._write_part(part, layer)
+        finally:
+            layer.close()
 
-        for feature in features:
+        if spatial_index:
+            self._create_spatial_indexes(paths)
 
-            layer.write(feature)
+        return paths
 
-class NativeShapefileWriter(BaseShapefileWriter):
+    def _write_part(self, features, layer):
 
-    def _get_geometry_type(self, geofield):
-        if hasattr(geofield, 'geom_type'):
-            ogr_type = OGRGeomType(geofield.geom_type).num
-        else:
-            ogr_type = OGRGeomType(geofield._geom).num
+        # writerecords batches the features in transactions
+        layer.writerecords(features)
+
+    def _get_record_length(self, layer):
+
+        """
+        Returns the length of the dbf records of the layer,
+        with the widths GDAL gives the fields without one
+        """
+
+        length = 1
+
+        for field_type in layer.schema["properties"].values():
+            field_type, _, width = field_type.partition(":")
+
+            if width:
+                length += min(int(float(width)), DBF_MAX_FIELD_WIDTH)
+            else:
+                length += FIONA_FIELD_WIDTHS.get(field_type, DBF_MAX_FIELD_WIDTH)
+
+        return length
+
+    def _write_split_records(self, features, tmp_name, crs, properties, encoding="utf-8", dimensions=2):
+
+        """
+        Writes the features in a single pass, opening one
+        layer for each geometry type found along the way.
+        Returns the paths of the written layers
+        """
+
+        base_name, extension = os.path.splitext(tmp_name)
+        layers = {}
+        paths = []
+
+        try:
+            for feature in features:
+
+                for record in self._split_record(feature):
+
+                    geometry_type = record["geometry"]["type"]
+
+                    if geometry_type not in layers:
+                        path = "%s_%s%s" % (base_name, geometry_type.lower(), extension)
+                        schema = {"geometry": self._get_schema_geometry_type(geometry_type, dimensions),
+                                  "properties": properties}
+                        layers[geometry_type] = fiona.open(path,
+                                                           "w",
+                                                           driver=self.driver_name,
+                                                           crs=crs,
+                                                           schema=schema,
+                                                           encoding=encoding)
+                        paths.append(path)
+
+                    layers[geometry_type].write(record)
+        finally:
+            for layer in layers.values():
+                layer.close()
+
+        return paths
+
+    def _split_record(self, record):
+
+        """
+        Explodes geometry collections into one record
+        per member geometry, sharing the same properties
+        """
+
+        geometry = record["geometry"]
+
+        if geometry["type"] != "GeometryCollection":
+            return [record]
+
+        records = []
+
+        for member in geometry["geometries"]:
+
+            if self.promote_to_multi and get_multi_geometry_type(member["type"]) != member["type"]:
+                member = {"type": get_multi_geometry_type(member["type"]),
+                          "coordinates": [member["coordinates"]]}
+
+            records.append({"geometry": member,
+                            "id": record["id"],
+                            "properties": record["properties"]})
+
+        return records
+
+class OGRShapefileWriter(BaseShapefileWriter):
+
+    """
+    The writers that create the OGR layer themselves. They
+    stream the queryset through a single feature object per
+    layer, filled for every item, and write it in batches of
+    transaction_size features, each in a layer transaction, or
+    in a single one when the output format asks for it
+    """
+
+    transaction_size = 10000
+
+    def _reset_writer_state(self):
+        super(OGRShapefileWriter, self)._reset_writer_state()
+        self.mapping = engines.get_mapping(self.engine)
+
+    def _get_geometry_type(self, geofield, dimensions=None):
+        ogr_type = OGRGeomType(self._get_geometry_type_name(geofield)).num
+
+        if self._get_dimensions(geofield, dimensions) == 3:
+            ogr_type += OGRGeomType.wkb25bit
 
         return ogr_type
 
-    def _get_geometry_value(self, item, geofield, in_srid, out_srid):
+    def _get_layer_options(self, encoding):
+        if self.driver_name == "ESRI Shapefile":
+            return ["ENCODING=%s" % codecs.lookup(encoding).name]
 
-        geometry = getattr(item, geofield.name)
+        return []
 
-        if geometry:
-            ogr_geom = ogr.CreateGeometryFromWkt(geometry.wkt)
-            if out_srid and out_srid != in_srid:
-                ct = osr.CoordinateTransformation(in_srid, out_srid)
-                ogr_geom.Transform(ct)
+    def _get_ogr_value(self, value, field_map):
 
-            return ogr_geom
-        else:
+        """
+        Converts a field value to the type of its OGR field.
+        Dates and times are written as their ISO text, and
+        so are displayed choices
+        """
+
+        if value is None:
             return None
 
+        if self.choice_display and field_map.field_in.choices:
+            return force_text(value)
+
+        ogr_type = self.mapping[type(field_map.field_in)]
+
+        if ogr_type in ("OFTInteger", "OFTInteger64"):
+            return int(value)
+
+        if ogr_type == "OFTReal":
+            return float(value)
+
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+
+        return force_text(value)
+
+    def _create_feature(self, item, fieldmapping, geofield, layer, in_srid, out_srid):
+
+        """
+        Returns the OGR geometry and field values of the
+        item, written to the feature of the layer later
+        """
+
+        ogr_geom = self._get_geometry_value(item, geofield, in_srid, out_srid)
+
+        if ogr_geom is None:
+            return None
+
+        values = [self._get_ogr_value(self._get_field_value(item, fm), fm) for fm in fieldmapping.field_maps]
+        return ogr_geom, values
+
+    def _write_part(self, features, layer):
+
+        transaction_size = None if self._get_format().single_transaction else self.transaction_size
+        feature = self._create_feature_object(layer)
+        count = 0
+
+        try:
+            self._start_transaction(layer)
+
+            try:
+                for ogr_geom, values in features:
+                    self._fill_feature(feature, ogr_geom, values)
+                    self._write_feature(layer, feature)
+                    count += 1
+
+                    if transaction_size and count % transaction_size == 0:
+                        self._commit_transaction(layer)
+                        self._start_transaction(layer)
+            except Exception:
+                self._rollback_transaction(layer)
+                raise
+
+            self._commit_transaction(layer)
+        finally:
+            self._destroy_feature_object(feature)
+
+    # override
+    def _create_feature_object(self, layer):
+        raise NotImplemented
+
+    # override
+    def _destroy_feature_object(self, feature):
+        raise NotImplemented
+
+    # override
+    def _fill_feature(self, feature, ogr_geom, values):
+        raise NotImplemented
+
+    # override
+    def _write_feature(self, layer, feature):
+        raise NotImplemented
+
+    # override
+    def _start_transaction(self, layer):
+        raise NotImplemented
+
+    # override
+    def _commit_transaction(self, layer):
+        raise NotImplemented
+
+    # override
+    def _rollback_transaction(self, layer):
+        raise NotImplemented
+
+
+class NativeShapefileWriter(OGRShapefileWriter):
+
+    def _get_geometry_value(self, item, geofield, in_srid, out_srid):
+
+        wkb = self._get_wkb(self._get_geometry(item))
+
+        if wkb is None:
+            return None
+
+        return ogr.CreateGeometryFromWkb(bytes(wkb))
+
     def _get_output_srs(self, in_srid, out_srid):
         pass
 
-    def _create_layer(self, tmp_name, fieldmapping, geofield, output_srid, encodign="utf-8", layer_name=""):
+    def _create_layer(self, tmp_name, fieldmapping, geofield, output_srid, encodign="utf-8", layer_name="", dimensions=None):
 
         driver = ogr.GetDriverByName(self.driver_name)
         datasource = driver.CreateDataSource(tmp_name)
@@ -378,29 +1105,43 @@ class NativeShapefileWriter(BaseShapefileWriter):
             raise Exception("Could not create shapefile.")
 
         srs = osr.SpatialReference()
-        srs = srs.ImportFromEPSG(output_srid)
-        geometry_type = self._get_geometry_type(geofield)
+        check_err(srs.ImportFromEPSG(output_srid))
+        geometry_type = self._get_geometry_type(geofield, dimensions)
+
+        layer = datasource.CreateLayer(layer_name or "lyr", srs=srs, geom_type=geometry_type,
+                                       options=self._get_layer_options(encodign))
+
+        for fm in fieldmapping.field_maps:
+            check_err(layer.CreateField(fm.field_out))
 
-        layer = datasource.CreateLayer("lyr", srs=srs, geom_type=geometry_type)
         return layer, datasource
 
-    def write_records(self,
-                      queryset,
-                      attributes,
-                      geofield,
-                      tmp_name="output_shapefile",
-                      out_srid=None,
-                      choice_display=True,
-                      encoding="utf-8"):
+    def _create_feature_object(self, layer):
+        return ogr.Feature(layer.GetLayerDefn())
+
+    def _get_record_length(self, layer):
+        definition = layer.GetLayerDefn()
+        return 1 + sum(definition.GetFieldDefn(i).GetWidth() for i in range(definition.GetFieldCount()))
+
+    def _get_wkb_size(self, feature):
+        ogr_geom, values = feature
+        return ogr_geom.WkbSize()
+
+    def _destroy_feature_object(self, feature):
+        # released by the bindings
         pass
 
-    def _write_records(self, queryset, fieldmapping, geofield, layer, in_srid, out_srid):
+    def _write_feature(self, layer, feature):
+        check_err(layer.CreateFeature(feature))
 
-        features = self._create_features(queryset, fieldmapping, geofield, layer, in_srid, out_srid)
+    def _start_transaction(self, layer):
+        check_err(layer.StartTransaction())
 
-        for feature in features:
+    def _commit_transaction(self, layer):
+        check_err(layer.CommitTransaction())
 
-            check_err(layer.CreateFeature(feature))
+    def _rollback_transaction(self, layer):
+        layer.RollbackTransaction()
 
     def _flush(self, layer, datasource=None):
         if layer is None:
@@ -409,62 +1150,56 @@ class NativeShapefileWriter(BaseShapefileWriter):
         if datasource is None:
             raise AttributeError("datasource cannot be null while saving data.")
 
-        datasource.Destroy()
+        check_err(layer.SyncToDisk())
 
     def _close(self, layer, datasource=None):
-        pass
-
-    def _create_feature(self, item, fieldmapping, geofield, layer, in_srid, out_srid):
+        if datasource is not None:
+            datasource.Destroy()
 
-        ogr_geom = self._get_geometry_value(item, geofield, in_srid, out_srid)
+    def _fill_feature(self, feature, ogr_geom, values):
 
-        if ogr_geom is None:
-            return
+        feature.SetFID(ogr_write_capi.NULL_FID)
 
-        feature_definition = layer.GetLayerDefn()
-        feature = ogr.Feature(feature_definition)
+        for i, value in enumerate(values):
 
-        for fm in fieldmapping.field_maps:
-
-            value = self._get_field_value(item, fm)
-            feature.SetField(fm.field_out.GetName(), value)
+            if value is None:
+                feature.UnsetField(i)
+            else:
+                feature.SetField(i, value)
 
         check_err(feature.SetGeometry(ogr_geom))
 
-        return feature
 
-class CtypesShapefileWriter(BaseShapefileWriter):
+class CtypesShapefileWriter(OGRShapefileWriter):
 
-    def _get_geometry_type(self, geofield):
-        if hasattr(geofield, 'geom_type'):
-            ogr_type = OGRGeomType(geofield.geom_type).num
-        else:
-            ogr_type = OGRGeomType(geofield._geom).num
+    field_definitions = []
 
-        return ogr_type
+    def write_records(self, *args, **kwargs):
 
+        try:
+            return super(CtypesShapefileWriter, self).write_records(*args, **kwargs)
+        finally:
+            # the layer of every part copies them
+            for field_definition in self.field_definitions:
+                ogr_write_capi.destroy_field_defn(field_definition)
+
+            self.field_definitions = []
 
     def _get_geometry_value(self, item, geofield, in_srid, out_srid):
-        geometry = getattr(item, geofield.name)
 
-        if geometry:
-            ogr_geom = OGRGeometry(geometry.wkt, out_srid)
-            if out_srid and out_srid != in_srid:
-                ct = CoordTransform(in_srid, out_srid)
-                ogr_geom.transform(ct)
+        wkb = self._get_wkb(self._get_geometry(item))
 
-            return ogr_geom
-        else:
+        if wkb is None:
             return None
 
+        return OGRGeometry(six.memoryview(bytes(wkb)))
+
     def _get_output_srs(self, in_srid, out_srid):
         pass
 
-    def _create_layer(self, tmp_name, fieldmapping, geofield, output_srid, encodign="utf-8", layer_name=""):
-        driver = ogr.GetDriverByName(self.driver_name)
-        datasource = lgdal.OGR_Dr_CreateDataSource(driver._ptr, tmp_name, None)
-        if datasource is None:
-            raise Exception("Could not create shapefile.")
+    def _create_layer(self, tmp_name, fieldmapping, geofield, output_srid, encodign="utf-8", layer_name="", dimensions=None):
+        driver = Driver(self.driver_name)
+        datasource = ogr_write_capi.create_ds(driver.ptr, force_bytes(tmp_name), None)
 
         if hasattr(geofield, 'srid'):
             native_srs = SpatialReference(geofield.srid)
@@ -476,21 +1211,51 @@ class CtypesShapefileWriter(BaseShapefileWriter):
         else:
             output_srs = native_srs
 
-        geometry_type = self._get_geometry_type(geofield)
-        layer = lgdal.OGR_DS_CreateLayer(datasource,
-                                         "lyr",
-                                         output_srs,
-                                         geometry_type,
-                                         None)
+        geometry_type = self._get_geometry_type(geofield, dimensions)
+        layer = ogr_write_capi.create_layer(datasource,
+                                            force_bytes(layer_name or "lyr"),
+                                            output_srs.ptr,
+                                            geometry_type,
+                                            ogr_write_capi.string_list(self._get_layer_options(encodign)))
+
+        # the layer copies the field definitions, which
+        # are destroyed once the export is written
+        for fm in fieldmapping.field_maps:
+            ogr_write_capi.create_field(layer, fm.field_out, 1)
+
+        self.field_definitions = [fm.field_out for fm in fieldmapping.field_maps]
+
         return layer, datasource
 
-    def _write_records(self, queryset, fieldmapping, geofield, layer, in_srid, out_srid):
+    def _create_feature_object(self, layer):
+        return ogr_write_capi.create_feature_object(ogr_capi.get_layer_defn(layer))
+
+    def _get_record_length(self, layer):
+        definition = ogr_capi.get_layer_defn(layer)
+        return 1 + sum(ogr_capi.get_field_width(ogr_capi.get_field_defn(definition, i))
+                       for i in range(ogr_capi.get_field_count(definition)))
+
+    def _get_wkb_size(self, feature):
+        ogr_geom, values = feature
+        return ogr_geom.wkb_size
+
+    def _destroy_feature_object(self, feature):
+        ogr_capi.destroy_feature(feature)
 
-        features = self._create_features(queryset, fieldmapping, geofield, layer, in_srid, out_srid)
+    def _write_feature(self, layer, feature):
+        ogr_write_capi.create_feature(layer, feature)
 
-        for feature in features:
-            check_err(lgdal.OGR_L_SetFeature(layer, feature))
+    def _start_transaction(self, layer):
+        ogr_write_capi.start_transaction(layer)
 
+    def _commit_transaction(self, layer):
+        ogr_write_capi.commit_transaction(layer)
+
+    def _rollback_transaction(self, layer):
+        try:
+            ogr_write_capi.rollback_transaction(layer)
+        except GDALException:
+            pass
 
     def _flush(self, layer, datasource=None):
         if layer is None:
@@ -499,28 +1264,424 @@ class CtypesShapefileWriter(BaseShapefileWriter):
         if datasource is None:
             raise AttributeError("datasource cannot be null while saving data.")
 
-        check_err(lgdal.OGR_L_SyncToDisk(layer))
-        lgdal.OGR_DS_Destroy(datasource)
-        lgdal.OGRCleanupAll()
+        ogr_write_capi.sync_to_disk(layer)
 
     def _close(self, layer, datasource=None):
-        pass
+        if datasource is not None:
+            ogr_capi.destroy_ds(datasource)
+
+    def _fill_feature(self, feature, ogr_geom, values):
+
+        ogr_write_capi.set_fid(feature, ogr_write_capi.NULL_FID)
+
+        for i, value in enumerate(values):
+
+            if value is None:
+                ogr_write_capi.unset_field(feature, i)
+            elif isinstance(value, six.integer_types):
+                # 32 bit fields take it too, clamped with a warning
+                # by OGR instead of silently wrapped by ctypes
+                ogr_write_capi.set_field_integer64(feature, i, value)
+            elif isinstance(value, float):
+                ogr_write_capi.set_field_double(feature, i, value)
+            else:
+                ogr_write_capi.set_field_string(feature, i, force_bytes(value))
+
+        ogr_write_capi.set_geometry(feature, ogr_geom.ptr)
+
+
+class DirectShapefileWriter(BaseShapefileWriter):
+
+    """
+    Writes the shapefile itself, packing the WKB of the
+    geometries and the fixed width dbf records as the
+    queryset is iterated. GDAL is only used for the .prj.
+    Also writes GeoJSON text sequences, one feature per line
+    """
+
+    def _get_shape_type(self, geofield, dimensions=None):
+        shape_type = super(DirectShapefileWriter, self)._get_shape_type(geofield, dimensions)
+
+        if shape_type is None:
+            raise AttributeError("Geometry type %s not supported with the direct engine."
+                                 % self._get_geometry_type_name(geofield))
+
+        return shape_type
+
+    def _get_geometry_value(self, item, geofield, in_srid, out_srid):
+
+        if self.wkb_attr:
+            return getattr(item, self.wkb_attr)
+
+        return self._get_wkb(self._get_geometry(item))
+
+    def _write_prj(self, tmp_name, srid):
+        srs = SpatialReference(srid)
+        srs.to_esri()
+
+        with open(tmp_name + ".prj", "w") as prj:
+            prj.write(srs.wkt)
+
+    def _write_cpg(self, tmp_name, encoding):
+        with open(tmp_name + ".cpg", "w") as cpg:
+            cpg.write(get_code_page(encoding))
+
+    def _prepare_export(self, queryset, attributes, geofield, out_srid=None, choice_display=True,
+                        dimensions=None, promote_to_multi=False, pipelined=False, spatial_sort=False):
+
+        """
+        Resets the writer for an export and returns its
+        queryset, field mapping and input and output srids
+        """
+
+        in_srid = geofield.srid if hasattr(geofield, "srid") else geofield._srid
+        out_srid = getattr(out_srid, "srid", out_srid)
+
+        if not out_srid:
+            out_srid = GEOJSON_SRID if self.driver_name == "GeoJSONSeq" else in_srid
+
+        self._reset_writer_state()
+
+        if spatial_sort:
+            queryset = self._get_sorted_queryset(queryset, geofield, spatial_sort)
+
+        self.model_field_names = [f.name for f in queryset.model._meta.get_fields()]
+        self.choice_display = choice_display
+        self.promote_to_multi = promote_to_multi
+        # the reader thread wouldn't see the changes of a transaction
+        self.pipelined = pipelined and Pipeline.is_safe(queryset.db)
+
+        # the shp writer drops or zero fills the Z and writes
+        # single geometries into multi layers by itself
+        if self.driver_name == "GeoJSONSeq":
+            queryset = self._get_export_queryset(queryset, geofield, dimensions)
+
+        wkb_queryset = self._get_wkb_queryset(queryset, geofield, in_srid, out_srid)
+
+        if wkb_queryset is not None:
+            queryset = wkb_queryset
+        else:
+            queryset = self._get_export_queryset(queryset, geofield, dimensions)
+            queryset = self._get_transformed_queryset(queryset, in_srid, out_srid)
+
+        export_fields = self._get_fields_from_atributes(queryset, attributes)
+        fieldmapping = self._map_fields(export_fields)
+
+        return queryset, fieldmapping, in_srid, out_srid
+
+    def iter_records(self,
+                     queryset,
+                     attributes,
+                     geofield,
+                     out_srid=None,
+                     choice_display=True,
+                     dimensions=None,
+                     promote_to_multi=False,
+                     pipelined=False,
+                     spatial_sort=False):
+
+        """
+        Yields the features of the queryset as the lines of a
+        GeoJSON text sequence, as they are created, so that
+        they can be streamed to a response
+        """
+
+        if self.driver_name != "GeoJSONSeq":
+            raise AttributeError("Only GeoJSONSeq exports can be iterated.")
+
+        queryset, fieldmapping, in_srid, out_srid = self._prepare_export(
+            queryset, attributes, geofield, out_srid, choice_display, dimensions, promote_to_multi, pipelined,
+            spatial_sort)
+
+        return self._iter_features(self._iter_queryset(queryset, geofield), fieldmapping, geofield, None,
+                                   in_srid, out_srid)
+
+    def write_records(self,
+                      queryset,
+                      attributes,
+                      geofield,
+                      tmp_name="output_shapefile",
+                      out_srid=None,
+                      choice_display=True,
+                      encoding="utf-8",
+                      dimensions=None,
+                      promote_to_multi=False,
+                      pipelined=False,
+                      max_size=None,
+                      spatial_index=False,
+                      spatial_sort=False):
+
+        if self.driver_name == "GeoJSONSeq":
+            with open(tmp_name, "wb") as output:
+                for line in self.iter_records(queryset, attributes, geofield, out_srid, choice_display,
+                                              dimensions, promote_to_multi, pipelined, spatial_sort):
+                    output.write(line)
+
+            return [tmp_name]
+
+        queryset, fieldmapping, in_srid, out_srid = self._prepare_export(
+            queryset, attributes, geofield, out_srid, choice_display, dimensions, promote_to_multi, pipelined,
+            spatial_sort)
+
+        base_name = os.path.splitext(tmp_name)[0]
+        shape_type = self._get_shape_type(geofield, dimensions)
+        files = self._open_part(base_name)
+        paths = [base_name + ".shp"]
+
+        try:
+            shp_writer = ShpWriter(files[0], files[1], shape_type)
+            dbf_writer = DbfWriter(files[2], fieldmapping.get_direct_schema(), encoding)
+            layer = (shp_writer, dbf_writer)
+
+            records = self._iter_features(self._iter_queryset(queryset, geofield), fieldmapping, geofield, layer,
+                                          in_srid, out_srid)
+            size_limit = self._get_size_limit(max_size, len(dbf_writer.fields), dbf_writer.record_length)
+            parts = split_parts(records, size_limit, lambda record: 8 + len(record[0]))
+
+            for index, part in enumerate(parts):
+
+                if index:
+                    # the same writers go on in the files of the next part
+                    self._close_part(files, layer, os.path.splitext(paths[-1])[0], out_srid, encoding)
+
+                    paths.append(get_part_path(base_name, index) + ".shp")
+                    files = self._open_part(os.path.splitext(paths[-1])[0])
+                    shp_writer.start(files[0], files[1])
+                    dbf_writer.start(files[2])
+
+                self._write_part(part, layer)
+
+            self._close_part(files, layer, os.path.splitext(paths[-1])[0], out_srid, encoding)
+        finally:
+            for part_file in files:
+                part_file.close()
+
+        if spatial_index:
+            self._create_spatial_indexes(paths)
+
+        return paths
+
+    def _open_part(self, base_name):
+
+        """
+        Returns the .shp, .shx and .dbf files of a part
+        """
+
+        files = []
+
+        try:
+            for extension in (".shp", ".shx", ".dbf"):
+                files.append(open(base_name + extension, "wb"))
+        except Exception:
+            for part_file in files:
+                part_file.close()
+            raise
+
+        return files
+
+    def _close_part(self, files, layer, base_name, out_srid, encoding):
+
+        for writer in layer:
+            writer.close()
+
+        for part_file in files:
+            part_file.close()
+
+        self._write_prj(base_name, out_srid)
+        self._write_cpg(base_name, encoding)
+
+    def _write_part(self, records, layer):
+
+        shp_writer, dbf_writer = layer
+
+        for content, record in records:
+            shp_writer.write_content(content)
+            dbf_writer.write_record(record)
 
     def _create_feature(self, item, fieldmapping, geofield, layer, in_srid, out_srid):
 
-        ogr_geom = self._get_geometry_value(item, geofield, in_srid, out_srid)
+        """
+        Returns the packed shp and dbf records of the item,
+        or its line when writing a GeoJSON text sequence
+        """
 
-        if ogr_geom is None:
-            return
+        wkb = self._get_geometry_value(item, geofield, in_srid, out_srid)
 
-        feature_definition = lgdal.OGR_L_GetLayerDefn(layer)
-        feature = lgdal.OGR_F_Create(feature_definition)
+        if wkb is None:
+            # skip
+            return None
 
-        for i, fm in enumerate(fieldmapping.field_maps):
+        values = [self._get_field_value(item, fm) for fm in fieldmapping.field_maps]
 
-            value = self._get_field_value(item, fm)
-            lgdal.OGR_F_SetField(feature, i, value)
+        if self.driver_name == "GeoJSONSeq":
+            feature = {"type": "Feature",
+                       "id": self._get_item_id(item),
+                       "geometry": wkb_to_geojson(wkb),
+                       "properties": dict(zip(fieldmapping.get_field_out_names(), values))}
+            # RS prefixed, as GDAL writes the .geojsons of RFC 8142
+            return b"\x1e" + json.dumps(feature, cls=DjangoJSONEncoder, separators=(",", ":")).encode("utf-8") + b"\n"
+
+        shp_writer, dbf_writer = layer
+        return shp_writer.pack(wkb), dbf_writer.pack(values)
+
+
+class PyogrioShapefileWriter(BaseShapefileWriter):
+
+    """
+    Writes the queryset in chunks of columns. The attributes
+    are fetched with values_list into NumPy arrays and the
+    geometries as WKB, and each chunk is handed to GDAL in
+    a single call through pyogrio
+    """
+
+    chunk_size = 10000
+    using = None
+
+    def _get_geometry_type(self, geofield, dimensions=None):
+        geometry_type = self._get_geometry_type_name(geofield)
+
+        if self._get_dimensions(geofield, dimensions) == 3:
+            geometry_type = "%s Z" % geometry_type
+
+        return geometry_type
+
+    def _get_related_values(self, field, values):
+
+        """
+        Returns the text of the related objects of a chunk,
+        fetched in a single query
+        """
+
+        target_field = field.target_field
+        keys = set(value for value in values if value is not None)
+        related = field.related_model._default_manager.using(self.using).filter(
+            **{"%s__in" % target_field.name: keys})
+        related = dict((getattr(obj, target_field.attname), force_text(obj)) for obj in related)
+
+        return [related.get(value) for value in values]
+
+    def _get_column(self, field_map, values):
+
+        """
+        Returns the array and the null mask of a column,
+        converting its values as _get_field_value does
+        """
+
+        field_in = field_map.field_in
+        dtype = field_map.field_out[1]
+        internal_type = field_in.get_internal_type()
+
+        if field_in.choices and self.choice_display:
+            choices = dict(field_in.flatchoices)
+            values = [force_text(choices.get(value, value), strings_only=True) for value in values]
+
+        elif internal_type in ("ForeignKey", "OneToOneField"):
+            values = self._get_related_values(field_in, values)
+
+        if dtype == "object":
+            values = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+            return numpy.array([None if value is None else force_text(value) for value in values],
+                               dtype=object), None
+
+        mask = numpy.array([value is None for value in values], dtype=bool)
+
+        if not mask.any():
+            return numpy.array(values, dtype=dtype), None
+
+        return numpy.array([0 if value is None else value for value in values], dtype=dtype), mask
+
+    def _write_chunk(self, tmp_name, rows, fieldmapping, write_options, append=False):
+
+        if rows:
+            columns = list(zip(*rows))
+        else:
+            columns = [()] * (len(fieldmapping.field_maps) + 1)
+
+        geometries = columns[-1]
+
+        if not self.wkb_attr:
+            geometries = [self._get_wkb(self._coerce_geometry(geometry)) for geometry in geometries]
+
+        field_data = []
+        field_mask = []
+
+        for field_map, values in zip(fieldmapping.field_maps, columns):
+            data, mask = self._get_column(field_map, values)
+            field_data.append(data)
+            field_mask.append(mask)
+
+        pyogrio_raw.write(tmp_name,
+                          numpy.array([bytes(wkb) for wkb in geometries], dtype=object),
+                          field_data,
+                          [name for name, dtype in fieldmapping.get_pyogrio_schema()],
+                          field_mask=field_mask if any(mask is not None for mask in field_mask) else None,
+                          append=append,
+                          **write_options)
+
+    def write_records(self,
+                      queryset,
+                      attributes,
+                      geofield,
+                      tmp_name="output_shapefile",
+                      out_srid=None,
+                      choice_display=True,
+                      encoding="utf-8",
+                      dimensions=None,
+                      promote_to_multi=False,
+                      spatial_index=False,
+                      spatial_sort=False):
+
+        in_srid = geofield.srid if hasattr(geofield, "srid") else geofield._srid
+        out_srid = getattr(out_srid, "srid", out_srid) or in_srid
+
+        self._reset_writer_state()
+
+        if spatial_sort:
+            queryset = self._get_sorted_queryset(queryset, geofield, spatial_sort)
+
+        self.model_field_names = [f.name for f in queryset.model._meta.get_fields()]
+        self.choice_display = choice_display
+        self.promote_to_multi = promote_to_multi
+        self.using = queryset.db
+
+        queryset = self._get_export_queryset(queryset, geofield, dimensions)
+        wkb_queryset = self._get_wkb_queryset(queryset, geofield, in_srid, out_srid)
+
+        if wkb_queryset is not None:
+            queryset = wkb_queryset
+            geometry_column = self.wkb_attr
+        else:
+            queryset = self._get_transformed_queryset(queryset, in_srid, out_srid)
+            geometry_column = self.geometry_attr
+
+        export_fields = self._get_fields_from_atributes(queryset, attributes)
+        fieldmapping = self._map_fields(export_fields)
+
+        write_options = {"driver": self.driver_name,
+                         "geometry_type": self._get_geometry_type(geofield, dimensions),
+                         "crs": "EPSG:%s" % out_srid,
+                         "encoding": encoding,
+                         "promote_to_multi": promote_to_multi}
+
+        names = [fm.field_in.name for fm in fieldmapping.field_maps] + [geometry_column]
+        rows = self._iter_queryset(queryset, geofield, names)
+        append = False
+
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            # features without geometry are skipped
+            features = [row for row in chunk if row[-1]]
+
+            # the first chunk creates the layer, even if empty
+            if features or not append:
+                self._write_chunk(tmp_name, features, fieldmapping, write_options, append)
+                append = True
+
+            if len(chunk) < self.chunk_size:
+                break
+
+        if spatial_index:
+            self._create_spatial_indexes([tmp_name])
 
-        check_err(lgdal.OGR_F_SetGeometry(feature, ogr_geom._ptr))
+        return [tmp_name]
 
-        return feature
@@ -1,7 +1,15 @@
 # coding: utf-8
 from collections import Counter
+from django.contrib.gis.gdal import field as ogr_fields
 from django.contrib.gis.gdal.field import ROGRFieldTypes
+from django.contrib.gis.gdal.prototypes import ds as ogr_capi
+from django.utils.encoding import force_bytes, force_text
 from . import *
+from . import prototypes as ogr_write_capi
+from .direct import DbfField
+from .registry import lazy_import
+
+ogr = lazy_import("osgeo.ogr")
 
 
 class FieldMap(object):
@@ -49,9 +57,18 @@ class FieldMapping(object):
         Returns a list with all outgoing field names
         """
 
-        if self.engine == ENGINE_FIONA:
+        if self.engine in (ENGINE_FIONA, ENGINE_PYOGRIO):
             return self._get_field_out_names_fiona(self.field_maps)
 
+        if self.engine == ENGINE_NATIVE:
+            return self._get_field_out_names_native(self.field_maps)
+
+        if self.engine == ENGINE_CTYPES:
+            return self._get_field_out_names_ctypes(self.field_maps)
+
+        if self.engine == ENGINE_DIRECT:
+            return self._get_field_out_names_direct(self.field_maps)
+
     def get_fiona_schema(self):
 
         """
@@ -94,6 +111,28 @@ class FieldMapping(object):
         else:
             return [fm.field_out for fm in self.field_maps]
 
+    def get_pyogrio_schema(self):
+
+        """
+        Generates the (name, dtype) of the pyogrio columns
+        """
+
+        if self.engine != ENGINE_PYOGRIO:
+            return None
+        else:
+            return [fm.field_out for fm in self.field_maps]
+
+    def get_direct_schema(self):
+
+        """
+        Generates the dbf fields of the direct engine
+        """
+
+        if self.engine != ENGINE_DIRECT:
+            return None
+        else:
+            return [fm.field_out for fm in self.field_maps]
+
 
     def _get_field_out_names_fiona(self, field_maps):
 
@@ -109,6 +148,14 @@ class FieldMapping(object):
         Returns a list of field map names for ctypes engine
         """
 
+        return [ogr_capi.get_field_name(fm.field_out) for fm in field_maps]
+
+    def _get_field_out_names_direct(self, field_maps):
+
+        """
+        Returns a list of field map names for direct engine
+        """
+
         return [fm.field_out.name for fm in field_maps]
 
     def _get_field_out_names_native(self, field_maps):
@@ -123,19 +170,21 @@ class FieldMapping(object):
 class BaseFieldMapper(object):
 
     engine = None
+    field_name_length = DEFAULT_FIELD_NAME_LENGTH
+    choice_display = False
 
     def __init__(self, engine=None, mapping=None):
 
         if engine is None:
             raise AttributeError
 
-        if engine not in ENGINES:
+        if engine not in engines:
             raise AttributeError("Engine is not supported.")
 
         self.engine = engine
 
         if mapping is None:
-            mapping = ENGINE_MAPPINGS[engine]
+            mapping = engines.get_mapping(engine)
 
         self.mapping = mapping
 
@@ -159,19 +208,22 @@ class BaseFieldMapper(object):
                     new_name = "%s_%d" % (new_name[:size-2], c)
 
                 new_fields.append(new_name)
-                if fm.engine == ENGINE_FIONA:
-                    fm.field_out = (new_name, fm.field_out[1], )
-
-                if fm.engine == ENGINE_NATIVE:
-                    fm.field_out.SetName(new_name)
+                self.rename_field(fm, new_name)
 
-                if fm.engine == ENGINE_CTYPES:
-                    lgdal.OGR_Fld_SetName(fm.field_out, new_name)
+    # override
+    def rename_field(self, field_map, name):
+        raise NotImplemented
 
-    def map_fields(self, fields=[], size=DEFAULT_FIELD_NAME_LENGTH):
+    def map_fields(self, fields=[], size=DEFAULT_FIELD_NAME_LENGTH, choice_display=False):
         """
+        Maps the fields, with their names truncated to size.
+        Formats without a name limit pass None, which keeps
+        the names, and so their conflicts, as they are. With
+        choice_display, fields with choices hold their labels
         """
 
+        self.field_name_length = size
+        self.choice_display = choice_display
         field_maps = []
 
         for fld in fields:
@@ -179,13 +231,44 @@ class BaseFieldMapper(object):
             fm = self.map_field(fld)
             field_maps.append(fm)
 
-        self.resolve_field_conflicts(field_maps, size=size)
+        if size:
+            self.resolve_field_conflicts(field_maps, size=size)
 
         return FieldMapping(field_maps)
 
+    def get_field_name(self, field):
+        if self.field_name_length:
+            return field.name[:self.field_name_length]
+
+        return field.name
+
     def map_field(self, field):
         return self._map_field(field)
 
+    def get_field_type(self, field):
+
+        """
+        Type of the field to look up in the mapping. Displayed
+        choices are text, whatever the type of their values
+        """
+
+        if self.choice_display and field.choices:
+            return CharField
+
+        return type(field)
+
+    def get_max_length(self, field):
+
+        """
+        Length of the text fields, the longest label for
+        displayed choices
+        """
+
+        if self.choice_display and field.choices:
+            return max(len(force_text(label)) for value, label in field.flatchoices) or 1
+
+        return getattr(field, "max_length", None)
+
     def _map_field(self, field):
 
         raise NotImplemented
@@ -198,64 +281,94 @@ class FieldMapper(object):
 
     @staticmethod
     def create(engine, mapping=None):
-        if engine == ENGINE_FIONA:
-            return FionaFieldMapper(engine, mapping)
-
-        if engine == ENGINE_NATIVE:
-            return NativeFieldMapper(engine, mapping)
-
-        if engine == ENGINE_CTYPES:
-            return CtypesFieldMapper(engine, mapping)
+        return engines.get_mapper_class(engine)(engine, mapping)
 
 class FionaFieldMapper(BaseFieldMapper):
 
     def _map_field(self, field):
 
-        field_type = type(field)
-        if field_type not in ENGINE_FIONA_MAPPING:
+        field_type = self.get_field_type(field)
+        if field_type not in self.mapping:
             raise AttributeError("Mapping not supported with Fiona.")
 
-        fiona_type = ENGINE_FIONA_MAPPING[field_type]
+        fiona_type = self.mapping[field_type]
         if fiona_type == "str":
-            try:
-                max_length = field.max_length or 255
-            except:
-                max_length = 255
+            fiona_type += ":%s" % (self.get_max_length(field) or 255)
 
-            fiona_type += ":%s" % max_length
+        return FieldMap(self.engine, field, (self.get_field_name(field), fiona_type))
 
-        return FieldMap(self.engine, field, (field.name[:DEFAULT_FIELD_NAME_LENGTH], fiona_type))
+    def rename_field(self, field_map, name):
+        field_map.field_out = (name, field_map.field_out[1], )
 
 
 class NativeFieldMapper(BaseFieldMapper):
 
     def _map_field(self, field):
-        field_type = type(field)
-        if field_type not in ENGINE_NATIVE_MAPPING:
+        field_type = self.get_field_type(field)
+        if field_type not in self.mapping:
             raise AttributeError("Mapping not supported with native bindings.")
 
-        native_type = ENGINE_NATIVE_MAPPING[field_type]
-        field_definition = ogr.FieldDefn(field.name[:10], native_type)
-        if isinstance(native_type, ogr.OFTString):
-
-            try:
-                max_length = field.max_length
-            except:
-                max_length = 255
-
-            field_definition.SetWidth(max_length)
+        native_type = getattr(ogr, self.mapping[field_type])
+        field_definition = ogr.FieldDefn(self.get_field_name(field), native_type)
+        if native_type == ogr.OFTString:
+            field_definition.SetWidth(self.get_max_length(field) or 255)
 
         return FieldMap(self.engine, field, field_definition)
 
+    def rename_field(self, field_map, name):
+        field_map.field_out.SetName(name)
+
 class CtypesFieldMapper(BaseFieldMapper):
 
     def _map_field(self, field):
-        field_type = type(field)
-        if field_type not in ENGINE_CTYPES_MAPPING:
+        field_type = self.get_field_type(field)
+        if field_type not in self.mapping:
             raise AttributeError("Mapping not supported with ctypes bindings.")
 
-        ctypes = ENGINE_CTYPES_MAPPING[field_type]
+        ctypes = getattr(ogr_fields, self.mapping[field_type])
         ctypes_int = ROGRFieldTypes[ctypes]
-        ctypes_field = lgdal.OGR_Fld_Create(field.name[:10], ctypes_int)
+        ctypes_field = ogr_write_capi.create_field_defn(force_bytes(self.get_field_name(field)), ctypes_int)
+
+        if ctypes is ogr_fields.OFTString:
+            ogr_write_capi.set_field_width(ctypes_field, self.get_max_length(field) or 255)
 
         return FieldMap(self.engine, field, ctypes_field)
+
+    def rename_field(self, field_map, name):
+        ogr_write_capi.set_field_name(field_map.field_out, force_bytes(name))
+
+
+class DirectFieldMapper(BaseFieldMapper):
+
+    def _map_field(self, field):
+        field_type = self.get_field_type(field)
+        if field_type not in self.mapping:
+            raise AttributeError("Mapping not supported with the direct engine.")
+
+        dbf_type, length, decimals = self.mapping[field_type]
+
+        if dbf_type == "C" and length is None:
+            length = min(self.get_max_length(field) or 254, 254)
+
+        if field_type is DecimalField and length is None:
+            length = field.max_digits + 2
+            decimals = field.decimal_places
+
+        dbf_field = DbfField(self.get_field_name(field), dbf_type, length, decimals)
+        return FieldMap(self.engine, field, dbf_field)
+
+    def rename_field(self, field_map, name):
+        field_map.field_out.name = name
+
+
+class PyogrioFieldMapper(BaseFieldMapper):
+
+    def _map_field(self, field):
+        field_type = self.get_field_type(field)
+        if field_type not in self.mapping:
+            raise AttributeError("Mapping not supported with pyogrio.")
+
+        return FieldMap(self.engine, field, (self.get_field_name(field), self.mapping[field_type]))
+
+    def rename_field(self, field_map, name):
+        field_map.field_out = (name, field_map.field_out[1], )
@@ -0,0 +1,85 @@
+# coding: utf-8
+from . import DEFAULT_FIELD_NAME_LENGTH
+
+# the offsets of the .shx and the readers of
+# the .dbf stop at 2 GB, signed 32 bit ints
+MAX_SHAPEFILE_SIZE = 2 ** 31 - 1
+
+
+class OutputFormat(object):
+
+    """
+    What the writers and the responder need to know about
+    an output format, by its OGR driver name:
+
+    * extension: of the written file;
+    * content_type: of the response;
+    * components: extensions of the files that make a dataset,
+      zipped together by the responder. Single file formats
+      are streamed as they are;
+    * optional_components: extensions of the files that are
+      zipped along when they were written;
+    * field_name_length: the longest field name, None when
+      names are kept whole;
+    * single_transaction: the whole export is written in one
+      transaction instead of in batches;
+    * streamable: the format can be written as it's sent;
+    * max_size: the largest file of a dataset, in bytes. Larger
+      exports are split in parts.
+    """
+
+    def __init__(self, driver, extension, content_type="application/octet-stream", components=None,
+                 optional_components=None, field_name_length=None, single_transaction=False,
+                 streamable=False, max_size=None):
+        self.driver = driver
+        self.extension = extension
+        self.content_type = content_type
+        self.components = tuple(components or ())
+        self.optional_components = tuple(optional_components or ())
+        self.field_name_length = field_name_length
+        self.single_transaction = single_transaction
+        self.streamable = streamable
+        self.max_size = max_size
+
+    @property
+    def zipped(self):
+        return bool(self.components)
+
+
+FORMATS = {}
+
+
+def register_format(driver, extension, **kwargs):
+    FORMATS[driver] = OutputFormat(driver, extension, **kwargs)
+
+
+def get_format(driver):
+
+    """
+    Returns the output format of the driver. Unknown
+    drivers are handled as single files with short names
+    """
+
+    if driver not in FORMATS:
+        return OutputFormat(driver, "", field_name_length=DEFAULT_FIELD_NAME_LENGTH)
+
+    return FORMATS[driver]
+
+
+register_format("ESRI Shapefile", ".shp",
+                content_type="application/zip",
+                components=("shp", "shx", "prj", "dbf"),
+                # the code page, only written by some engines,
+                # and the quadtree index of spatial_index
+                optional_components=("cpg", "qix"),
+                field_name_length=DEFAULT_FIELD_NAME_LENGTH,
+                max_size=MAX_SHAPEFILE_SIZE)
+register_format("GPKG", ".gpkg",
+                content_type="application/geopackage+sqlite3",
+                single_transaction=True)
+register_format("FlatGeobuf", ".fgb",
+                content_type="application/flatgeobuf",
+                streamable=True)
+register_format("GeoJSONSeq", ".geojsons",
+                content_type="application/geo+json-seq",
+                streamable=True)
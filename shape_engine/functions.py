@@ -0,0 +1,170 @@
+# coding: utf-8
+from django.contrib.gis.db.models import Extent
+from django.contrib.gis.db.models.functions import Centroid, Envelope, GeoFunc, GeoHash, Transform
+from django.db import connections
+from django.db.models import BinaryField
+
+GEOHASH_SRID = 4326
+
+
+class Force2D(GeoFunc):
+
+    """
+    Forces the geometries into a two dimensional
+    mode, dropping any Z coordinate
+    """
+
+    function = 'ST_Force2D'
+
+    def as_spatialite(self, compiler, connection, **extra_context):
+        return super(Force2D, self).as_sql(compiler, connection, function='CastToXY', **extra_context)
+
+
+class Force3D(GeoFunc):
+
+    """
+    Forces the geometries into a three dimensional
+    mode, setting zero as the Z of every 2d coordinate
+    """
+
+    function = 'ST_Force3D'
+
+    def as_spatialite(self, compiler, connection, **extra_context):
+        return super(Force3D, self).as_sql(compiler, connection, function='CastToXYZ', **extra_context)
+
+
+class AsWKB(GeoFunc):
+
+    """
+    Returns the geometries as WKB, with their
+    Z coordinates if they have them
+    """
+
+    function = 'ST_AsBinary'
+    output_field_class = BinaryField
+
+    def as_spatialite(self, compiler, connection, **extra_context):
+        return super(AsWKB, self).as_sql(compiler, connection, function='AsBinary', **extra_context)
+
+
+FORCE_DIMENSION_FUNCTIONS = {2: Force2D,
+                             3: Force3D}
+
+
+def get_force_dimension_function(using, dimensions):
+
+    """
+    Returns the database function that coerces geometries
+    to the given dimensions, or None if the backend
+    behind the `using` alias can't do it
+    """
+
+    ops = connections[using].ops
+
+    if not (getattr(ops, 'postgis', False) or getattr(ops, 'spatialite', False)):
+        return None
+
+    return FORCE_DIMENSION_FUNCTIONS.get(dimensions)
+
+
+def get_transform_function(using):
+
+    """
+    Returns the database function that reprojects geometries,
+    or None if the backend behind the `using` alias can't
+    """
+
+    ops = connections[using].ops
+
+    if not any(getattr(ops, name, False) for name in ('postgis', 'spatialite', 'oracle', 'mysql')):
+        return None
+
+    if 'Transform' in ops.unsupported_functions:
+        return None
+
+    return Transform
+
+
+def get_as_wkb_function(using):
+
+    """
+    Returns the database function that serializes geometries
+    to WKB, or None if the backend behind the `using` alias can't
+    """
+
+    ops = connections[using].ops
+
+    if not (getattr(ops, 'postgis', False) or getattr(ops, 'spatialite', False)):
+        return None
+
+    return AsWKB
+
+
+def has_spatial_order(using):
+
+    """
+    Returns whether the backend behind the `using` alias
+    orders geometries spatially. PostGIS 3 sorts them
+    along a Hilbert curve, its earlier versions and
+    the other backends by their bounding boxes or bytes
+    """
+
+    ops = connections[using].ops
+
+    if not getattr(ops, 'postgis', False):
+        return False
+
+    return ops.spatial_version >= (3, 0)
+
+
+def get_spatial_order(using, field_name, curve, srid):
+
+    """
+    Returns what orders the geometries of `field_name` along
+    the curve, the centers of their bounding boxes either on
+    a Hilbert curve or by their geohash, or None if the
+    backend behind the `using` alias can't order them
+    """
+
+    if curve == 'hilbert':
+        return field_name if has_spatial_order(using) else None
+
+    ops = connections[using].ops
+
+    if not (getattr(ops, 'postgis', False) or getattr(ops, 'spatialite', False)):
+        return None
+
+    if any(name in ops.unsupported_functions for name in ('GeoHash', 'Centroid', 'Envelope')):
+        return None
+
+    geometry = field_name
+
+    # geohashes are made of longitudes and latitudes
+    if srid != GEOHASH_SRID:
+        transform = get_transform_function(using)
+
+        if transform is None:
+            return None
+
+        geometry = transform(field_name, GEOHASH_SRID)
+
+    return GeoHash(Centroid(Envelope(geometry)))
+
+
+def get_extent_aggregate(using):
+
+    """
+    Returns the aggregate of the bounding box of the
+    geometries, or None if the backend behind the
+    `using` alias can't compute it
+    """
+
+    ops = connections[using].ops
+
+    if not any(getattr(ops, name, False) for name in ('postgis', 'spatialite', 'oracle')):
+        return None
+
+    if Extent in ops.disallowed_aggregates:
+        return None
+
+    return Extent
@@ -0,0 +1,177 @@
+# coding: utf-8
+"""
+Runs the stages of an export in their own threads, connected by
+bounded queues: a reader thread iterates the queryset, each
+conversion stage runs in a thread of its own, and the thread that
+iterates the pipeline writes the results. The fetches from the
+database and the writes of GDAL, which release the GIL, overlap
+with the conversion of the features.
+"""
+import sys
+import threading
+
+from django.db import connections
+from django.utils import six
+from django.utils.six.moves import queue
+
+DEFAULT_QUEUE_SIZE = 1000
+
+# how long, in seconds, a blocked stage waits before
+# checking whether the pipeline was cancelled
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class _Failure(object):
+
+    """
+    Carries the exception raised in a stage
+    down to the thread that iterates the pipeline
+    """
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+class Pipeline(object):
+
+    """
+    Iterates the results of passing every item of the source
+    through the stages, in order. Stages return None to drop an
+    item. An exception raised by the source or a stage is raised
+    again by the iteration, and stopping the iteration cancels
+    the threads.
+
+    The source is iterated in the reader thread, which has its
+    own database connections: it doesn't see the uncommitted
+    changes of the iterating thread.
+    """
+
+    @staticmethod
+    def is_safe(using):
+
+        """
+        Whether the reader thread sees the same rows as the
+        caller, which it doesn't inside a transaction
+        """
+
+        return not connections[using].in_atomic_block
+
+    def __init__(self, source, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        self.source = source
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.cancelled = threading.Event()
+        self.threads = []
+
+    def _put(self, output, item):
+
+        """
+        Puts the item in the queue, blocking while it is full.
+        Returns False if the pipeline was cancelled meanwhile
+        """
+
+        while not self.cancelled.is_set():
+            try:
+                output.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def _get(self, input):
+        while True:
+            try:
+                return input.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self.cancelled.is_set():
+                    return _DONE
+
+    def _read(self, output):
+        try:
+            for item in self.source:
+                if not self._put(output, item):
+                    return
+
+            self._put(output, _DONE)
+        except BaseException:
+            self._put(output, _Failure(sys.exc_info()))
+        finally:
+            connections.close_all()
+
+    def _convert(self, stage, input, output):
+        while True:
+            item = self._get(input)
+
+            if item is _DONE or isinstance(item, _Failure):
+                self._put(output, item)
+                return
+
+            try:
+                item = stage(item)
+            except BaseException:
+                self._put(output, _Failure(sys.exc_info()))
+                return
+
+            if item is not None and not self._put(output, item):
+                return
+
+    def _get_result(self, output):
+
+        """
+        Waits for the next result of the last stage. Raises
+        RuntimeError if its thread died without ending the
+        results, rather than waiting forever
+        """
+
+        thread = self.threads[-1]
+
+        while True:
+            try:
+                return output.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if not thread.is_alive() and output.empty():
+                    raise RuntimeError("The pipeline stopped before its last result.")
+
+    def _start(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def __iter__(self):
+        output = queue.Queue(self.queue_size)
+        self._start(self._read, output)
+
+        for stage in self.stages:
+            input, output = output, queue.Queue(self.queue_size)
+            self._start(self._convert, stage, input, output)
+
+        try:
+            while True:
+                item = self._get_result(output)
+
+                if item is _DONE:
+                    return
+
+                if isinstance(item, _Failure):
+                    six.reraise(*item.exc_info)
+
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+
+        """
+        Cancels the stages still running and waits for them
+        """
+
+        self.cancelled.set()
+
+        for thread in self.threads:
+            thread.join()
+
+        self.threads = []
@@ -0,0 +1,57 @@
+# coding: utf-8
+"""
+ctypes prototypes of the OGR routines that create datasources
+and write features, which GeoDjango, being read only, doesn't
+declare. Declared the way django.contrib.gis.gdal.prototypes.ds
+declares the ones it reads with.
+"""
+from ctypes import POINTER, c_char_p, c_double, c_int, c_int64, c_void_p
+
+from django.contrib.gis.gdal.libgdal import lgdal
+from django.contrib.gis.gdal.prototypes.generation import void_output, voidptr_output
+
+# OGRNullFID, the FID of a feature not yet written
+NULL_FID = -1
+
+# DataSource
+create_ds = voidptr_output(lgdal.OGR_Dr_CreateDataSource, [c_void_p, c_char_p, POINTER(c_char_p)])
+create_layer = voidptr_output(lgdal.OGR_DS_CreateLayer,
+                              [c_void_p, c_char_p, c_void_p, c_int, POINTER(c_char_p)])
+execute_sql = voidptr_output(lgdal.OGR_DS_ExecuteSQL, [c_void_p, c_char_p, c_void_p, c_char_p], errcheck=False)
+release_result_set = void_output(lgdal.OGR_DS_ReleaseResultSet, [c_void_p, c_void_p], errcheck=False)
+
+# Layer Routines
+create_field = void_output(lgdal.OGR_L_CreateField, [c_void_p, c_void_p, c_int])
+create_feature = void_output(lgdal.OGR_L_CreateFeature, [c_void_p, c_void_p])
+sync_to_disk = void_output(lgdal.OGR_L_SyncToDisk, [c_void_p])
+start_transaction = void_output(lgdal.OGR_L_StartTransaction, [c_void_p])
+commit_transaction = void_output(lgdal.OGR_L_CommitTransaction, [c_void_p])
+rollback_transaction = void_output(lgdal.OGR_L_RollbackTransaction, [c_void_p])
+
+# Field Definition Routines
+create_field_defn = voidptr_output(lgdal.OGR_Fld_Create, [c_char_p, c_int])
+destroy_field_defn = void_output(lgdal.OGR_Fld_Destroy, [c_void_p], errcheck=False)
+set_field_name = void_output(lgdal.OGR_Fld_SetName, [c_void_p, c_char_p], errcheck=False)
+set_field_width = void_output(lgdal.OGR_Fld_SetWidth, [c_void_p, c_int], errcheck=False)
+
+# Feature Routines
+create_feature_object = voidptr_output(lgdal.OGR_F_Create, [c_void_p])
+# GIntBig, 64 bits wide whatever the size of long
+set_fid = void_output(lgdal.OGR_F_SetFID, [c_void_p, c_int64])
+set_geometry = void_output(lgdal.OGR_F_SetGeometry, [c_void_p, c_void_p])
+set_field_integer = void_output(lgdal.OGR_F_SetFieldInteger, [c_void_p, c_int, c_int], errcheck=False)
+set_field_integer64 = void_output(lgdal.OGR_F_SetFieldInteger64, [c_void_p, c_int, c_int64], errcheck=False)
+set_field_double = void_output(lgdal.OGR_F_SetFieldDouble, [c_void_p, c_int, c_double], errcheck=False)
+set_field_string = void_output(lgdal.OGR_F_SetFieldString, [c_void_p, c_int, c_char_p], errcheck=False)
+unset_field = void_output(lgdal.OGR_F_UnsetField, [c_void_p, c_int], errcheck=False)
+
+
+def string_list(values):
+
+    """
+    Returns the values as a NULL terminated array of
+    strings, the char** of OGR's options
+    """
+
+    values = [value.encode("utf-8") for value in values]
+    return (c_char_p * (len(values) + 1))(*(values + [None]))
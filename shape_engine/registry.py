@@ -0,0 +1,185 @@
+# coding: utf-8
+"""
+Registry of the engines able to write shapefiles. Whether an engine
+is available is found without importing its libraries, which are
+only imported the first time the engine is used
+"""
+import pkgutil
+from collections import OrderedDict
+from importlib import import_module
+
+from django.utils import six
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+
+def module_exists(name):
+
+    """
+    Tells whether a module can be imported, looking
+    only for its top level package, which isn't imported
+    """
+
+    try:
+        return pkgutil.find_loader(name.split('.')[0]) is not None
+    except ImportError:
+        return False
+
+
+def lazy_import(name):
+
+    """
+    Returns a proxy to a module, which is only imported
+    when one of its attributes is accessed
+    """
+
+    return SimpleLazyObject(lambda: import_module(name))
+
+
+class Engine(object):
+
+    """
+    An engine, the modules it needs, the mapping of model fields
+    to its field types, its writer and field mapper classes (or
+    their dotted paths) and what it is able to do:
+
+    * formats: OGR driver names it writes;
+    * options: optional keyword arguments of its write_records;
+    * streaming: features are written as the queryset is read,
+      instead of being collected first;
+    * parallel_safe: several of its writers may run at the same
+      time in different threads;
+    * in_memory: it can write to GDAL's /vsimem/;
+    * iter_records: its writer streams the records of the
+      streamable formats with iter_records, without a file;
+    * geometry_types: OGR names of the geometry types of the
+      layers it writes, None meaning any.
+
+    Engines with a higher priority are preferred.
+    """
+
+    def __init__(self, name, requires=(), mapping=None, writer=None, mapper=None,
+                 priority=0, formats=("ESRI Shapefile",), options=(),
+                 streaming=False, parallel_safe=False, in_memory=False, iter_records=False,
+                 geometry_types=None):
+        self.name = name
+        self.requires = tuple(requires)
+        self.mapping = mapping
+        self.writer = writer
+        self.mapper = mapper
+        self.priority = priority
+        self.formats = tuple(formats)
+        self.options = tuple(options)
+        self.streaming = streaming
+        self.parallel_safe = parallel_safe
+        self.in_memory = in_memory
+        self.iter_records = iter_records
+        self.geometry_types = tuple(geometry_types) if geometry_types is not None else None
+
+    @property
+    def available(self):
+        return all(module_exists(name) for name in self.requires)
+
+    @property
+    def writer_class(self):
+        return _get_class(self.writer)
+
+    @property
+    def mapper_class(self):
+        return _get_class(self.mapper)
+
+    def load(self):
+        return [import_module(name) for name in self.requires]
+
+    def supports(self, format=None, options=(), geometry_type=None, **capabilities):
+
+        """
+        Tells whether the engine writes the format and geometry
+        type, accepts the options and has the given capabilities
+        """
+
+        if format is not None and format not in self.formats:
+            return False
+
+        if (geometry_type is not None and self.geometry_types is not None and
+                geometry_type not in self.geometry_types):
+            return False
+
+        if any(option not in self.options for option in options):
+            return False
+
+        return all(getattr(self, name) == value for name, value in capabilities.items())
+
+
+def _get_class(path):
+    if isinstance(path, six.string_types):
+        return import_string(path)
+    return path
+
+
+class EngineRegistry(object):
+
+    """
+    Engines by name, in order of registration. New engines
+    only need to be registered, usually when their app is ready
+    """
+
+    def __init__(self):
+        self._engines = OrderedDict()
+
+    def __contains__(self, name):
+        return name in self._engines
+
+    def __iter__(self):
+        return iter(self._engines)
+
+    def register(self, name, **kwargs):
+        engine = Engine(name, **kwargs)
+        self._engines[name] = engine
+        return engine
+
+    def unregister(self, name):
+        return self._engines.pop(name, None)
+
+    def get(self, name):
+        if name not in self._engines:
+            raise AttributeError("Engine is not supported.")
+
+        return self._engines[name]
+
+    def is_available(self, name):
+        return name in self._engines and self._engines[name].available
+
+    def available(self):
+
+        """
+        Names of the available engines, by priority
+        """
+
+        engines = [engine for engine in self._engines.values() if engine.available]
+        return [engine.name for engine in sorted(engines, key=lambda engine: -engine.priority)]
+
+    def select(self, format=None, options=(), geometry_type=None, **capabilities):
+
+        """
+        Returns the name of the available engine with the highest
+        priority that supports the format, options and capabilities
+        """
+
+        for name in self.available():
+            if self._engines[name].supports(format, options, geometry_type, **capabilities):
+                return name
+
+        raise AttributeError("No available engine supports the export.")
+
+    def get_mapping(self, name):
+        return self.get(name).mapping
+
+    def get_writer_class(self, name):
+        return self.get(name).writer_class
+
+    def get_mapper_class(self, name):
+        return self.get(name).mapper_class
+
+
+engines = EngineRegistry()
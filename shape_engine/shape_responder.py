@@ -2,16 +2,20 @@
 import os
 import zipfile
 import tempfile
-from django.http import HttpResponse
+from django.http import FileResponse, StreamingHttpResponse
 from django.utils.encoding import smart_str
 from django.contrib.gis.db.models.fields import GeometryField
+from django.contrib.gis.gdal import OGRGeomType
 from . import *
 from .engine import ShapefileWriter
+from .formats import get_format
 
 
 class ShpResponder(object):
     def __init__(self, queryset, readme=None, geo_field=None, attribute_fields=None, proj_transform=None,
-                 mimetype='application/zip', file_name='shp_download', encoding='latin-1'):
+                 mimetype='application/zip', file_name='shp_download', encoding='latin-1', dimensions=None,
+                 promote_to_multi=False, split_geometry_types=False, engine=None, pipelined=False,
+                 format="ESRI Shapefile", max_size=None, spatial_index=False, spatial_sort=False):
 
         self.queryset = queryset
         self.readme = readme
@@ -22,8 +26,34 @@ class ShpResponder(object):
         self.attribute_fields = attribute_fields or []
         self.model_field_names = [f.name for f in self.queryset.model._meta.get_fields()]
         self.encoding = encoding
+        self.dimensions = dimensions
+        self.promote_to_multi = promote_to_multi
+        self.split_geometry_types = split_geometry_types
+        self.engine = engine
+        self.pipelined = pipelined
+        self.format = format
+        self.max_size = max_size
+        self.spatial_index = spatial_index
+        self.spatial_sort = spatial_sort
+        self.tmp_name = None
 
     def __call__(self, *args, **kwargs):
+        output_format = get_format(self.format)
+
+        if not output_format.zipped:
+            writer = self.get_stream_writer() if output_format.streamable else None
+
+            if writer is not None:
+                return self.stream_response(writer, output_format)
+
+            tmp = self.write_shapefile_to_tmp_file(self.queryset)
+
+            # e.g. one file per geometry type
+            if len(tmp) > 1:
+                return self.zip_response(tmp, self.file_name, self.mimetype, self.readme)
+
+            return self.file_response(tmp[0], output_format)
+
         tmp = self.write_shapefile_to_tmp_file(self.queryset)
         return self.zip_response(tmp, self.file_name, self.mimetype, self.readme)
 
@@ -64,65 +94,199 @@ class ShpResponder(object):
         return geo_field
 
     def write_shapefile_to_tmp_file(self, queryset):
-        tmp = tempfile.NamedTemporaryFile(suffix='.shp', mode='w+b')
+        tmp = tempfile.NamedTemporaryFile(suffix=get_format(self.format).extension or '.shp', mode='w+b')
         # we must close the file for GDAL to be able to open and write to it
         tmp.close()
-        args = tmp.name, queryset, self.get_geo_field()
+        self.tmp_name = tmp.name
+        paths = self.write_with_engine(self.get_engine(), tmp.name, queryset, self.get_geo_field())
 
-        if HAS_FIONA:
-            self.write_with_fiona(*args)
-        else:
-            if HAS_NATIVE_BINDINGS:
-                self.write_with_native(*args)
-            else:
-                self.write_with_native(*args)
+        return paths or [tmp.name]
+
+    def get_write_options(self):
+
+        """
+        Returns the options of write_records that differ
+        from their defaults
+        """
+
+        options = {}
+
+        if self.dimensions:
+            options['dimensions'] = self.dimensions
+
+        if self.promote_to_multi:
+            options['promote_to_multi'] = True
+
+        if self.split_geometry_types:
+            options['split_geometry_types'] = True
+
+        if self.pipelined:
+            options['pipelined'] = True
+
+        if self.max_size:
+            options['max_size'] = self.max_size
+
+        if self.spatial_index:
+            options['spatial_index'] = True
+
+        if self.spatial_sort:
+            options['spatial_sort'] = self.spatial_sort
+
+        return options
+
+    def get_engine(self):
+
+        """
+        Returns the engine given to the responder or else the
+        available one with the highest priority that supports
+        the export
+        """
+
+        if self.engine:
+            return self.engine
+
+        return engines.select(format=self.format, options=self.get_write_options(),
+                              geometry_type=OGRGeomType(self.get_geo_field().geom_type).name)
+
+    def get_stream_options(self):
+
+        """
+        Returns the write options that apply when
+        the records are streamed
+        """
+
+        options = self.get_write_options()
+        # shapefile options
+        options.pop('split_geometry_types', None)
+        options.pop('max_size', None)
+        options.pop('spatial_index', None)
+        return options
+
+    def get_stream_writer(self):
+
+        """
+        Returns a writer that streams the records, of the engine
+        given to the responder or else of the available one with
+        the highest priority that can, or None if there's none
+        """
+
+        engine = self.engine
 
-        return tmp.name
+        if not engine:
+            try:
+                engine = engines.select(format=self.format, options=self.get_stream_options(),
+                                        geometry_type=OGRGeomType(self.get_geo_field().geom_type).name,
+                                        iter_records=True)
+            except AttributeError:
+                return None
+
+        writer = ShapefileWriter.create(engine=engine, driver_name=self.format)
+        return writer if hasattr(writer, "iter_records") else None
+
+    def _write_shapefiles_to_zip(self, zip, shapefile_paths, file_name):
+
+        """
+        Adds every component of the written shapefiles, or the
+        files of single file formats, to the zip. Files split from
+        the base path keep their suffix in the archive name
+        """
+
+        if not isinstance(shapefile_paths, (list, tuple)):
+            shapefile_paths = [shapefile_paths]
+
+        base_name = os.path.splitext(os.path.basename(self.tmp_name or shapefile_paths[0]))[0]
+        output_format = get_format(self.format)
+        for shapefile_path in shapefile_paths:
+            root, extension = os.path.splitext(shapefile_path)
+            suffix = os.path.basename(root)[len(base_name):]
+
+            if not output_format.zipped:
+                zip.write(shapefile_path, arcname='%s%s%s' % (file_name, suffix, extension))
+                continue
+
+            for item in output_format.components + output_format.optional_components:
+                filename = '%s.%s' % (root, item)
+                if item in output_format.components or os.path.exists(filename):
+                    zip.write(filename, arcname='%s%s.%s' % (file_name, suffix, item))
 
     def write_zip_file(self, zipfile_path, readme=None):
-        shapefile_path = self.write_shapefile_to_tmp_file(self.queryset)
-        zip = zipfile.ZipFile(zipfile_path, 'w', zipfile.ZIP_DEFLATED)
-        files = ['shp', 'shx', 'prj', 'dbf']
-        for item in files:
-            filename = '%s.%s' % (shapefile_path.replace('.shp', ''), item)
-            zip.write(filename, arcname='%s.%s' % (os.path.basename(zipfile_path).replace('.zip', ''), item))
+        shapefile_paths = self.write_shapefile_to_tmp_file(self.queryset)
+        zip = zipfile.ZipFile(zipfile_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._write_shapefiles_to_zip(zip, shapefile_paths, os.path.basename(zipfile_path).replace('.zip', ''))
         if readme:
             zip.writestr('README.txt', readme)
         zip.close()
 
     def zip_response(self, shapefile_path, file_name, mimetype, readme=None):
-        buffer = StringIO()
-        zip = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED)
-        files = ['shp', 'shx', 'prj', 'dbf']
-        for item in files:
-            filename = '%s.%s' % (shapefile_path.replace('.shp', ''), item)
-            zip.write(filename, arcname='%s.%s' % (file_name.replace('.shp', ''), item))
+
+        """
+        Zips the written files to a temporary file, streamed
+        from disk, as split exports add up to gigabytes
+        """
+
+        tmp = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
+        tmp.close()
+
+        zip = zipfile.ZipFile(tmp.name, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._write_shapefiles_to_zip(zip, shapefile_path, file_name.replace('.shp', ''))
         if readme:
             zip.writestr('README.txt', readme)
         zip.close()
-        buffer.flush()
-        zip_stream = buffer.getvalue()
-        buffer.close()
-
-        # Stick it all in a django HttpResponse
-        response = HttpResponse()
-        response['Content-Disposition'] = 'attachment; filename=%s.zip' % file_name.replace('.shp', '')
-        response['Content-length'] = str(len(zip_stream))
-        response['Content-Type'] = mimetype
-        response.write(zip_stream)
+
+        return self.send_file(tmp.name, mimetype, '%s.zip' % file_name.replace('.shp', ''))
+
+    def get_download_name(self, output_format):
+        return '%s%s' % (self.file_name.replace('.shp', ''), output_format.extension)
+
+    def stream_response(self, writer, output_format):
+
+        """
+        Streams the export as the writer creates it,
+        without writing it to a temporary file first
+        """
+
+        records = writer.iter_records(self.queryset, self.get_attributes(), self.get_geo_field(),
+                                      self.proj_transform, **self.get_stream_options())
+
+        response = StreamingHttpResponse(records, content_type=output_format.content_type)
+        response['Content-Disposition'] = 'attachment; filename=%s' % self.get_download_name(output_format)
         return response
 
-    def write_with_fiona(self, tmp_name, queryset, geofield):
+    def file_response(self, path, output_format):
+        return self.send_file(path, output_format.content_type, self.get_download_name(output_format))
 
-        shp_writer = ShapefileWriter.create(engine=ENGINE_FIONA)
-        shp_writer.write_records(queryset, self.get_attributes(), geofield, tmp_name, self.proj_transform)
+    def send_file(self, path, content_type, download_name):
 
-    def write_with_native(self, tmp_name, queryset, geofield):
+        """
+        Streams the written file from disk. The file is
+        removed once open, it's read until it's closed
+        """
 
-        shp_writer = ShapefileWriter.create(engine=ENGINE_NATIVE)
-        shp_writer.write_records(queryset, self.get_attributes(), geofield, tmp_name, self.proj_transform)
+        output = open(path, 'rb')
+        size = os.fstat(output.fileno()).st_size
 
-    def write_with_ctypes(self, tmp_name, queryset, geofield):
+        try:
+            os.remove(path)
+        except OSError:
+            # Windows doesn't remove open files
+            pass
+
+        response = FileResponse(output, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename=%s' % download_name
+        response['Content-Length'] = str(size)
+        return response
 
-        shp_writer = ShapefileWriter.create(engine=ENGINE_CTYPES)
-        shp_writer.write_records(queryset, self.get_attributes(), geofield, tmp_name, self.proj_transform)
\ No newline at end of file
+    def write_with_engine(self, engine, tmp_name, queryset, geofield):
+
+        shp_writer = ShapefileWriter.create(engine=engine, driver_name=self.format)
+        return shp_writer.write_records(queryset, self.get_attributes(), geofield, tmp_name, self.proj_transform,
+                                        **self.get_write_options())
+
+    def write_with_fiona(self, tmp_name, queryset, geofield):
+        return self.write_with_engine(ENGINE_FIONA, tmp_name, queryset, geofield)
+
+    def write_with_native(self, tmp_name, queryset, geofield):
+        return self.write_with_engine(ENGINE_NATIVE, tmp_name, queryset, geofield)
+
+    def write_with_ctypes(self, tmp_name, queryset, geofield):
+        return self.write_with_engine(ENGINE_CTYPES, tmp_name, queryset, geofield)
\ No newline at end of file
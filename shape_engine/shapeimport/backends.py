@@ -0,0 +1,549 @@
+# coding: utf-8
+import io
+import multiprocessing
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import (
+    AutoField, BigIntegerField, BooleanField, DateField, DateTimeField,
+    DecimalField, FloatField, IntegerField, NullBooleanField,
+)
+from django.utils.encoding import force_text
+
+from exceptions import ImportRangeError
+from forms import DONT_IMPORT_KEY, FEATURE_GEOMETRY_KEY
+from jobs import _run_import_range
+from models import LOG_ALL
+
+
+class ImportBackend(object):
+    ''' Interface for the backends that persist the features of an import '''
+
+    def __init__(self, view):
+        self.view = view
+
+    def import_features(self, features, mapping):
+        raise NotImplementedError
+
+
+class OrmImportBackend(ImportBackend):
+
+    """
+    Saves the features through the ORM, in batches of the
+    view's import_batch_size
+    """
+
+    def import_features(self, features, mapping):
+        view = self.view
+
+        batch = []
+        for feature in features:
+            batch.append(feature)
+
+            if len(batch) >= view.import_batch_size:
+                view.update_progress(*view.proccess_batch(batch, mapping))
+                batch = []
+
+        if batch:
+            view.update_progress(*view.proccess_batch(batch, mapping))
+
+
+class ParallelImportBackend(ImportBackend):
+
+    """
+    Splits the layer in ranges of fids and imports each range in a
+    separate process, with its own datasource and database
+    connection. The import only finishes if every range succeeds.
+
+    Like the ORM backend, each range commits its batches as they're
+    saved: the features imported before a range fails are kept, and
+    logged, and the import fails with the ranges that didn't finish.
+    For the same reason, it can't run inside a transaction.
+
+    The processes are spawned when the platform allows, otherwise
+    forked, which is only safe from the main thread: run the imports
+    with the SynchronousJobRunner then.
+
+    The number of processes is given by SHAPEIMPORT_PROCESSES, and
+    defaults to the number of cores.
+    """
+
+    ranges_per_process = 4
+
+    def get_processes(self):
+        return getattr(settings, 'SHAPEIMPORT_PROCESSES', None) or multiprocessing.cpu_count()
+
+    def get_ranges(self, num_feat, processes):
+        count = max(1, processes * self.ranges_per_process)
+        size = max(self.view.import_batch_size, -(-num_feat // count))
+
+        return [(start, min(start + size, num_feat))
+                for start in range(0, num_feat, size)]
+
+    def get_pool(self, processes):
+        if hasattr(multiprocessing, 'get_context'):
+            return multiprocessing.get_context('spawn').Pool(processes)
+
+        # a forked process inherits the locks other threads hold
+        if not isinstance(threading.current_thread(), threading._MainThread):
+            raise ValueError("The parallel import backend can only fork from the main thread.")
+
+        # forked processes must not share the connections of the parent
+        for connection in connections.all():
+            connection.close()
+
+        return multiprocessing.Pool(processes)
+
+    def import_features(self, features, mapping):
+        view = self.view
+        view_path = '{}.{}'.format(view.__class__.__module__,
+                                   view.__class__.__name__)
+
+        if view.delete_missing:
+            # the keys the processes see aren't sent back
+            raise ValueError("The parallel import backend can't delete the missing rows.")
+
+        if any(connection.in_atomic_block for connection in connections.all()):
+            # the processes wouldn't see the uncommitted import
+            raise ValueError("The parallel import backend can't run inside a transaction.")
+
+        processes = self.get_processes()
+
+        tasks = [(view_path, view.model._meta.label, view.shape_import.pk,
+                  dict(mapping), start, stop)
+                 for start, stop in self.get_ranges(len(features), processes)]
+
+        pool = self.get_pool(processes)
+        try:
+            results = list(pool.imap_unordered(_run_import_range, tasks))
+        finally:
+            pool.close()
+            pool.join()
+
+        self.results = sorted(results)
+        errors = [result for result in self.results if result[4]]
+
+        if errors:
+            raise ImportRangeError(u'\n'.join(
+                u'Features {} to {} failed:\n{}'.format(start, stop - 1, error)
+                for start, stop, processed, failed, error in errors
+            ))
+
+
+INTEGER_PATTERN = r'^\s*[-+]?[0-9]+\s*$'
+NUMBER_PATTERN = r'^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+DATE_PATTERN = r'^\s*[0-9]{4}-[0-9]{2}-[0-9]{2}'
+BOOLEAN_PATTERN = r'^\s*(t|f|true|false|y|n|yes|no|1|0)\s*$'
+
+
+def _copy_value(value):
+
+    """
+    Formats a value for the text format of COPY
+    """
+
+    if value is None:
+        return u'\\N'
+
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+
+    return (force_text(value).replace(u'\\', u'\\\\')
+                             .replace(u'\t', u'\\t')
+                             .replace(u'\n', u'\\n')
+                             .replace(u'\r', u'\\r'))
+
+
+class PostgisCopyImportBackend(ImportBackend):
+
+    """
+    Streams the features with COPY into a temporary staging table,
+    with the geometry as EWKB, and moves them into the target model
+    with set based statements, in transactions of copy_batch_size
+    features. Invalid values are found by a validation query, and
+    logged, before anything is moved. A batch whose move still fails
+    (foreign keys, unique columns, out of range numbers, impossible
+    dates, geometry types...) is rolled back and imported again
+    through the ORM, which isolates the failing features.
+
+    Only works when the target model lives in PostgreSQL.
+    """
+
+    copy_batch_size = 10000
+    stage_table = 'shapeimport_stage'
+
+    def __init__(self, view):
+        super(PostgisCopyImportBackend, self).__init__(view)
+
+        self.target_model = view.model.target_model
+        self.log_model = view.shape_import.log_class
+        self.using = router.db_for_write(self.target_model)
+        self.connection = connections[self.using]
+
+        if self.connection.vendor != 'postgresql':
+            raise ValueError("The COPY import backend needs PostgreSQL.")
+
+        if view.incremental:
+            raise ValueError("The COPY import backend doesn't support incremental imports.")
+
+    def qn(self, name):
+        return self.connection.ops.quote_name(name)
+
+    def get_columns(self, mapping):
+
+        """
+        Returns (model field, shapefile field, staging column)
+        for every mapped field
+        """
+
+        columns = []
+        for key in sorted(mapping):
+            if mapping[key] == DONT_IMPORT_KEY:
+                continue
+
+            field = self.target_model._meta.get_field(key)
+            if mapping[key] == FEATURE_GEOMETRY_KEY:
+                columns.append((field, mapping[key], 'geom'))
+            else:
+                columns.append((field, mapping[key], 'c{}'.format(len(columns))))
+
+        return columns
+
+    def get_value_columns(self, columns):
+        return [(field, name, column) for field, name, column in columns
+                if name != FEATURE_GEOMETRY_KEY]
+
+    def import_features(self, features, mapping):
+        columns = self.get_columns(mapping)
+
+        batch = []
+        for feature in features:
+            batch.append(feature)
+
+            if len(batch) >= self.copy_batch_size:
+                self.import_batch(batch, columns, mapping)
+                batch = []
+
+        if batch:
+            self.import_batch(batch, columns, mapping)
+
+    def import_batch(self, features, columns, mapping):
+        if self.view.delete_missing:
+            self.view.remember_pks(features, mapping)
+
+        try:
+            with transaction.atomic(using=self.using):
+                with self.connection.cursor() as cursor:
+                    self.create_stage_table(cursor, columns)
+                    read_failures = self.copy_features(cursor, features, columns)
+                    self.validate(cursor, columns)
+                    failed = self.log_failures(cursor, read_failures)
+                    self.move(cursor, columns)
+                    processed = self.count_successes(cursor) + failed
+
+                    if self.view.log_mode == LOG_ALL:
+                        self.log_successes(cursor)
+
+                    self.drop_stage_table(cursor)
+
+        except DatabaseError:
+            # a constraint the validation doesn't check
+            OrmImportBackend(self.view).import_features(features, mapping)
+            return
+
+        self.view.update_progress(processed, failed)
+
+    def create_stage_table(self, cursor, columns):
+        definitions = ['fid integer', 'geom geometry', 'error text']
+        definitions += ['{} text'.format(column)
+                        for field, name, column in self.get_value_columns(columns)]
+
+        cursor.execute('CREATE TEMPORARY TABLE {} ({})'.format(
+            self.qn(self.stage_table), ', '.join(definitions)
+        ))
+
+    def drop_stage_table(self, cursor):
+        # not left to ON COMMIT, which doesn't happen when
+        # the import runs inside an outer transaction
+        cursor.execute('DROP TABLE {}'.format(self.qn(self.stage_table)))
+
+    def copy_features(self, cursor, features, columns):
+
+        """
+        Copies the features into the staging table. Returns the
+        fids of the features that couldn't even be read
+        """
+
+        geometry_field = self.get_geometry_field(columns)
+        columns = self.get_value_columns(columns)
+        sql = 'COPY {} ({}) FROM STDIN'.format(
+            self.qn(self.stage_table),
+            ', '.join(['fid', 'geom'] + [column for field, name, column in columns])
+        )
+        source_srid = self.view.source_srs.srid if self.view.source_srs else None
+
+        transform = None
+        if geometry_field is not None and self.view.source_srs is not None and not source_srid:
+            # PostGIS can only reproject from the SRSs it knows by their
+            # SRID, others are reprojected here, like the ORM backend does
+            transform = self.view.get_geometry_transform(geometry_field)
+            if transform is not None:
+                source_srid = geometry_field.srid
+
+        read_failures = []
+        lines = []
+
+        for feature in features:
+            try:
+                values = [feature.fid, self.get_ewkb(feature, source_srid, transform)]
+                values += [self.view.get_feature_value(feature, name)
+                           for field, name, column in columns]
+            except Exception:
+                read_failures.append(feature.fid)
+                continue
+
+            lines.append(u'\t'.join(_copy_value(value) for value in values))
+
+            if len(lines) >= self.copy_batch_size:
+                self._copy(cursor, sql, lines)
+                lines = []
+
+        if lines:
+            self._copy(cursor, sql, lines)
+
+        return read_failures
+
+    def _copy(self, cursor, sql, lines):
+        data = (u'\n'.join(lines) + u'\n').encode('utf-8')
+        cursor.copy_expert(sql, io.BytesIO(data))
+
+    def get_ewkb(self, feature, srid=None, transform=None):
+        try:
+            geom = feature.geom
+        except Exception:
+            # features may lack a geometry, which only matters
+            # if the geometry is mapped
+            return None
+
+        if transform is not None:
+            geom.transform(transform)
+
+        if srid:
+            return u'SRID={};{}'.format(srid, geom.hex)
+        return geom.hex
+
+    def get_invalid_condition(self, field, column):
+
+        """
+        SQL condition that is true when the staged text of a
+        column can't be stored in the field
+        """
+
+        conditions = []
+
+        if not field.null and not isinstance(field, AutoField):
+            conditions.append('{} IS NULL'.format(column))
+
+        if column == 'geom':
+            return ' OR '.join(conditions)
+
+        if isinstance(field, (AutoField, IntegerField, BigIntegerField)):
+            pattern = INTEGER_PATTERN
+        elif isinstance(field, (FloatField, DecimalField)):
+            pattern = NUMBER_PATTERN
+        elif isinstance(field, (DateField, DateTimeField)):
+            pattern = DATE_PATTERN
+        elif isinstance(field, (BooleanField, NullBooleanField)):
+            pattern = BOOLEAN_PATTERN
+        else:
+            pattern = None
+
+        if pattern:
+            conditions.append("{} !~* '{}'".format(column, pattern))
+
+        max_length = getattr(field, 'max_length', None)
+        if max_length and pattern is None:
+            conditions.append('char_length({}) > {}'.format(column, int(max_length)))
+
+        return ' OR '.join(conditions)
+
+    def validate(self, cursor, columns):
+
+        """
+        Flags every staged row that can't be moved, with the
+        message of the first field that fails
+        """
+
+        stage = self.qn(self.stage_table)
+
+        for field, name, column in columns:
+            condition = self.get_invalid_condition(field, column)
+            if not condition:
+                continue
+
+            cursor.execute(
+                'UPDATE {} SET error = %s WHERE error IS NULL AND ({})'.format(stage, condition),
+                [u"Invalid value for '{}'".format(field.name)]
+            )
+
+        pk_column = self.get_pk_column(columns)
+        if pk_column and not self.view.upsert:
+            # without upsert, features must reference existing rows
+            pk = self.target_model._meta.pk
+            cursor.execute(
+                'UPDATE {stage} s SET error = %s WHERE s.error IS NULL AND NOT EXISTS '
+                '(SELECT 1 FROM {table} t WHERE t.{pk} = {pk_cast})'.format(
+                    stage=stage,
+                    table=self.qn(self.target_model._meta.db_table),
+                    pk=self.qn(pk.column),
+                    pk_cast=self.get_cast(pk, pk_column)
+                ),
+                [u'An error occurred while saving the feature']
+            )
+
+    def get_geometry_field(self, columns):
+        for field, name, column in columns:
+            if column == 'geom':
+                return field
+        return None
+
+    def get_pk_column(self, columns):
+        for field, name, column in columns:
+            if field.primary_key:
+                return column
+        return None
+
+    def get_geometry_cast(self, field, column):
+
+        """
+        Reprojects the staged geometry to the SRID of the field
+        and coerces it to its dimensions and type, in SQL
+        """
+
+        srid = int(field.srid)
+        sql = 's.{}'.format(column)
+        sql = 'CASE WHEN ST_SRID({0}) = 0 THEN ST_SetSRID({0}, {1}) ELSE {0} END'.format(sql, srid)
+        sql = 'ST_Transform({}, {})'.format(sql, srid)
+        sql = '{}({})'.format('ST_Force3D' if field.dim == 3 else 'ST_Force2D', sql)
+
+        if field.geom_type.startswith('MULTI'):
+            sql = 'ST_Multi({})'.format(sql)
+
+        return sql
+
+    def get_cast(self, field, column):
+        if column == 'geom':
+            return self.get_geometry_cast(field, column)
+
+        db_type = field.db_type(self.connection)
+
+        if isinstance(field, AutoField):
+            db_type = field.rel_db_type(self.connection) if hasattr(field, 'rel_db_type') else 'integer'
+
+        if db_type.startswith(('varchar', 'text', 'char')):
+            return 's.{}::{}'.format(column, db_type)
+
+        return 'trim(s.{})::{}'.format(column, db_type)
+
+    def get_defaults(self, columns):
+
+        """
+        Python side defaults of the fields that aren't mapped,
+        which INSERT ... SELECT would otherwise leave out
+        """
+
+        mapped = set(field.name for field, name, column in columns)
+        defaults = []
+
+        for field in self.target_model._meta.concrete_fields:
+            if field.primary_key or field.name in mapped or not field.has_default():
+                continue
+
+            defaults.append((field, field.get_db_prep_save(field.get_default(),
+                                                           connection=self.connection)))
+
+        return defaults
+
+    def move(self, cursor, columns):
+        stage = self.qn(self.stage_table)
+        table = self.qn(self.target_model._meta.db_table)
+        pk_column = self.get_pk_column(columns)
+        pk = self.target_model._meta.pk
+
+        if pk_column:
+            assignments = ['{} = {}'.format(self.qn(field.column), self.get_cast(field, column))
+                           for field, name, column in columns if not field.primary_key]
+
+            if assignments:
+                cursor.execute(
+                    'UPDATE {table} t SET {assignments} FROM {stage} s '
+                    'WHERE s.error IS NULL AND t.{pk} = {pk_cast}'.format(
+                        table=table,
+                        assignments=', '.join(assignments),
+                        stage=stage,
+                        pk=self.qn(pk.column),
+                        pk_cast=self.get_cast(pk, pk_column)
+                    )
+                )
+
+        defaults = self.get_defaults(columns)
+        target_columns = [self.qn(field.column) for field, name, column in columns]
+        target_columns += [self.qn(field.column) for field, value in defaults]
+        values = [self.get_cast(field, column) for field, name, column in columns]
+        values += ['%s' for field, value in defaults]
+
+        sql = 'INSERT INTO {table} ({columns}) SELECT {values} FROM {stage} s WHERE s.error IS NULL'.format(
+            table=table,
+            columns=', '.join(target_columns),
+            values=', '.join(values),
+            stage=stage
+        )
+
+        if pk_column:
+            sql += ' AND NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{pk} = {pk_cast})'.format(
+                table=table,
+                pk=self.qn(pk.column),
+                pk_cast=self.get_cast(pk, pk_column)
+            )
+
+        cursor.execute(sql, [value for field, value in defaults])
+
+    def _log_columns(self):
+        meta = self.log_model._meta
+        return ', '.join(self.qn(meta.get_field(name).column)
+                         for name in ('shape_import', 'fid', 'success', 'message', 'error_class'))
+
+    def log_failures(self, cursor, read_failures):
+        log_table = self.qn(self.log_model._meta.db_table)
+        import_pk = self.view.shape_import.pk
+
+        cursor.execute(
+            'INSERT INTO {} ({}) SELECT %s, fid, false, error, %s FROM {} WHERE error IS NOT NULL'.format(
+                log_table, self._log_columns(), self.qn(self.stage_table)
+            ),
+            [import_pk, u'InvalidValue']
+        )
+        failed = cursor.rowcount
+
+        if read_failures:
+            cursor.executemany(
+                'INSERT INTO {} ({}) VALUES (%s, %s, false, %s, %s)'.format(log_table, self._log_columns()),
+                [(import_pk, fid, u'An error occurred while saving the feature', u'ReadError')
+                 for fid in read_failures]
+            )
+            failed += len(read_failures)
+
+        return failed
+
+    def count_successes(self, cursor):
+        cursor.execute('SELECT count(*) FROM {} WHERE error IS NULL'.format(self.qn(self.stage_table)))
+        return cursor.fetchone()[0]
+
+    def log_successes(self, cursor):
+        cursor.execute(
+            'INSERT INTO {} ({}) SELECT %s, fid, true, %s, %s FROM {} WHERE error IS NULL'.format(
+                self.qn(self.log_model._meta.db_table), self._log_columns(), self.qn(self.stage_table)
+            ),
+            [self.view.shape_import.pk, u'Feature imported successfully', u'']
+        )
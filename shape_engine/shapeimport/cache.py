@@ -0,0 +1,251 @@
+# coding: utf-8
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.gis import gdal
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.utils import six
+
+
+def get_content_hash(file):
+
+    """
+    Returns the sha1 of the content of an uploaded file. Upload
+    handlers may have computed it already as `content_hash`,
+    otherwise it's computed once and kept there
+    """
+
+    content_hash = getattr(file, 'content_hash', None)
+    if content_hash:
+        return content_hash
+
+    sha1 = hashlib.sha1()
+    file.seek(0)
+    for chunk in file.chunks():
+        sha1.update(chunk)
+    file.seek(0)
+
+    file.content_hash = sha1.hexdigest()
+    return file.content_hash
+
+
+class StagedFeature(object):
+
+    """
+    Read-only copy of a feature, exposing the same subset of
+    the OGR feature interface used by the import
+    """
+
+    __slots__ = ('fid', 'values', 'wkb')
+
+    def __init__(self, fid, values, wkb):
+        self.fid = fid
+        self.values = values
+        self.wkb = wkb
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    @property
+    def size(self):
+        """ Rough size, in bytes, of the feature """
+        return len(self.wkb) + 64 * (len(self.values) + 1)
+
+    @property
+    def geom(self):
+        # the srs is the same for every feature of the layer, so it
+        # is left to the import instead of being parsed every time
+        return gdal.OGRGeometry(six.memoryview(self.wkb))
+
+
+class StagedShapefile(object):
+
+    """
+    Metadata of the layer of an uploaded shapefile and,
+    if it was read completely, its features. `validated` tells
+    whether every geometry was read, even if the features were
+    too large to be kept
+    """
+
+    def __init__(self, key, fields, field_types, num_feat, extent,
+                 geom_type, srs_wkt, features=None, validated=False):
+        self.key = key
+        self.fields = fields
+        self.field_types = field_types
+        self.num_feat = num_feat
+        self.extent = extent
+        self.geom_type = geom_type
+        self.srs_wkt = srs_wkt
+        self.features = features
+        self.validated = validated
+
+    @property
+    def size(self):
+        """ Rough size, in bytes, of the staged data """
+        return 1024 + sum(feature.size for feature in self.features or ())
+
+    def get_metadata(self):
+
+        """
+        Returns a copy of the staged shapefile without
+        its features
+        """
+
+        return StagedShapefile(self.key, self.fields, self.field_types, self.num_feat, self.extent,
+                               self.geom_type, self.srs_wkt, validated=self.validated)
+
+    @classmethod
+    def from_layer(cls, key, layer, load_features=False, max_size=None):
+
+        """
+        Stages a layer. Loading the features touches every
+        geometry, so it raises for corrupted files. Once the
+        features pass `max_size` bytes they are dropped, and
+        the rest of the geometries are only read
+        """
+
+        srs_wkt = layer.srs.wkt if layer.srs else None
+        fields = layer.fields
+
+        features = None
+        if load_features:
+            features = []
+            size = 0
+            for feature in layer:
+                geom = feature.geom
+                if features is None:
+                    continue
+
+                values = dict((name, feature[name].value) for name in fields)
+                features.append(StagedFeature(feature.fid, values,
+                                              bytes(geom.wkb)))
+
+                size += features[-1].size
+                if max_size is not None and size > max_size:
+                    features = None
+
+        return cls(key,
+                   fields,
+                   [field_type.__name__ for field_type in layer.field_types],
+                   layer.num_feat,
+                   layer.extent.tuple,
+                   layer.geom_type.name,
+                   srs_wkt,
+                   features,
+                   validated=load_features)
+
+
+class StagingCache(object):
+
+    """
+    Process wide LRU cache of staged shapefiles, with entries
+    expiring after `timeout` seconds and bounded both in
+    number and in total size.
+
+    The features are only kept in the process. The metadata
+    is also stored in the Django cache `cache_alias`, so the
+    steps of an import served by other processes find it too
+    when that cache is shared, e.g. memcached or redis
+    """
+
+    key_prefix = 'shapeimport:staged:'
+
+    def __init__(self, max_entries=16, max_size=256 * 1024 * 1024, timeout=3600,
+                 cache_alias=DEFAULT_CACHE_ALIAS):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared_cache(self):
+        if self.cache_alias is None:
+            return None
+
+        return caches[self.cache_alias]
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.pop(key, None)
+            if item is not None and item[0] >= time.time():
+                # most recently used entries go to the end
+                self._entries[key] = item
+                return item[2]
+
+        if self.shared_cache is None:
+            return None
+
+        # staged by another process
+        staged = self.shared_cache.get(self.key_prefix + key)
+        if staged is not None:
+            self._set(key, staged)
+
+        return staged
+
+    def set(self, key, staged):
+        self._set(key, staged)
+
+        if self.shared_cache is not None:
+            self.shared_cache.set(self.key_prefix + key, staged.get_metadata(), self.timeout)
+
+    def _set(self, key, staged):
+        size = staged.size
+        if size > self.max_size:
+            # too big to keep, but the metadata is still useful
+            staged.features = None
+            size = staged.size
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.timeout, size, staged)
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+        if self.shared_cache is not None:
+            self.shared_cache.delete(self.key_prefix + key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, item in self._entries.items() if item[0] < now]:
+            del self._entries[key]
+
+        total_size = sum(item[1] for item in self._entries.values())
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 total_size > self.max_size):
+            key, item = self._entries.popitem(last=False)
+            total_size -= item[1]
+
+
+_staging_cache = None
+_staging_cache_lock = threading.Lock()
+
+
+def get_staging_cache():
+
+    """
+    Returns the staging cache, configured by the
+    SHAPEIMPORT_STAGING_CACHE dict setting
+    """
+
+    global _staging_cache
+
+    with _staging_cache_lock:
+        if _staging_cache is None:
+            _staging_cache = StagingCache(
+                **getattr(settings, 'SHAPEIMPORT_STAGING_CACHE', {})
+            )
+
+    return _staging_cache
@@ -7,3 +7,6 @@ class HandlerError(Exception):
 
 class HandlerNotFound(Exception):
     pass
+
+class ImportRangeError(Exception):
+    pass
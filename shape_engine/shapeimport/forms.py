@@ -1,26 +1,73 @@
 # coding: utf-8
 from django import forms
+from django.conf import settings
 from django.core.files.uploadedfile import UploadedFile
 from django.core.exceptions import ValidationError
 from django.contrib.gis import gdal
+from django.utils import six
 from django.utils.translation import ugettext_lazy as _
 
 from util import ShapefileReader
 from exceptions import HandlerNotFound, HandlerError, CompressedShapeError
 
 
+VALIDATION_FULL = 'full'
+VALIDATION_SAMPLE = 'sample'
+VALIDATION_HEADER = 'header'
+
+VALIDATION_MODES = (VALIDATION_FULL, VALIDATION_SAMPLE, VALIDATION_HEADER)
+
+
 class ShapefileField(forms.FileField):
+
+    """
+    Validates an uploaded shapefile. How much is validated depends
+    on `validation` (SHAPEIMPORT_VALIDATION by default):
+
+    * full: every geometry is read, and staged for the import;
+    * sample: the headers are checked and `sample_size` random
+      geometries are read;
+    * header: only the headers of the .shp, .shx and .dbf files
+      are checked against each other.
+
+    With sample and header the remaining geometries are validated
+    by the import itself, which logs the ones that fail.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.validation = kwargs.pop(
+            'validation',
+            getattr(settings, 'SHAPEIMPORT_VALIDATION', VALIDATION_FULL)
+        )
+        self.sample_size = kwargs.pop(
+            'sample_size',
+            getattr(settings, 'SHAPEIMPORT_VALIDATION_SAMPLE_SIZE', 100)
+        )
+
+        if self.validation not in VALIDATION_MODES:
+            raise ValueError("Invalid validation mode: {}".format(self.validation))
+
+        super(ShapefileField, self).__init__(*args, **kwargs)
+
+    def validate_shapefile(self, reader):
+        if self.validation == VALIDATION_FULL:
+            # staging touches every geometry, which validates
+            # them, and saves the next steps from reading it again
+            reader.stage(load_features=True)
+            return
+
+        reader.check_headers()
+
+        if self.validation == VALIDATION_SAMPLE:
+            reader.check_sample(self.sample_size)
+
     def clean(self, *args, **kwargs):
         shape = super(ShapefileField, self).clean(*args, **kwargs)
        
         if isinstance(shape, UploadedFile):
             with ShapefileReader(shape) as reader:
                 try:
-                    datasource = reader.datasource
-                    layer = datasource[0]
-
-                    for feature in layer:
-                        feature.geom
+                    self.validate_shapefile(reader)
 
                 except gdal.error.OGRException:
                     raise forms.ValidationError(
@@ -37,6 +84,7 @@ class ShapefileField(forms.FileField):
 
 
 DONT_IMPORT_KEY = '__SI_NONE'
+FEATURE_GEOMETRY_KEY = '__SI_GEOMETRY'
 
 
 class FieldsForm(forms.Form):
@@ -86,6 +134,10 @@ def build_fields_form(model, shape_fields):
         (DONT_IMPORT_KEY, _(u"Don't import"))
     ]+zip(shape_fields, shape_fields)
 
+    geometry_field = getattr(model, 'import_geometry', None)
+    if not isinstance(geometry_field, six.string_types):
+        geometry_field = None
+
     fields = {}
     for field in model.import_fields:
         fields[field] = forms.ChoiceField(
@@ -95,6 +147,18 @@ def build_fields_form(model, shape_fields):
             required=False
         )
 
+    if geometry_field:
+        fields[geometry_field] = forms.ChoiceField(
+            label=_(u"Geometry to be used as the value for '{}'")
+                  .format(geometry_field),
+            choices=[
+                (DONT_IMPORT_KEY, _(u"Don't import")),
+                (FEATURE_GEOMETRY_KEY, _(u"Feature geometry")),
+            ],
+            initial=FEATURE_GEOMETRY_KEY,
+            required=False
+        )
+
     fields_form = type(
         "{}FieldsForm".format(model.__name__),
         (FieldsForm,),
@@ -0,0 +1,237 @@
+# coding: utf-8
+"""
+Low level reading of the headers of the files that make a
+shapefile, following the ESRI Shapefile Technical Description
+and the dBASE III file format
+"""
+import codecs
+import datetime
+import struct
+
+from django.utils.translation import ugettext_lazy as _
+
+from exceptions import CompressedShapeError
+
+
+SHP_HEADER_SIZE = 100
+SHP_FILE_CODE = 9994
+SHP_VERSION = 1000
+SHX_RECORD_SIZE = 8
+DBF_HEADER_SIZE = 32
+DBF_FIELD_SIZE = 32
+DBF_FIELD_TERMINATOR = b'\x0d'
+SHP_RECORD_HEADER_SIZE = 8
+
+# names of the shape types as reported by OGR. The measured
+# types are read as their plain counterparts
+SHAPE_TYPES = {
+    0: 'None',
+    1: 'Point',
+    3: 'LineString',
+    5: 'Polygon',
+    8: 'MultiPoint',
+    11: 'Point25D',
+    13: 'LineString25D',
+    15: 'Polygon25D',
+    18: 'MultiPoint25D',
+    21: 'Point',
+    23: 'LineString',
+    25: 'Polygon',
+    28: 'MultiPoint',
+}
+
+
+def read_shp_header(data):
+
+    """
+    Parses the 100 bytes header shared by the .shp and .shx
+    files. The length is returned in bytes
+    """
+
+    if len(data) < SHP_HEADER_SIZE:
+        raise CompressedShapeError(_(u'The shapefile header is truncated.'))
+
+    file_code, = struct.unpack('>i', data[0:4])
+    file_length, = struct.unpack('>i', data[24:28])
+    version, shape_type = struct.unpack('<2i', data[28:36])
+    bbox = struct.unpack('<4d', data[36:68])
+
+    if file_code != SHP_FILE_CODE or version != SHP_VERSION:
+        raise CompressedShapeError(_(u'The shapefile header is invalid.'))
+
+    return {'file_length': file_length * 2,
+            'shape_type': shape_type,
+            'bbox': bbox}
+
+
+def read_dbf_header(data):
+
+    """
+    Parses the fixed part of the header of a .dbf file
+    """
+
+    if len(data) < DBF_HEADER_SIZE:
+        raise CompressedShapeError(_(u'The dbf header is truncated.'))
+
+    num_records, header_length, record_length = struct.unpack('<IHH', data[4:12])
+
+    return {'num_records': num_records,
+            'header_length': header_length,
+            'record_length': record_length}
+
+
+def read_dbf_fields(data):
+
+    """
+    Parses the field descriptors that follow the fixed part
+    of the header of a .dbf file. Returns a list of
+    (name, type, length, decimals)
+    """
+
+    fields = []
+    for offset in range(0, len(data) - DBF_FIELD_SIZE + 1, DBF_FIELD_SIZE):
+        descriptor = data[offset:offset + DBF_FIELD_SIZE]
+        if descriptor[:1] == DBF_FIELD_TERMINATOR:
+            break
+
+        name = descriptor[:11].split(b'\0')[0].decode('ascii', 'replace')
+        field_type = descriptor[11:12].decode('ascii', 'replace')
+        length, decimals = struct.unpack('<BB', descriptor[16:18])
+        fields.append((name, field_type, length, decimals))
+
+    return fields
+
+
+def get_ogr_field_type(field_type, length, decimals):
+
+    """
+    Returns the name of the OGR field class the shapefile
+    driver reads a dbf field as
+    """
+
+    if field_type in ('N', 'F'):
+        if decimals:
+            return 'OFTReal'
+        if length < 10:
+            return 'OFTInteger'
+        if length < 19:
+            return 'OFTInteger64'
+        return 'OFTReal'
+
+    if field_type == 'D':
+        return 'OFTDate'
+
+    return 'OFTString'
+
+
+def get_dbf_encoding(cpg):
+
+    """
+    Returns the python codec for the content of a .cpg
+    file, defaulting to latin-1 like OGR does
+    """
+
+    name = (cpg or b'').strip().decode('ascii', 'replace')
+    if name.isdigit():
+        name = 'cp' + name
+
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return 'latin-1'
+
+
+def _parse_dbf_value(raw, field_type, decimals, encoding):
+    if field_type in ('N', 'F'):
+        raw = raw.strip()
+        if not raw or raw.startswith(b'*'):
+            return None
+        try:
+            return float(raw) if decimals else int(raw)
+        except ValueError:
+            return None
+
+    if field_type == 'D':
+        try:
+            return datetime.datetime.strptime(raw.decode('ascii'), '%Y%m%d').date()
+        except ValueError:
+            return None
+
+    if field_type == 'L':
+        return {b'T': True, b'Y': True, b't': True, b'y': True,
+                b'F': False, b'N': False, b'f': False, b'n': False}.get(raw[:1])
+
+    return raw.rstrip(b' \0').decode(encoding, 'replace')
+
+
+def read_dbf_record(data, fields, encoding='latin-1'):
+
+    """
+    Parses a record of a .dbf file into a dict of values,
+    with the field descriptors given by read_dbf_fields
+    """
+
+    values = {}
+    # the first byte flags deleted records
+    offset = 1
+    for name, field_type, length, decimals in fields:
+        values[name] = _parse_dbf_value(data[offset:offset + length],
+                                        field_type, decimals, encoding)
+        offset += length
+
+    return values
+
+
+def read_shp_record(data):
+
+    """
+    Parses the shape type of a .shp record content and its
+    extent, which for points is the point itself
+    """
+
+    shape_type, = struct.unpack('<i', data[0:4])
+
+    if shape_type == 0:
+        bbox = None
+    elif shape_type in (1, 11, 21):
+        x, y = struct.unpack('<2d', data[4:20])
+        bbox = (x, y, x, y)
+    else:
+        bbox = struct.unpack('<4d', data[4:36])
+
+    return {'shape_type': shape_type, 'bbox': bbox}
+
+
+def check_consistency(shp_header, shp_size, shx_header, shx_size, shx_tail,
+                      dbf_header, dbf_size):
+
+    """
+    Checks the headers of a shapefile against each other and
+    against the actual size of the files, without reading the
+    records. `shx_tail` is the last index record, if any
+    """
+
+    if shp_header['file_length'] != shp_size:
+        raise CompressedShapeError(_(u'The .shp file is truncated.'))
+
+    if (shx_header['file_length'] != shx_size or
+            (shx_size - SHP_HEADER_SIZE) % SHX_RECORD_SIZE):
+        raise CompressedShapeError(_(u'The .shx file is truncated.'))
+
+    num_shapes = (shx_size - SHP_HEADER_SIZE) // SHX_RECORD_SIZE
+
+    if num_shapes and shx_tail:
+        offset, content_length = struct.unpack('>2i', shx_tail)
+        if offset * 2 + 8 + content_length * 2 > shp_size:
+            raise CompressedShapeError(_(u'The .shx file points past '
+                                         u'the end of the .shp file.'))
+
+    if dbf_header['num_records'] != num_shapes:
+        raise CompressedShapeError(_(u'The .dbf and .shp files have a '
+                                     u'different number of records.'))
+
+    if (dbf_header['header_length'] +
+            dbf_header['num_records'] * dbf_header['record_length']) > dbf_size:
+        raise CompressedShapeError(_(u'The .dbf file is truncated.'))
+
+    return num_shapes
@@ -0,0 +1,146 @@
+# coding: utf-8
+import logging
+import threading
+import traceback
+from multiprocessing.pool import ThreadPool
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+
+DEFAULT_JOB_RUNNER = 'shape_engine.shapeimport.jobs.ThreadPoolJobRunner'
+
+logger = logging.getLogger(__name__)
+
+
+def run_import_job(view_path, model_label, import_pk, mapping):
+
+    """
+    Runs the import of a shapefile outside the request.
+
+    Every argument is a plain value, so this function can
+    be sent as is to a task queue.
+    """
+
+    view_class = import_string(view_path)
+    view = view_class(model=apps.get_model(model_label))
+    view.prepare_import(import_pk)
+    view.proccess_shape_data(mapping)
+
+
+def run_import_range(view_path, model_label, import_pk, mapping, start, stop):
+
+    """
+    Imports the features with fids in [start, stop), opening the
+    shapefile and the database connection on its own, so it can
+    run in a separate process.
+
+    Returns (start, stop, processed, failed, error), where error
+    is the traceback of an unexpected failure, if any.
+    """
+
+    if not apps.ready:
+        django.setup()
+
+    processed = failed = 0
+
+    try:
+        view_class = import_string(view_path)
+        view = view_class(model=apps.get_model(model_label))
+        view.prepare_import(import_pk)
+
+        with view.get_reader() as reader:
+            layer = reader.datasource[0]
+            view.set_source_srs(layer.srs)
+
+            batch = []
+            for fid in range(start, stop):
+                batch.append(layer[fid])
+
+                if len(batch) >= view.import_batch_size or fid == stop - 1:
+                    batch_processed, batch_failed = view.proccess_batch(batch, mapping)
+                    view.update_progress(batch_processed, batch_failed)
+                    processed += batch_processed
+                    failed += batch_failed
+                    batch = []
+
+    except Exception:
+        return start, stop, processed, failed, traceback.format_exc()
+
+    finally:
+        for connection in connections.all():
+            connection.close()
+
+    return start, stop, processed, failed, None
+
+
+def _run_import_range(args):
+    return run_import_range(*args)
+
+
+class ImportJobRunner(object):
+    ''' Interface for the runners of import jobs '''
+
+    def submit(self, func, *args):
+        raise NotImplementedError
+
+
+class SynchronousJobRunner(ImportJobRunner):
+
+    """ Runs the jobs right away, in the caller """
+
+    def submit(self, func, *args):
+        func(*args)
+
+
+class ThreadPoolJobRunner(ImportJobRunner):
+
+    """
+    Runs the jobs in a pool of threads local to the process.
+    The size of the pool is given by SHAPEIMPORT_WORKERS
+    """
+
+    _pool = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_pool(cls):
+        with cls._lock:
+            if cls._pool is None:
+                cls._pool = ThreadPool(getattr(settings, 'SHAPEIMPORT_WORKERS', 2))
+
+        return cls._pool
+
+    def submit(self, func, *args):
+        self.get_pool().apply_async(self._run, (func, args))
+
+    def on_error(self, func, args):
+
+        """
+        Called, from the worker thread, when a job raises. Nothing
+        waits for the result of the jobs, so the error is logged
+        """
+
+        logger.exception(u'Import job %s%r failed', func.__name__, args)
+
+    def _run(self, func, args):
+        try:
+            func(*args)
+        except Exception:
+            self.on_error(func, args)
+        finally:
+            for connection in connections.all():
+                connection.close()
+
+
+def get_job_runner():
+
+    """
+    Returns the runner configured by SHAPEIMPORT_JOB_RUNNER
+    """
+
+    path = getattr(settings, 'SHAPEIMPORT_JOB_RUNNER', DEFAULT_JOB_RUNNER)
+    return import_string(path)()
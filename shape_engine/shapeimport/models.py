@@ -1,4 +1,5 @@
 import os
+import json
 
 from django.db import models
 from django.db.models.fields import Field
@@ -7,6 +8,24 @@ from django.utils.translation import ugettext_lazy as _
 import forms
 
 
+STATUS_PENDING = 'pending'
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_FINISHED = 'finished'
+STATUS_FAILED = 'failed'
+
+STATUS_CHOICES = (
+    (STATUS_PENDING, _(u'Pending')),
+    (STATUS_QUEUED, _(u'Queued')),
+    (STATUS_RUNNING, _(u'Running')),
+    (STATUS_FINISHED, _(u'Finished')),
+    (STATUS_FAILED, _(u'Failed')),
+)
+
+LOG_ALL = 'all'
+LOG_FAILURES = 'failures'
+
+
 class ShapefileField(models.FileField):
     def formfield(self, **kwargs):
         defaults = {
@@ -20,6 +39,20 @@ class ShapefileField(models.FileField):
         return Field.formfield(self, **defaults)
 
 
+class ImportHashMixIn(models.Model):
+
+    """
+    Stores, in the target model, the hash of the feature each
+    row was imported from, so that incremental imports can
+    skip the features that didn't change
+    """
+
+    class Meta:
+        abstract = True
+
+    import_hash = models.CharField(max_length=40, blank=True, default='', editable=False)
+
+
 class ShapeImportMixIn(models.Model):
 
     class Meta:
@@ -33,6 +66,16 @@ class ShapeImportMixIn(models.Model):
     )
     shape_field = 'shapefile'
 
+    content_hash = models.CharField(
+        max_length=40,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name=_(u'Content hash'),
+        help_text=_(u'sha1 of the uploaded file.')
+    )
+
     finished = models.BooleanField(
         default=False,
         verbose_name=_(u'Finished?'),
@@ -46,10 +89,54 @@ class ShapeImportMixIn(models.Model):
         auto_now_add=True
     )
 
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name=_(u'Status')
+    )
+
+    total_features = models.IntegerField(
+        default=0,
+        verbose_name=_(u'Total features')
+    )
+
+    processed_features = models.IntegerField(
+        default=0,
+        verbose_name=_(u'Processed features')
+    )
+
+    failed_features = models.IntegerField(
+        default=0,
+        verbose_name=_(u'Failed features')
+    )
+
+    summary = models.TextField(
+        blank=True,
+        default='',
+        verbose_name=_(u'Summary'),
+        help_text=_(u'Counts, timings and errors of the import, as json.')
+    )
+
     @property
     def file_name(self):
         return os.path.basename(self.shapefile.name)
 
+    @property
+    def summary_data(self):
+        return json.loads(self.summary) if self.summary else {}
+
+    @property
+    def in_progress(self):
+        return self.status in (STATUS_QUEUED, STATUS_RUNNING)
+
+    @property
+    def progress(self):
+        if not self.total_features:
+            return 0
+
+        return 100.0 * self.processed_features / self.total_features
+
     def get_absolute_url(self):
         return self.finished and self.get_detail_url() or self.get_fields_url()
 
@@ -59,6 +146,13 @@ class ShapeImportMixIn(models.Model):
     def get_detail_url(self):
         raise NotImplementedError
 
+    def get_progress_url(self):
+        raise NotImplementedError
+
+    # field of the target model holding the hash of the imported
+    # features, see ImportHashMixIn
+    import_hash_field = 'import_hash'
+
     @property
     def import_model(self):
         raise NotImplementedError
@@ -80,6 +174,7 @@ class ShapeImportLogMixIn(models.Model):
 
     class Meta:
         abstract = True
+        index_together = [('shape_import', 'success', 'fid')]
 
     @property
     def shape_import(self):
@@ -88,3 +183,4 @@ class ShapeImportLogMixIn(models.Model):
     fid = models.IntegerField(_(u'FID of the feature in the shapefile.'))
     success = models.BooleanField(default=True)
     message = models.CharField(max_length=255)
+    error_class = models.CharField(max_length=100, blank=True, default='')
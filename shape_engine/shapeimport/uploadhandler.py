@@ -0,0 +1,29 @@
+# coding: utf-8
+import hashlib
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+
+    """
+    Streams every upload, whatever its size, to a temporary file
+    on disk in chunks of `chunk_size`, computing its sha1 on the
+    way. The hash is set as `content_hash` on the uploaded file,
+    which the staging cache uses as key.
+    """
+
+    chunk_size = 1024 * 1024
+
+    def new_file(self, *args, **kwargs):
+        super(HashingFileUploadHandler, self).new_file(*args, **kwargs)
+        self.sha1 = hashlib.sha1()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha1.update(raw_data)
+        return super(HashingFileUploadHandler, self).receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super(HashingFileUploadHandler, self).file_complete(file_size)
+        file.content_hash = self.sha1.hexdigest()
+        return file
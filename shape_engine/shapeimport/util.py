@@ -1,16 +1,78 @@
 # coding: utf-8
 import zipfile
+import tarfile
 import tempfile
 import os
-import time
 import shutil
 import abc
 import mimetypes
+import random
+import struct
+import uuid
+from contextlib import closing
+from ctypes import c_char_p, c_void_p, c_int, c_ulonglong, create_string_buffer
 
 from django.contrib.gis import gdal
+from django.contrib.gis.gdal.libgdal import lgdal
+from django.utils.encoding import force_bytes
 from django.utils.translation import ugettext_lazy as _
 
+from cache import StagedShapefile, get_content_hash, get_staging_cache
 from exceptions import CompressedShapeError, HandlerNotFound, HandlerError
+import headers
+
+
+def _vsi_function(name, argtypes, restype):
+    # lgdal[name] returns a new function pointer, so the prototypes
+    # set here don't clash with the ones GeoDjango declares
+    func = lgdal[name]
+    func.argtypes = argtypes
+    func.restype = restype
+    return func
+
+vsi_file_from_mem_buffer = _vsi_function('VSIFileFromMemBuffer',
+                                         [c_char_p, c_void_p, c_ulonglong, c_int],
+                                         c_void_p)
+vsi_close = _vsi_function('VSIFCloseL', [c_void_p], c_int)
+vsi_unlink = _vsi_function('VSIUnlink', [c_char_p], c_int)
+
+
+def get_file_path(file):
+
+    """ Returns the path of the file on the local disk, if any """
+
+    if hasattr(file, 'temporary_file_path'):
+        return file.temporary_file_path()
+
+    name = getattr(file, 'name', None)
+    if name and os.path.isabs(name) and os.path.isfile(name):
+        return name
+
+    return None
+
+
+class VSIMemFile(object):
+
+    """
+    A file in GDAL's /vsimem/ virtual filesystem, backed by
+    a buffer that lives as long as this object isn't closed
+    """
+
+    def __init__(self, data, suffix=''):
+        self.path = '/vsimem/shapeimport/{}{}'.format(uuid.uuid4().hex, suffix)
+        self._buffer = create_string_buffer(data, len(data))
+
+        handle = vsi_file_from_mem_buffer(force_bytes(self.path),
+                                          self._buffer, len(data), 0)
+        if not handle:
+            raise HandlerError(_(u"Could not load the file in memory."))
+
+        vsi_close(handle)
+
+    def close(self):
+        if self._buffer is not None:
+            vsi_unlink(force_bytes(self.path))
+            self._buffer = None
 
 
 class ShapefileHandler(object):
@@ -30,6 +92,23 @@ class ShapefileHandler(object):
     def extract(self, dir):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def open(self, name):
+        ''' File object to read a file inside the archive '''
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def size(self, name):
+        raise NotImplementedError
+
+    def vsi_path(self, name):
+        ''' GDAL virtual path to a file inside the archive, if
+        the handler is able to read it without extracting '''
+        return None
+
+    def close(self):
+        pass
+
 
 class HandlerFactory(object):
     _handlers = set()
@@ -46,7 +125,9 @@ class HandlerFactory(object):
         if hasattr(file, 'content_type'):
             content_type = file.content_type
         else:
-            content_type = mimetypes.guess_type(file.name)[0]
+            content_type, encoding = mimetypes.guess_type(file.name)
+            if content_type is None and encoding == 'gzip':
+                content_type = 'application/gzip'
 
         for handler in cls._handlers:
             if content_type in handler.MIME_TYPES:
@@ -69,7 +150,13 @@ class ZipShapefileHandler(ShapefileHandler):
         'multipart/x-zip',
     )
 
+    # uploads that aren't on disk are read into /vsimem/ up to this size
+    MAX_IN_MEMORY_SIZE = 64 * 1024 * 1024
+
     def __init__(self, file):
+        self._source = file
+        self._mem_file = None
+
         try:
             self._file = zipfile.ZipFile(file)
 
@@ -100,6 +187,132 @@ class ZipShapefileHandler(ShapefileHandler):
                   "not a zip.")
             )
 
+    def open(self, name):
+        return self._file.open(name)
+
+    def size(self, name):
+        return self._file.getinfo(name).file_size
+
+    def vsi_path(self, name):
+        path = get_file_path(self._source)
+
+        if path and not path.lower().endswith('.zip'):
+            # GDAL finds the end of the archive in the path by its
+            # extension, which temporary uploads don't have
+            path = u'{%s}' % path if gdal.GDAL_VERSION >= (2, 2) else None
+
+        if not path:
+            if self._mem_file is None:
+                size = getattr(self._source, 'size', None)
+                if size is None or size > self.MAX_IN_MEMORY_SIZE:
+                    return None
+
+                self._source.seek(0)
+                self._mem_file = VSIMemFile(self._source.read(), '.zip')
+
+            path = self._mem_file.path
+
+        return u'/vsizip/{}/{}'.format(path, name)
+
+    def close(self):
+        self._file.close()
+
+        if self._mem_file is not None:
+            self._mem_file.close()
+            self._mem_file = None
+
+
+@shapefile_handler
+class TarShapefileHandler(ShapefileHandler):
+
+    """
+    Handles tar archives, optionally gzipped. Members are
+    decompressed as they're read, so memory stays bounded
+    """
+
+    MIME_TYPES = (
+        'application/x-tar',
+        'application/x-gtar',
+        'application/x-gzip',
+        'application/gzip',
+        'application/x-compressed-tar',
+    )
+
+    # GDAL only recognizes tar archives by their extension
+    VSI_EXTENSIONS = ('.tar', '.tar.gz', '.tgz')
+
+    def __init__(self, file):
+        self._source = file
+
+        try:
+            file.seek(0)
+            self._file = tarfile.open(fileobj=file, mode='r:*')
+            self._members = dict((member.name, member)
+                                 for member in self._file.getmembers()
+                                 if member.isfile())
+
+        except (tarfile.TarError, IOError, EOFError):
+            raise HandlerError(
+                _("Invalid tar file, it's either corrupted or "
+                  "not a tar.")
+            )
+
+    @property
+    def namelist(self):
+        return list(self._members)
+
+    def extract(self, dir):
+        for name, member in self._members.items():
+            # members can't be written outside of dir
+            if os.path.isabs(name) or '..' in name.split('/'):
+                continue
+
+            try:
+                self._file.extract(member, dir)
+
+            except (tarfile.TarError, IOError, EOFError):
+                raise HandlerError(
+                    _("Invalid tar file, it's either corrupted or "
+                      "not a tar.")
+                )
+
+    def open(self, name):
+        # tar members aren't context managers in python 2
+        return closing(self._file.extractfile(self._members[name]))
+
+    def size(self, name):
+        return self._members[name].size
+
+    def vsi_path(self, name):
+        path = get_file_path(self._source)
+
+        if not path or not path.lower().endswith(self.VSI_EXTENSIONS):
+            return None
+
+        return u'/vsitar/{}/{}'.format(path, name)
+
+    def close(self):
+        self._file.close()
+
+
+class ShapefilePreview(object):
+
+    """
+    Metadata and first features of a shapefile, read from
+    the headers of its files. `features` holds dicts with the
+    fid, the values and the extent of each feature
+    """
+
+    def __init__(self, fields, field_types, num_feat, extent,
+                 geom_type, srs_wkt, features):
+        self.fields = fields
+        self.field_types = field_types
+        self.num_feat = num_feat
+        self.extent = extent
+        self.geom_type = geom_type
+        self.srs_wkt = srs_wkt
+        self.features = features
+
 
 class ShapefileReader(object):
 
@@ -109,17 +322,26 @@ class ShapefileReader(object):
         return self
 
     def __exit__(self, *args, **kwargs):
-        shutil.rmtree(self._tmp_dir)
+        self.close()
 
     def __init__(self, file):
         self.file = file
 
-        self._tmp_dir = os.path.join(tempfile.gettempdir(),
-                                     "{:.9f}".format(time.time()))
+        self._tmp_dir = None
+        self._handler = None
+        self._datasource = None
 
+    def close(self):
+        # the datasource must go away before its virtual file
         self._datasource = None
 
-        os.makedirs(self._tmp_dir)
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
+
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir)
+            self._tmp_dir = None
 
     @property
     def datasource(self):
@@ -127,13 +349,142 @@ class ShapefileReader(object):
             self._datasource = self._get_datasource()
         return self._datasource
 
+    @property
+    def handler(self):
+        if self._handler is None:
+            self._handler = HandlerFactory.get(self.file)
+        return self._handler
+
     @property
     def fields(self):
         return self.datasource[0].fields
 
-    def _get_datasource(self):
+    def stage(self, load_features=False):
+
+        """
+        Returns the staged metadata of the shapefile, from the
+        staging cache when the same content was staged before.
+        With `load_features` every geometry is read, and the
+        features are staged too unless they're larger than the
+        cache, so later steps don't need to read the file again
+        """
+
+        cache = get_staging_cache()
+        key = get_content_hash(self.file)
+
+        staged = cache.get(key)
+        if staged is not None and (staged.validated or not load_features):
+            return staged
+
+        # features larger than the cache would be dropped by it,
+        # so they aren't kept in memory in the first place
+        staged = StagedShapefile.from_layer(key, self.datasource[0], load_features,
+                                            max_size=cache.max_size)
+        cache.set(key, staged)
+
+        return staged
+
+    def check_headers(self):
+
+        """
+        Checks that the headers of the .shp, .shx and .dbf files
+        agree with each other and with the size of the files,
+        without reading any record. Returns the number of shapes
+        """
+
+        handler = self.handler
+        name = self._get_shapefile_name()
+
+        shp_size = handler.size(name+'.shp')
+        with handler.open(name+'.shp') as shp:
+            shp_header = headers.read_shp_header(shp.read(headers.SHP_HEADER_SIZE))
+
+        shx_size = handler.size(name+'.shx')
+        with handler.open(name+'.shx') as shx:
+            shx_header = headers.read_shp_header(shx.read(headers.SHP_HEADER_SIZE))
+
+            shx_tail = None
+            if shx_size > headers.SHP_HEADER_SIZE:
+                # archive members can only be read forward
+                to_skip = shx_size - headers.SHP_HEADER_SIZE - headers.SHX_RECORD_SIZE
+                while to_skip > 0:
+                    to_skip -= len(shx.read(min(to_skip, 1024 * 1024)))
+                shx_tail = shx.read(headers.SHX_RECORD_SIZE)
+
+        dbf_size = handler.size(name+'.dbf')
+        with handler.open(name+'.dbf') as dbf:
+            dbf_header = headers.read_dbf_header(dbf.read(headers.DBF_HEADER_SIZE))
+
+        return headers.check_consistency(shp_header, shp_size,
+                                           shx_header, shx_size, shx_tail,
+                                           dbf_header, dbf_size)
+
+    def preview(self, num_features=10):
+
+        """
+        Returns a ShapefilePreview of the shapefile, reading only
+        the headers of its files and their first `num_features`
+        records, without opening it with GDAL
+        """
+
+        handler = self.handler
+        name = self._get_shapefile_name()
+
+        encoding = 'latin-1'
+        if name+'.cpg' in handler.namelist:
+            with handler.open(name+'.cpg') as cpg:
+                encoding = headers.get_dbf_encoding(cpg.read(64))
+
+        with handler.open(name+'.prj') as prj:
+            srs_wkt = prj.read().decode('latin-1').strip() or None
+
+        with handler.open(name+'.dbf') as dbf:
+            dbf_header = headers.read_dbf_header(dbf.read(headers.DBF_HEADER_SIZE))
+            dbf_fields = headers.read_dbf_fields(
+                dbf.read(dbf_header['header_length'] - headers.DBF_HEADER_SIZE)
+            )
+
+            num_features = min(num_features, dbf_header['num_records'])
+            records = [headers.read_dbf_record(dbf.read(dbf_header['record_length']),
+                                               dbf_fields, encoding)
+                       for fid in range(num_features)]
+
+        with handler.open(name+'.shp') as shp:
+            shp_header = headers.read_shp_header(shp.read(headers.SHP_HEADER_SIZE))
+
+            features = []
+            for fid, values in enumerate(records):
+                length = struct.unpack('>2i', shp.read(headers.SHP_RECORD_HEADER_SIZE))[1]
+                shape = headers.read_shp_record(shp.read(length * 2))
+                features.append({'fid': fid, 'values': values, 'bbox': shape['bbox']})
+
+        xmin, ymin, xmax, ymax = shp_header['bbox']
 
-        handler = HandlerFactory.get(self.file)
+        return ShapefilePreview(
+            [field[0] for field in dbf_fields],
+            [headers.get_ogr_field_type(*field[1:]) for field in dbf_fields],
+            dbf_header['num_records'],
+            (xmin, ymin, xmax, ymax),
+            headers.SHAPE_TYPES.get(shp_header['shape_type'], 'Unknown'),
+            srs_wkt,
+            features
+        )
+
+    def check_sample(self, sample_size):
+
+        """
+        Reads the geometries of `sample_size` random features
+        """
+
+        layer = self.datasource[0]
+        num_feat = layer.num_feat
+
+        for fid in random.sample(range(num_feat), min(sample_size, num_feat)):
+            layer[fid].geom
+
+    def _get_shapefile_name(self):
+
+        handler = self.handler
 
         ext_set = set(ShapefileReader.REQUIRED_EXTENSIONS)
         files_name = None
@@ -156,7 +507,18 @@ class ShapefileReader(object):
                                          u'in the shapefile: {}')
                                        .format(list(ext_set)))
 
-        handler.extract(self._tmp_dir)
-        shapefile_path = os.path.join(self._tmp_dir, shapefile_name+'.shp')
+        return shapefile_name
+
+    def _get_datasource(self):
+
+        handler = self.handler
+        shapefile_name = self._get_shapefile_name()
+
+        shapefile_path = handler.vsi_path(shapefile_name+'.shp')
+
+        if shapefile_path is None:
+            self._tmp_dir = tempfile.mkdtemp()
+            handler.extract(self._tmp_dir)
+            shapefile_path = os.path.join(self._tmp_dir, shapefile_name+'.shp')
 
         return gdal.DataSource(shapefile_path)
\ No newline at end of file
@@ -1,18 +1,55 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from django.contrib.gis.gdal import CoordTransform, SpatialReference
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import transaction, DatabaseError
+from django.db.models import F, Count
+from django.utils.decorators import method_decorator
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext_lazy as _
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.shortcuts import get_object_or_404, redirect
-from django.http import Http404
+from django.http import Http404, JsonResponse
 from django.views.generic.edit import CreateView, FormView
 from django.views.generic.detail import DetailView
 
 from forms import (
     build_shapeimport_form, build_fields_form,
-    DONT_IMPORT_KEY
+    DONT_IMPORT_KEY, FEATURE_GEOMETRY_KEY
+)
+from backends import OrmImportBackend
+from cache import get_content_hash, get_staging_cache
+from jobs import get_job_runner, run_import_job
+from models import (
+    STATUS_QUEUED, STATUS_RUNNING,
+    STATUS_FINISHED, STATUS_FAILED, LOG_ALL
 )
+from uploadhandler import HashingFileUploadHandler
 from util import ShapefileReader
+from shape_engine.utils import GeometryCoercer
 
 
 class ShapeImportCreateView(CreateView):
 
     fields = ['shapefile']
+    upload_handler_class = HashingFileUploadHandler
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        # the upload handlers can only be replaced before the body is
+        # read, which the csrf middleware would otherwise do first
+        if self.upload_handler_class is not None:
+            request.upload_handlers = [self.upload_handler_class(request)]
+
+        return self._dispatch(request, *args, **kwargs)
+
+    @method_decorator(csrf_protect)
+    def _dispatch(self, request, *args, **kwargs):
+        return super(ShapeImportCreateView, self).dispatch(request, *args, **kwargs)
 
     def get_form_class(self):
         if hasattr(self, 'form_class') and self.form_class:
@@ -22,9 +59,22 @@ class ShapeImportCreateView(CreateView):
             self.model, self.fields
         )
 
+    def form_valid(self, form):
+        upload = form.cleaned_data.get(form.instance.shape_field)
+        if upload is not None:
+            form.instance.content_hash = get_content_hash(upload)
+
+        return super(ShapeImportCreateView, self).form_valid(form)
+
 
 class ShapeImportDetailView(DetailView):
 
+    """
+    Shows the summary of an import and a page of its failures
+    """
+
+    paginate_by = 100
+
     def get_context_data(self, **kwargs):
         context = super(ShapeImportDetailView, self).get_context_data(**kwargs)
         obj = context['object']
@@ -32,80 +82,633 @@ class ShapeImportDetailView(DetailView):
         if not obj.finished:
             raise Http404
 
-        context['logs'] = (self.model.log_class.objects
-                                               .filter(shape_import=obj)
-                                               .order_by('fid'))
+        # served by the (shape_import, success, fid) index
+        failures = (self.model.log_class.objects
+                                        .filter(shape_import=obj, success=False)
+                                        .order_by('fid'))
+
+        paginator = Paginator(failures, self.paginate_by)
+        try:
+            page = paginator.page(self.request.GET.get('page', 1))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+
+        context['paginator'] = paginator
+        context['page_obj'] = page
+        context['logs'] = page.object_list
+        context['summary'] = obj.summary_data
         return context
 
 
+class ShapeImportProgressView(DetailView):
+
+    """ Reports, as json, the progress of an import """
+
+    def render_to_response(self, context, **response_kwargs):
+        obj = context['object']
+
+        return JsonResponse({
+            'status': obj.status,
+            'finished': obj.finished,
+            'total_features': obj.total_features,
+            'processed_features': obj.processed_features,
+            'failed_features': obj.failed_features,
+            'progress': obj.progress,
+            'url': obj.finished and obj.get_detail_url() or None,
+        })
+
+
+class ShapeImportPreviewView(DetailView):
+
+    """
+    Reports, as json, the fields, extent and first features
+    of the uploaded shapefile, reading only what it needs
+    """
+
+    num_features = 10
+
+    def render_to_response(self, context, **response_kwargs):
+        obj = context['object']
+        shape_file = getattr(obj, obj.shape_field).file
+
+        with ShapefileReader(shape_file) as reader:
+            preview = reader.preview(self.num_features)
+
+        return JsonResponse({
+            'fields': preview.fields,
+            'field_types': preview.field_types,
+            'num_feat': preview.num_feat,
+            'extent': preview.extent,
+            'geom_type': preview.geom_type,
+            'srs_wkt': preview.srs_wkt,
+            'features': preview.features,
+        })
+
+
 class ShapeImportFieldsView(FormView):
 
     shape_import = None
     shape_file = None
+    import_batch_size = 500
+    upsert = False
+    incremental = False
+    delete_missing = False
+    background = False
+    import_backend_class = OrmImportBackend
+    log_mode = LOG_ALL
+    source_srs = None
+    seen_pks = None
+    coercer = GeometryCoercer()
 
     def dispatch(self, *args, **kwargs):
-        self.shape_import = get_object_or_404(
-            self.model, pk=kwargs['pk']
-        )
+        self.prepare_import(kwargs['pk'])
 
-        if self.shape_import.finished:
+        if self.shape_import.finished or self.shape_import.in_progress:
             raise Http404
 
+        return super(ShapeImportFieldsView, self).dispatch(*args, **kwargs)
+
+    def prepare_import(self, pk):
+        self.shape_import = get_object_or_404(
+            self.model, pk=pk
+        )
+
         self.shape_file = getattr(
             self.shape_import, self.shape_import.shape_field
         ).file
 
-        return super(ShapeImportFieldsView, self).dispatch(*args, **kwargs)
+        # saves reading the whole file again to find it in the cache
+        if self.shape_import.content_hash:
+            self.shape_file.content_hash = self.shape_import.content_hash
+
+    def get_reader(self):
+        return ShapefileReader(self.shape_file)
 
     def get_form_class(self):
         if hasattr(self, 'form_class') and self.form_class:
             return self.form_class
 
         with ShapefileReader(self.shape_file) as reader:
-            form_class = build_fields_form(self.model, reader.fields)
+            form_class = build_fields_form(self.model, reader.preview(0).fields)
 
         return form_class
 
     def form_valid(self, form):
+        try:
+            self.check_mapping(form.data_mapping)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+
+        if self.background:
+            self.submit_import(form.data_mapping)
+            return redirect(self.shape_import.get_progress_url())
+
         self.proccess_shape_data(form.data_mapping)
         return redirect(self.shape_import.get_absolute_url())
 
+    def check_mapping(self, mapping):
+
+        """
+        Incremental imports and deleting the missing rows find the
+        rows by the primary key, without it every feature would be
+        imported as a new row
+        """
+
+        if not (self.incremental or self.delete_missing):
+            return
+
+        pk_name = self.model.target_model._meta.pk.name
+        if mapping.get(pk_name, DONT_IMPORT_KEY) == DONT_IMPORT_KEY:
+            raise ValidationError(_(u"The primary key must be mapped to update "
+                                    u"the existing rows."))
+
+    def submit_import(self, mapping):
+
+        """
+        Queues the import to run outside the request
+        """
+
+        self.update_import(status=STATUS_QUEUED)
+
+        view_path = '{}.{}'.format(self.__class__.__module__,
+                                   self.__class__.__name__)
+        get_job_runner().submit(run_import_job,
+                                view_path,
+                                self.model._meta.label,
+                                self.shape_import.pk,
+                                dict(mapping))
+
+    def update_import(self, **values):
+
+        """
+        Updates the import without touching the fields that
+        aren't given (which may be changing concurrently)
+        """
+
+        self.model.objects.filter(pk=self.shape_import.pk).update(**values)
+
+    def update_progress(self, processed, failed):
+        self.update_import(
+            processed_features=F('processed_features') + processed,
+            failed_features=F('failed_features') + failed
+        )
+
     def proccess_shape_data(self, mapping):
-        with ShapefileReader(self.shape_file) as reader:
-            for feature in reader.datasource[0]:
-                log = self.shape_import.log_class()
+        started_at = datetime.now()
+        start = time.time()
+
+        try:
+            self.check_mapping(mapping)
+            self.seen_pks = set()
+
+            with self.get_reader() as reader:
+                staged = reader.stage()
+                self.set_source_srs(staged.srs_wkt)
+                self.update_import(status=STATUS_RUNNING,
+                                   total_features=staged.num_feat,
+                                   processed_features=0,
+                                   failed_features=0)
+
+                if staged.features is not None:
+                    features = staged.features
+                else:
+                    features = reader.datasource[0]
+
+                self.get_import_backend().import_features(features, mapping)
+
+                deleted = None
+                if self.delete_missing:
+                    deleted = self.delete_missing_objects()
+
+            # the import is the last step that needs the staged data
+            get_staging_cache().delete(staged.key)
+
+        except Exception:
+            self.update_import(status=STATUS_FAILED)
+            raise
+
+        self.shape_import.refresh_from_db()
+        seconds = time.time() - start
+
+        self.update_import(status=STATUS_FINISHED, finished=True,
+                           summary=json.dumps(self.build_summary(started_at, seconds, deleted)))
+        self.shape_import.refresh_from_db()
+
+    def build_summary(self, started_at, seconds, deleted=None):
+
+        """
+        Counts, timings and the histogram of error classes of
+        the import, taken with a single query on the failures
+        """
+
+        shape_import = self.shape_import
+        errors = (shape_import.log_class.objects
+                              .filter(shape_import=shape_import, success=False)
+                              .values_list('error_class')
+                              .annotate(count=Count('pk'))
+                              .order_by())
+
+        summary = {
+            'total': shape_import.total_features,
+            'processed': shape_import.processed_features,
+            'failed': shape_import.failed_features,
+            'imported': shape_import.processed_features - shape_import.failed_features,
+            'started_at': started_at.isoformat(),
+            'seconds': round(seconds, 3),
+            'features_per_second': round(shape_import.processed_features / seconds, 1) if seconds else None,
+            'errors': dict((error_class or u'Unknown', count) for error_class, count in errors),
+        }
+
+        if deleted is not None:
+            summary['deleted'] = deleted
+
+        return summary
+
+    def get_import_backend(self):
+        return self.import_backend_class(self)
+
+    def set_source_srs(self, srs):
+
+        """
+        Sets the SRS of the shapefile (read from its .prj),
+        which the geometries are reprojected from
+        """
+
+        if srs is not None and not isinstance(srs, SpatialReference):
+            srs = SpatialReference(srs)
+
+        self.source_srs = srs
+        self._geometry_transform = None
+
+    def get_geometry_key(self, mapping):
+        for key in mapping:
+            if mapping[key] == FEATURE_GEOMETRY_KEY:
+                return key
+        return None
+
+    def get_geometry_transform(self, field):
+
+        """
+        Returns the transform from the SRS of the shapefile to
+        the one of the geometry field, built once per import.
+        None means there's nothing to transform
+        """
+
+        if getattr(self, '_geometry_transform', None) is None:
+            transform = False
+
+            if self.source_srs is not None and field.srid:
+                target_srs = SpatialReference(field.srid)
+                if self.source_srs.srid != target_srs.srid:
+                    transform = CoordTransform(self.source_srs, target_srs)
+
+            self._geometry_transform = transform
+
+        return self._geometry_transform or None
+
+    def convert_geometries(self, features, mapping):
+
+        """
+        Reads the geometries of a batch of features, reprojecting
+        them to the SRID of the mapped geometry field and coercing
+        them to its dimensions and type. Returns a list aligned
+        with the features, holding the exception of the ones
+        that failed
+        """
+
+        key = self.get_geometry_key(mapping)
+        if key is None:
+            return [None] * len(features)
+
+        field = self.model.target_model._meta.get_field(key)
+        transform = self.get_geometry_transform(field)
+
+        geometries = []
+        for feature in features:
+            try:
+                ogr_geom = feature.geom
+                if transform is not None:
+                    ogr_geom.transform(transform)
+
+                geometry = ogr_geom.geos
+                geometry.srid = field.srid
+                geometries.append(self.coercer.coerce(geometry, dimensions=field.dim))
+            except Exception as e:
+                geometries.append(e)
+
+        if field.geom_type.startswith('MULTI'):
+            valid = [i for i, g in enumerate(geometries) if not isinstance(g, Exception)]
+            promoted = self.coercer.promote_many([geometries[i] for i in valid])
+            for i, geometry in zip(valid, promoted):
+                geometries[i] = geometry
+
+        return geometries
+
+    def proccess_batch(self, features, mapping):
+
+        """
+        Builds the objects of a batch of features and saves them,
+        with their logs, in a single transaction. If the batch
+        fails, it is saved again row by row so that only the
+        failing features are logged as errors.
+
+        Returns the number of processed and failed features
+        """
+
+        objects = []
+        logs = []
+        hashes = [None] * len(features)
+        if self.delete_missing:
+            self.remember_pks(features, mapping)
+
+        if self.incremental:
+            features, hashes, logs = self.skip_unchanged(features, mapping)
+
+        existing = self.get_existing_objects(features, mapping)
+        geometries = self.convert_geometries(features, mapping)
+        hash_field = self.model.import_hash_field
+
+        for feature, geometry, feature_hash in zip(features, geometries, hashes):
+            log = self.build_log(feature)
+            try:
+                obj = self.build_object(feature, mapping, existing, geometry)
+            except Exception as e:
+                log.message = u'An error occurred while saving the feature'
+                log.success = False
+                log.error_class = e.__class__.__name__
+            else:
+                if feature_hash is not None:
+                    setattr(obj, hash_field, feature_hash)
+
+                log.message = u'Feature imported successfully'
+                objects.append((obj, log))
+
+            logs.append(log)
+
+        adding = [obj._state.adding and obj.pk is None for obj, log in objects]
+
+        try:
+            with transaction.atomic():
+                self.save_objects([obj for obj, log in objects], mapping)
+                self.save_logs(logs)
+
+        except DatabaseError:
+            for (obj, log), is_new in zip(objects, adding):
+                if is_new:
+                    obj.pk = None
+
+            self.proccess_batch_row_by_row(objects, logs)
+
+        return len(logs), len([log for log in logs if not log.success])
+
+    def proccess_batch_row_by_row(self, objects, logs):
+        with transaction.atomic():
+            for obj, log in objects:
                 try:
-                    self.proccess_feature(feature, mapping)
-                except:
+                    with transaction.atomic():
+                        obj.save()
+                except DatabaseError as e:
                     log.message = u'An error occurred while saving the feature'
                     log.success = False
-                else:
-                    log.message = u'Feature imported successfully'
-                finally:
-                    log.shape_import = self.shape_import
-                    log.fid = feature.fid
-                    log.save()
+                    log.error_class = e.__class__.__name__
 
-        self.shape_import.finished = True
-        self.shape_import.save()
+            self.save_logs(logs)
+
+    def save_logs(self, logs):
+
+        """
+        Saves the logs of a batch. Unless log_mode is LOG_ALL,
+        only the failures are stored
+        """
+
+        if self.log_mode != LOG_ALL:
+            logs = [log for log in logs if not log.success]
+
+        self.shape_import.log_class.objects.bulk_create(logs)
+
+    def save_objects(self, objects, mapping):
+        manager = self.model.target_model.objects
+        new_objects = [obj for obj in objects if obj._state.adding]
+        changed_objects = [obj for obj in objects if not obj._state.adding]
+
+        if changed_objects:
+            pk_name = self.model.target_model._meta.pk.name
+            fields = [key for key in mapping
+                      if mapping[key] != DONT_IMPORT_KEY and key != pk_name]
+
+            if self.incremental:
+                fields.append(self.model.import_hash_field)
+
+            if hasattr(manager, 'bulk_update'):
+                manager.bulk_update(changed_objects, fields)
+            else:
+                for obj in changed_objects:
+                    obj.save(update_fields=fields)
+
+        manager.bulk_create(new_objects)
+
+    def get_feature_hash(self, feature, mapping):
+
+        """
+        Returns the sha1 of the mapped values of the feature and
+        the WKB of its geometry, as read from the shapefile
+        """
+
+        digest = hashlib.sha1()
+        for key in sorted(mapping):
+            name = mapping[key]
+            if name == DONT_IMPORT_KEY:
+                continue
+
+            if name == FEATURE_GEOMETRY_KEY:
+                wkb = getattr(feature, 'wkb', None)
+                if wkb is None:
+                    wkb = feature.geom.wkb
+                value = bytes(wkb)
+            else:
+                value = self.get_feature_value(feature, name)
+                value = b'\0' if value is None else force_text(value).encode('utf-8')
+
+            digest.update(key.encode('utf-8') + b'\0' + value + b'\0')
+
+        return digest.hexdigest()
+
+    def skip_unchanged(self, features, mapping):
+
+        """
+        Compares the hashes of a batch of features with the ones
+        stored in the rows they reference, with a single query.
+        Returns the changed features, their hashes and the logs
+        of the unchanged ones
+        """
+
+        hashes = []
+        pks = []
+        for feature in features:
+            try:
+                hashes.append(self.get_feature_hash(feature, mapping))
+                pks.append(self.get_feature_pk(feature, mapping))
+            except Exception:
+                # the feature will fail again while being built
+                hashes.append(None)
+                pks.append(None)
+
+        stored = dict(self.model.target_model.objects
+                          .filter(pk__in=[pk for pk in pks if pk is not None])
+                          .values_list('pk', self.model.import_hash_field))
+
+        changed = []
+        changed_hashes = []
+        logs = []
+        for feature, feature_hash, pk in zip(features, hashes, pks):
+            if feature_hash is not None and stored.get(pk) == feature_hash:
+                log = self.build_log(feature)
+                log.message = u'Feature unchanged'
+                logs.append(log)
+            else:
+                changed.append(feature)
+                changed_hashes.append(feature_hash)
+
+        return changed, changed_hashes, logs
+
+    def remember_pks(self, features, mapping):
+
+        """
+        Keeps the primary keys referenced by a batch of features,
+        so the missing rows can be deleted without reading the
+        shapefile again
+        """
+
+        for feature in features:
+            try:
+                pk = self.get_feature_pk(feature, mapping)
+            except Exception:
+                continue
+
+            if pk is not None:
+                self.seen_pks.add(pk)
+
+    def delete_missing_objects(self):
+
+        """
+        Deletes the rows of the target model that weren't referenced
+        by any feature of the import. The table is walked in batches,
+        by primary key, so only the keys seen by the import are kept
+        in memory. Returns the number of deleted rows
+        """
+
+        manager = self.model.target_model.objects
+        deleted = 0
+        last_pk = None
+
+        while True:
+            queryset = manager.order_by('pk')
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+
+            pks = list(queryset.values_list('pk', flat=True)[:self.import_batch_size])
+            if not pks:
+                break
+
+            last_pk = pks[-1]
+            missing = [pk for pk in pks if pk not in self.seen_pks]
+            if missing:
+                manager.filter(pk__in=missing).delete()
+                deleted += len(missing)
+
+        return deleted
+
+    def get_feature_pk(self, feature, mapping):
+
+        """
+        Returns the value of the primary key of the target
+        model in the feature, or None if it isn't mapped
+        """
+
+        pk = self.model.target_model._meta.pk
+
+        if mapping.get(pk.name, DONT_IMPORT_KEY) == DONT_IMPORT_KEY:
+            return None
+
+        return pk.to_python(self.get_feature_value(feature, mapping[pk.name]))
+
+    def get_existing_objects(self, features, mapping):
+
+        """
+        Loads, with a single query, the objects of the target
+        model referenced by the features of a batch
+        """
+
+        pk_name = self.model.target_model._meta.pk.name
+
+        if mapping.get(pk_name, DONT_IMPORT_KEY) == DONT_IMPORT_KEY:
+            return {}
+
+        pks = []
+        for feature in features:
+            try:
+                pks.append(self.get_feature_pk(feature, mapping))
+            except Exception:
+                # the feature will fail again while being built
+                continue
+
+        return self.model.target_model.objects.in_bulk(pks)
+
+    def build_log(self, feature):
+        log = self.shape_import.log_class()
+        log.shape_import = self.shape_import
+        log.fid = feature.fid
+        return log
+
+    def get_feature_value(self, feature, name):
+        value = feature[name]
+        return getattr(value, 'value', value)
+
+    def build_object(self, feature, mapping, existing=None, geometry=None):
+
+        """
+        Returns the (unsaved) object of the target model
+        with the values of the feature. `existing` holds the
+        objects already loaded for the batch, by primary key,
+        and `geometry` the converted geometry of the feature
+        """
 
-    def proccess_feature(self, feature, mapping):
         target_model = self.model.target_model
-        pk_name = target_model._meta.pk.name
 
         obj = None
-        if pk_name in mapping:
-            obj = target_model.objects.get(pk=feature[mapping[pk_name]])
+        pk = self.get_feature_pk(feature, mapping)
+        if pk is not None:
+            if existing is None:
+                existing = target_model.objects.in_bulk([pk])
+
+            obj = existing.get(pk)
+
+            if obj is None and not (self.upsert or self.incremental):
+                raise target_model.DoesNotExist
 
         if not obj:
             obj = target_model()
 
         for key in mapping:
-            if mapping[key] != DONT_IMPORT_KEY:
-                # if mapping[key] == FEATURE_GEOMETRY_KEY:
-                #    setattr(obj, key, feature.geom.wkt)
-                # else
-                
-                setattr(obj, key, feature[mapping[key]])
+            if mapping[key] == DONT_IMPORT_KEY:
+                continue
+
+            if mapping[key] == FEATURE_GEOMETRY_KEY:
+                if geometry is None:
+                    geometry = self.convert_geometries([feature], mapping)[0]
 
+                if isinstance(geometry, Exception):
+                    raise geometry
+
+                setattr(obj, key, geometry)
+            else:
+                setattr(obj, key, self.get_feature_value(feature, mapping[key]))
+
+        return obj
+
+    def proccess_feature(self, feature, mapping):
+        obj = self.build_object(feature, mapping)
         obj.save()
@@ -0,0 +1,126 @@
+# coding: utf-8
+import glob
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.contrib.gis.geos import Point
+from django.core.files import File
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+
+from shape_engine import ENGINE_DIRECT
+from shape_engine.engine import ShapefileWriter
+from shape_engine.shapeimport.views import ShapeImportFieldsView
+from shape_engine.tests.models import Place, PlaceImport, PlaceImportLog, Site
+
+
+class ListQuerySet(list):
+
+    """
+    Unsaved objects standing for a queryset of their model
+    """
+
+    db = DEFAULT_DB_ALIAS
+
+    def __init__(self, model, objects):
+        super(ListQuerySet, self).__init__(objects)
+        self.model = model
+
+    def iterator(self):
+        return iter(self)
+
+
+def write_shapefile(directory, sites, name='places', out_srid=None):
+
+    """
+    Writes the sites to a shapefile with the direct engine,
+    and zips its components together. Returns the zip path
+    """
+
+    writer = ShapefileWriter.create(engine=ENGINE_DIRECT)
+    paths = writer.write_records(ListQuerySet(Site, sites), ['name', 'num'], Site._meta.get_field('geom'),
+                                 os.path.join(directory, name + '.shp'), out_srid=out_srid)
+
+    zip_path = os.path.join(directory, name + '_upload.zip')
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for path in glob.glob(os.path.splitext(paths[0])[0] + '.*'):
+            archive.write(path, os.path.basename(path))
+
+    return zip_path
+
+
+class ModelsMixIn(object):
+
+    """
+    Creates the tables of the test models, which
+    belong to no migration
+    """
+
+    models = ()
+
+    @classmethod
+    def setUpClass(cls):
+        with connection.schema_editor() as editor:
+            for model in cls.models:
+                editor.create_model(model)
+
+        super(ModelsMixIn, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(ModelsMixIn, cls).tearDownClass()
+
+        with connection.schema_editor() as editor:
+            for model in reversed(cls.models):
+                editor.delete_model(model)
+
+
+class ImportMixIn(ModelsMixIn):
+
+    """
+    Imports shapefiles of sites into places, with
+    the uploads saved to a temporary MEDIA_ROOT
+    """
+
+    models = (Place, PlaceImport, PlaceImportLog)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.media = override_settings(MEDIA_ROOT=self.directory)
+        self.media.enable()
+
+    def tearDown(self):
+        self.media.disable()
+        shutil.rmtree(self.directory)
+
+    def get_sites(self, count, codes=None):
+        codes = codes or range(count)
+        return [Site(pk=i + 1, name=u'site %d' % i, num=code, geom=Point(i, -i, srid=4326))
+                for i, code in zip(range(count), codes)]
+
+    def get_view(self, sites, view_class=None, **kwargs):
+        path = write_shapefile(self.directory, sites)
+
+        shape_import = PlaceImport()
+        with open(path, 'rb') as upload:
+            shape_import.shapefile.save('places.zip', File(upload))
+
+        view = (view_class or ShapeImportFieldsView)(model=PlaceImport, **kwargs)
+        view.prepare_import(shape_import.pk)
+        return view
+
+    def run_import(self, sites, mapping, **kwargs):
+        view = self.get_view(sites, **kwargs)
+        view.proccess_shape_data(mapping)
+        return view.shape_import
+
+
+class ImportTestCase(ImportMixIn, TestCase):
+    pass
+
+
+class ImportTransactionTestCase(ImportMixIn, TransactionTestCase):
+    pass
@@ -0,0 +1,83 @@
+# coding: utf-8
+import unittest
+
+from django.db import connection
+from django.test.utils import override_settings
+
+from shape_engine.shapeimport.backends import ParallelImportBackend, PostgisCopyImportBackend
+from shape_engine.shapeimport.forms import DONT_IMPORT_KEY
+from shape_engine.shapeimport.models import STATUS_FAILED, STATUS_FINISHED
+from shape_engine.tests import ImportTestCase, ImportTransactionTestCase
+from shape_engine.tests.models import Place, PlaceImport, PlaceImportLog
+
+
+@unittest.skipUnless(getattr(connection.ops, 'postgis', False), 'the COPY backend needs PostGIS')
+class PostgisCopyImportBackendTestCase(ImportTestCase):
+
+    mapping = {'id': DONT_IMPORT_KEY, 'name': 'name', 'code': 'num'}
+
+    def test_import(self):
+
+        shape_import = self.run_import(self.get_sites(12), self.mapping,
+                                       import_backend_class=PostgisCopyImportBackend)
+
+        self.assertEquals(12, shape_import.processed_features)
+        self.assertEquals(0, shape_import.failed_features)
+        self.assertEquals(list(range(12)), list(Place.objects.order_by('code').values_list('code', flat=True)))
+
+    def test_constraint_fallback(self):
+
+        # neither the duplicate code nor the code out of the range of
+        # the column are caught by the validation, so the batches
+        # holding them go through the ORM
+        class Backend(PostgisCopyImportBackend):
+            copy_batch_size = 4
+
+        codes = [0, 1, 2, 3, 4, 5, 4, 7, 8, 9, 9999999999, 11]
+        shape_import = self.run_import(self.get_sites(12, codes), self.mapping, import_backend_class=Backend)
+
+        self.assertEquals(12, shape_import.processed_features)
+        self.assertEquals(2, shape_import.failed_features)
+        self.assertEquals(10, Place.objects.count())
+        self.assertEquals([6, 10], list(PlaceImportLog.objects.filter(success=False)
+                                                              .order_by('fid')
+                                                              .values_list('fid', flat=True)))
+
+
+class ParallelImportBackendTestCase(ImportTestCase):
+
+    def test_transaction(self):
+
+        view = self.get_view(self.get_sites(3), import_backend_class=ParallelImportBackend)
+
+        self.assertRaises(ValueError, view.proccess_shape_data,
+                          {'id': DONT_IMPORT_KEY, 'name': 'name', 'code': 'num'})
+        self.assertEquals(STATUS_FAILED, PlaceImport.objects.get(pk=view.shape_import.pk).status)
+        self.assertEquals(0, Place.objects.count())
+
+
+@override_settings(SHAPEIMPORT_PROCESSES=2)
+class ParallelImportTestCase(ImportTransactionTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # the test database, created by now, and not the
+        # configured one, which may be on disk when this isn't
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise unittest.SkipTest('the processes need the database on disk')
+
+        super(ParallelImportTestCase, cls).setUpClass()
+
+    def test_import(self):
+
+        shape_import = self.run_import(self.get_sites(12), {'id': DONT_IMPORT_KEY, 'name': 'name', 'code': 'num'},
+                                       import_batch_size=3, import_backend_class=ParallelImportBackend)
+
+        self.assertEquals(STATUS_FINISHED, shape_import.status)
+        self.assertEquals(12, shape_import.processed_features)
+        self.assertEquals(list(range(12)), list(Place.objects.order_by('code').values_list('code', flat=True)))
+        self.assertEquals(list(range(12)), list(PlaceImportLog.objects.order_by('fid').values_list('fid', flat=True)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.contrib.gis.gdal import DataSource
+from django.contrib.gis.geos import Point
+from django.core.cache import caches
+
+from shape_engine.shapeimport.cache import StagedFeature, StagedShapefile, StagingCache
+from shape_engine.tests import write_shapefile
+from shape_engine.tests.models import Site
+
+
+class StagedShapefileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        sites = [Site(pk=i + 1, name=u'site %d' % i, num=i, geom=Point(i, i, srid=4326))
+                 for i in range(10)]
+        write_shapefile(self.directory, sites)
+        self.layer = DataSource(os.path.join(self.directory, 'places.shp'))[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_metadata(self):
+
+        staged = StagedShapefile.from_layer('key', self.layer)
+
+        self.assertEquals(['name', 'num'], staged.fields)
+        self.assertEquals(10, staged.num_feat)
+        self.assertEquals('Point', staged.geom_type)
+        self.assertIsNone(staged.features)
+        self.assertFalse(staged.validated)
+
+    def test_features(self):
+
+        staged = StagedShapefile.from_layer('key', self.layer, load_features=True)
+
+        self.assertTrue(staged.validated)
+        self.assertEquals(list(range(10)), [feature.fid for feature in staged.features])
+        self.assertEquals(u'site 3', staged.features[3]['name'])
+        self.assertEquals((3, 3), staged.features[3].geom.tuple)
+
+    def test_max_size(self):
+
+        size = StagedShapefile.from_layer('key', self.layer, load_features=True).size
+
+        # the features are dropped as soon as they pass the limit,
+        # but every geometry is still read
+        staged = StagedShapefile.from_layer('key', self.layer, load_features=True, max_size=size // 2)
+        self.assertIsNone(staged.features)
+        self.assertTrue(staged.validated)
+
+        cache = StagingCache(max_size=size // 2, cache_alias=None)
+        cache.set('key', staged)
+        self.assertIs(staged, cache.get('key'))
+
+
+class StagingCacheTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        caches['default'].clear()
+
+    def test_eviction(self):
+
+        cache = StagingCache(max_entries=2, cache_alias=None)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, StagedShapefile(key, [], [], 0, None, None, None))
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEquals('b', cache.get('b').key)
+
+        # b was used last, so c goes first
+        cache.set('d', StagedShapefile('d', [], [], 0, None, None, None))
+        self.assertIsNone(cache.get('c'))
+        self.assertEquals('b', cache.get('b').key)
+
+    def test_too_large(self):
+
+        staged = StagedShapefile('key', [], [], 1, None, None, None,
+                                 features=[StagedFeature(0, {}, b'\0' * 2000)])
+
+        # the metadata is kept without the features
+        cache = StagingCache(max_size=2000, cache_alias=None)
+        cache.set('key', staged)
+        self.assertIsNone(cache.get('key').features)
+
+    def test_shared(self):
+
+        staged = StagedShapefile('key', ['name'], ['OFTString'], 1, (0, 0, 1, 1), 'Point', None,
+                                 features=[StagedFeature(0, {'name': u'a'}, b'\0' * 21)], validated=True)
+
+        # the caches of two processes, sharing the Django cache
+        StagingCache().set('key', staged)
+        shared = StagingCache().get('key')
+
+        self.assertEquals(['name'], shared.fields)
+        self.assertEquals((0, 0, 1, 1), shared.extent)
+        self.assertTrue(shared.validated)
+        self.assertIsNone(shared.features)
+
+        StagingCache().delete('key')
+        self.assertIsNone(StagingCache().get('key'))
+
+
+if __name__ == '__main__':
+    unittest.main()
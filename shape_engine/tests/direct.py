@@ -0,0 +1,262 @@
+# coding: utf-8
+import datetime
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from django.db import models
+
+from shape_engine import ENGINE_DIRECT
+from shape_engine.direct import (
+    SHP_POINT,
+    SHP_POLYGON,
+    SHP_POLYLINE,
+    SHP_Z,
+    DbfField,
+    DbfWriter,
+    ShpWriter,
+    estimate_shp_record_size,
+    get_code_page,
+    get_wkb_size,
+    read_wkb,
+    wkb_to_geojson,
+)
+from shape_engine.engine import ShapefileWriter
+from shape_engine.field_map import FieldMapper
+from shape_engine.shapeimport.headers import (
+    read_shp_header,
+    read_dbf_header,
+    read_dbf_fields,
+    read_dbf_record,
+    read_shp_record,
+)
+
+
+def wkb_point(x, y, z=None):
+    if z is None:
+        return struct.pack('<BI2d', 1, 1, x, y)
+    return struct.pack('<BI3d', 1, 1001, x, y, z)
+
+
+def wkb_linestring(*points):
+    data = struct.pack('<BII', 1, 2, len(points))
+    for x, y in points:
+        data += struct.pack('<2d', x, y)
+    return data
+
+
+def wkb_polygon(*rings):
+    data = struct.pack('<BII', 1, 3, len(rings))
+    for ring in rings:
+        data += struct.pack('<I', len(ring))
+        for x, y in ring:
+            data += struct.pack('<2d', x, y)
+    return data
+
+
+def wkb_polygon_z(ring):
+    data = struct.pack('<BIII', 1, 1003, 1, len(ring))
+    for x, y, z in ring:
+        data += struct.pack('<3d', x, y, z)
+    return data
+
+
+class DirectTest(unittest.TestCase):
+
+    def test_read_wkb(self):
+
+        wkb_type, parts, end = read_wkb(wkb_point(1, 2, 3))
+        self.assertEquals(1, wkb_type)
+        self.assertEquals(29, end)
+        self.assertEquals((1.0, 2.0, 1.0, 2.0), parts[0][0].bounds())
+        self.assertEquals((3.0, 3.0), parts[0][0].z_bounds())
+
+        # big endian EWKB with a srid
+        ewkb = struct.pack('>BIi2d', 0, 0x20000001, 4326, 5, 6)
+        wkb_type, parts, end = read_wkb(ewkb)
+        self.assertEquals(1, wkb_type)
+        self.assertEquals(len(ewkb), end)
+        self.assertEquals((5.0, 6.0, 5.0, 6.0), parts[0][0].bounds())
+
+        self.assertRaises(ValueError, read_wkb, struct.pack('<BI', 1, 7))
+
+        # measures aren't taken for z
+        self.assertRaises(ValueError, read_wkb, struct.pack('<BI3d', 1, 2001, 1, 2, 3))
+        self.assertRaises(ValueError, read_wkb, struct.pack('<BI4d', 1, 3001, 1, 2, 3, 4))
+        self.assertRaises(ValueError, read_wkb, struct.pack('<BI3d', 1, 0x40000001, 1, 2, 3))
+
+    def test_wkb_to_geojson(self):
+
+        self.assertEquals({'type': 'Point', 'coordinates': [1.0, 2.0, 3.0]}, wkb_to_geojson(wkb_point(1, 2, 3)))
+        self.assertEquals({'type': 'Polygon', 'coordinates': [[[0.0, 0.0], [0.0, 1.0], [1.0, 0.0], [0.0, 0.0]]]},
+                          wkb_to_geojson(wkb_polygon([(0, 0), (0, 1), (1, 0), (0, 0)])))
+
+    def test_points(self):
+
+        shp, shx = io.BytesIO(), io.BytesIO()
+        writer = ShpWriter(shp, shx, SHP_POINT + SHP_Z)
+        writer.write(wkb_point(1, 2, 3))
+        writer.write(None)
+        writer.write(wkb_point(-1, 4))
+        writer.close()
+
+        header = read_shp_header(shp.getvalue()[:100])
+        self.assertEquals(len(shp.getvalue()), header['file_length'])
+        self.assertEquals(11, header['shape_type'])
+        self.assertEquals((-1.0, 2.0, 1.0, 4.0), header['bbox'])
+        self.assertEquals(100 + 3 * 8, len(shx.getvalue()))
+
+        offset, length = struct.unpack('>2i', shx.getvalue()[100:108])
+        self.assertEquals((50, 14), (offset, length))
+        record = shp.getvalue()[108:108 + 2 * length]
+        self.assertEquals({'shape_type': 11, 'bbox': (1.0, 2.0, 1.0, 2.0)}, read_shp_record(record))
+        self.assertEquals((3.0,), struct.unpack('<d', record[20:28]))
+
+    def test_mismatched_geometry(self):
+
+        shp, shx = io.BytesIO(), io.BytesIO()
+        writer = ShpWriter(shp, shx, SHP_POINT)
+
+        # a line would be written as a point of all its vertices
+        self.assertRaises(ValueError, writer.write, wkb_linestring((0, 0), (1, 1)))
+        self.assertRaises(ValueError, writer.write, wkb_linestring((0, 0)))
+
+        writer = ShpWriter(shp, shx, SHP_POLYLINE)
+        self.assertRaises(ValueError, writer.write, wkb_point(1, 1))
+
+    def test_restart(self):
+
+        shp, shx = io.BytesIO(), io.BytesIO()
+        writer = ShpWriter(shp, shx, SHP_POLYGON + SHP_Z)
+        writer.write(wkb_polygon_z([(0, 0, 5), (0, 1, 6), (1, 0, 7), (0, 0, 5)]))
+        writer.close()
+
+        next_shp, next_shx = io.BytesIO(), io.BytesIO()
+        writer.start(next_shp, next_shx)
+        writer.write(wkb_polygon_z([(2, 2, 1), (2, 3, 1), (3, 2, 2), (2, 2, 1)]))
+        writer.close()
+
+        self.assertEquals((0.0, 0.0, 1.0, 1.0), read_shp_header(shp.getvalue()[:100])['bbox'])
+        self.assertEquals((2.0, 2.0, 3.0, 3.0), read_shp_header(next_shp.getvalue()[:100])['bbox'])
+        self.assertEquals((1.0, 2.0), struct.unpack('<2d', next_shp.getvalue()[68:84]))
+        # the record numbers start over
+        self.assertEquals(1, struct.unpack('>i', next_shp.getvalue()[100:104])[0])
+
+    def test_record_size(self):
+
+        geometries = [(SHP_POINT, wkb_point(1, 2)),
+                      (SHP_POINT + SHP_Z, wkb_point(1, 2, 3)),
+                      (SHP_POLYGON, wkb_polygon([(0, 0), (0, 1), (1, 0), (0, 0)])),
+                      (SHP_POLYGON + SHP_Z, wkb_polygon_z([(0, 0, 1), (0, 1, 1), (1, 0, 1), (0, 0, 1)]))]
+
+        for shape_type, wkb in geometries:
+            record_size = 8 + len(ShpWriter(io.BytesIO(), io.BytesIO(), shape_type).pack(wkb))
+            self.assertTrue(record_size <= estimate_shp_record_size(len(wkb), shape_type))
+            self.assertTrue(record_size <= estimate_shp_record_size(len(wkb)))
+            self.assertEquals(len(wkb), get_wkb_size(wkb_to_geojson(wkb)))
+
+    def test_spatial_index(self):
+
+        directory = tempfile.mkdtemp()
+        base_name = os.path.join(directory, 'points')
+
+        try:
+            with open(base_name + '.shp', 'wb') as shp, open(base_name + '.shx', 'wb') as shx, \
+                    open(base_name + '.dbf', 'wb') as dbf:
+                shp_writer = ShpWriter(shp, shx, SHP_POINT)
+                dbf_writer = DbfWriter(dbf, [DbfField('id', 'N', 4)], 'utf-8')
+                for index in range(100):
+                    shp_writer.write(wkb_point(index % 10, index // 10))
+                    dbf_writer.write([index])
+                shp_writer.close()
+                dbf_writer.close()
+
+            writer = ShapefileWriter.create(engine=ENGINE_DIRECT)
+            writer._create_spatial_indexes([base_name + '.shp'])
+
+            self.assertTrue(os.path.getsize(base_name + '.qix') > 0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_polygon_orientation(self):
+
+        shp, shx = io.BytesIO(), io.BytesIO()
+        writer = ShpWriter(shp, shx, SHP_POLYGON)
+        # counterclockwise outer ring and clockwise hole
+        writer.write(wkb_polygon([(0, 0), (4, 0), (4, 4), (0, 4), (0, 0)],
+                                 [(1, 1), (1, 2), (2, 2), (2, 1), (1, 1)]))
+        writer.close()
+
+        record = shp.getvalue()[108:]
+        num_parts, num_points = struct.unpack('<2i', record[36:44])
+        self.assertEquals((2, 10), (num_parts, num_points))
+        self.assertEquals((0, 5), struct.unpack('<2i', record[44:52]))
+
+        points = struct.unpack('<20d', record[52:212])
+        self.assertEquals((0.0, 0.0, 0.0, 4.0), points[:4])
+        self.assertEquals((1.0, 1.0, 2.0, 1.0), points[10:14])
+
+        self.assertRaises(ValueError, writer.write, wkb_point(1, 1))
+
+    def test_dbf(self):
+
+        fields = [DbfField('name', 'C', 6),
+                  DbfField('count', 'N', 4),
+                  DbfField('ratio', 'N', 8, 3),
+                  DbfField('day', 'D', 8)]
+
+        dbf = io.BytesIO()
+        writer = DbfWriter(dbf, fields, 'utf-8')
+        writer.write([u'caf\xe9', 12, 0.5, datetime.date(1890, 1, 2)])
+        writer.write([None, 123456, None, None])
+        writer.close()
+
+        data = dbf.getvalue()
+        header = read_dbf_header(data[:32])
+        header_length = header['header_length']
+        record_length = header['record_length']
+        self.assertEquals({'num_records': 2, 'header_length': 161, 'record_length': 27}, header)
+        self.assertEquals(b'\x1a', data[-1:])
+
+        read_fields = read_dbf_fields(data[32:header_length])
+        self.assertEquals([('name', 'C', 6, 0), ('count', 'N', 4, 0),
+                           ('ratio', 'N', 8, 3), ('day', 'D', 8, 0)], read_fields)
+
+        record = read_dbf_record(data[header_length:header_length + record_length], read_fields, 'utf-8')
+        self.assertEquals({'name': u'caf\xe9', 'count': 12, 'ratio': 0.5,
+                           'day': datetime.date(1890, 1, 2)}, record)
+
+        # numbers wider than the field are starred out
+        second = data[header_length + record_length:header_length + 2 * record_length]
+        self.assertEquals(b'****', second[7:11])
+
+    def test_truncate(self):
+
+        field = DbfField('name', 'C', 4)
+
+        self.assertEquals(b'caf ', field.format(u'caf\xe9s', 'utf-8'))
+        self.assertEquals(b'caf\xe9', field.format(u'caf\xe9s', 'latin-1'))
+        self.assertEquals(u'\u65e5'.encode('utf-8') + b' ', field.format(u'\u65e5\u672c', 'utf-8'))
+
+    def test_choices(self):
+
+        field = models.IntegerField(name='status', choices=((1, u'Active'), (2, u'Retired')))
+
+        dbf_field = FieldMapper.create(ENGINE_DIRECT).map_fields([field], choice_display=True).get_direct_schema()[0]
+        self.assertEquals(('C', 7), (dbf_field.type, dbf_field.length))
+        self.assertEquals(b'Active ', dbf_field.format(u'Active', 'utf-8'))
+
+        dbf_field = FieldMapper.create(ENGINE_DIRECT).map_fields([field]).get_direct_schema()[0]
+        self.assertEquals(('N', 11), (dbf_field.type, dbf_field.length))
+
+    def test_code_page(self):
+
+        self.assertEquals('UTF-8', get_code_page('utf8'))
+        self.assertEquals('ISO-8859-1', get_code_page('latin-1'))
+        self.assertEquals('1252', get_code_page('cp1252'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.contrib.gis.gdal import DataSource
+from django.contrib.gis.geos import Point
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from shape_engine import (
+    ENGINE_CTYPES,
+    ENGINE_DIRECT,
+    ENGINE_FIONA,
+    ENGINE_NATIVE,
+    engines,
+)
+from shape_engine.engine import ShapefileWriter
+from shape_engine.functions import get_as_wkb_function
+from shape_engine.tests import ListQuerySet
+from shape_engine.tests.models import Site, Site3D
+
+
+def get_engines():
+    return [name for name in (ENGINE_FIONA, ENGINE_NATIVE, ENGINE_CTYPES, ENGINE_DIRECT)
+            if engines.is_available(name)]
+
+
+@unittest.skipIf(get_as_wkb_function(DEFAULT_DB_ALIAS) is not None,
+                 'the geometries are fetched by a spatial query')
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def export(self, engine, queryset, attributes=('name',), **kwargs):
+        path = os.path.join(self.directory, '%s_%d.shp' % (engine.lower(), len(os.listdir(self.directory))))
+        writer = ShapefileWriter.create(engine=engine)
+        geofield = queryset.model._meta.get_field('geom')
+        paths = writer.write_records(queryset, list(attributes), geofield, path, **kwargs)
+        return DataSource(paths[0])[0]
+
+    def test_dimensions(self):
+
+        sites = ListQuerySet(Site, [Site(pk=1, name=u'a', geom=Point(1, 2, srid=4326))])
+        sites3d = ListQuerySet(Site3D, [Site3D(pk=1, name=u'a', geom=Point(1, 2, 3, srid=4326))])
+
+        for engine in get_engines():
+            layer = self.export(engine, sites, dimensions=3)
+            self.assertEquals('Point25D', layer.geom_type.name, engine)
+            self.assertEquals(3, layer[0].geom.coord_dim, engine)
+            self.assertEquals((1, 2, 0), layer[0].geom.tuple, engine)
+
+            layer = self.export(engine, sites3d, dimensions=2)
+            self.assertEquals('Point', layer.geom_type.name, engine)
+            self.assertEquals(2, layer[0].geom.coord_dim, engine)
+            self.assertEquals((1, 2), layer[0].geom.tuple, engine)
+
+            layer = self.export(engine, sites3d)
+            self.assertEquals('Point25D', layer.geom_type.name, engine)
+            self.assertEquals((1, 2, 3), layer[0].geom.tuple, engine)
+
+    def test_choices(self):
+
+        sites = ListQuerySet(Site, [Site(pk=1, name=u'a', status=1, geom=Point(1, 2, srid=4326)),
+                                    Site(pk=2, name=u'b', status=2, geom=Point(3, 4, srid=4326))])
+
+        for engine in get_engines():
+            layer = self.export(engine, sites, attributes=('name', 'status'))
+            self.assertEquals([u'Active', u'Retired'], layer.get_fields('status'), engine)
+
+            layer = self.export(engine, sites, attributes=('name', 'status'), choice_display=False)
+            self.assertEquals([1, 2], layer.get_fields('status'), engine)
+
+    def test_pipelined_in_transaction(self):
+
+        sites = ListQuerySet(Site, [Site(pk=1, name=u'a', geom=Point(1, 2, srid=4326))])
+        path = os.path.join(self.directory, 'pipelined.shp')
+        writer = ShapefileWriter.create(engine=ENGINE_DIRECT)
+
+        writer.write_records(sites, ['name'], Site._meta.get_field('geom'), path, pipelined=True)
+        self.assertTrue(writer.pipelined)
+
+        # the reader thread wouldn't see the changes of the transaction
+        with transaction.atomic():
+            writer.write_records(sites, ['name'], Site._meta.get_field('geom'), path, pipelined=True)
+            self.assertFalse(writer.pipelined)
+
+        self.assertEquals([u'a'], DataSource(path)[0].get_fields('name'))
+
+    def test_ogr_features(self):
+
+        # the features filled again for every item get new fids
+        sites = ListQuerySet(Site, [Site(pk=i, name=u'site %d' % i, num=i * 10, geom=Point(i, i, srid=4326))
+                                    for i in range(1, 4)])
+
+        for engine in (ENGINE_NATIVE, ENGINE_CTYPES):
+            if not engines.is_available(engine):
+                continue
+
+            layer = self.export(engine, sites, attributes=('name', 'num'))
+            self.assertEquals([0, 1, 2], [feature.fid for feature in layer], engine)
+            self.assertEquals([u'site 1', u'site 2', u'site 3'], layer.get_fields('name'), engine)
+            self.assertEquals([10, 20, 30], layer.get_fields('num'), engine)
+            self.assertEquals([(1, 1), (2, 2), (3, 3)], [geom.tuple for geom in layer.get_geoms()], engine)
+
+    def test_big_integers(self):
+
+        sites = ListQuerySet(Site, [Site(pk=1, name=u'a', big=2 ** 40 + 1, geom=Point(1, 2, srid=4326)),
+                                    Site(pk=2, name=u'b', big=-2 ** 33, geom=Point(3, 4, srid=4326))])
+
+        for engine in get_engines():
+            layer = self.export(engine, sites, attributes=('name', 'big'))
+            self.assertEquals([2 ** 40 + 1, -2 ** 33], layer.get_fields('big'), engine)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# coding: utf-8
+import datetime
+import struct
+import unittest
+
+from shape_engine.shapeimport.exceptions import CompressedShapeError
+from shape_engine.shapeimport.headers import (
+    read_shp_header,
+    read_dbf_header,
+    read_dbf_fields,
+    read_dbf_record,
+    read_shp_record,
+    get_ogr_field_type,
+    get_dbf_encoding,
+    check_consistency,
+)
+
+
+def shp_header(file_length, shape_type=1):
+    return (struct.pack('>i', 9994) + b'\0' * 20 +
+            struct.pack('>i', file_length // 2) +
+            struct.pack('<2i', 1000, shape_type) +
+            struct.pack('<8d', 0, 0, 1, 1, 0, 0, 0, 0))
+
+
+def dbf_header(num_records, header_length=65, record_length=11):
+    return (b'\x03\x01\x01\x01' +
+            struct.pack('<IHH', num_records, header_length, record_length) +
+            b'\0' * 20)
+
+
+class HeadersTestCase(unittest.TestCase):
+
+    def test_read_shp_header(self):
+
+        header = read_shp_header(shp_header(156, shape_type=5))
+
+        self.assertEquals(156, header['file_length'])
+        self.assertEquals(5, header['shape_type'])
+        self.assertEquals((0, 0, 1, 1), header['bbox'])
+
+    def test_read_shp_header_invalid(self):
+
+        self.assertRaises(CompressedShapeError, read_shp_header, b'\0' * 100)
+
+    def test_read_dbf_header(self):
+
+        header = read_dbf_header(dbf_header(2))
+
+        self.assertEquals(2, header['num_records'])
+        self.assertEquals(65, header['header_length'])
+        self.assertEquals(11, header['record_length'])
+
+    def test_check_consistency(self):
+
+        # two points: 28 bytes per record
+        shx_tail = struct.pack('>2i', 64, 10)
+
+        num_shapes = check_consistency(read_shp_header(shp_header(156)), 156,
+                                       read_shp_header(shp_header(116)), 116, shx_tail,
+                                       read_dbf_header(dbf_header(2)), 87)
+
+        self.assertEquals(2, num_shapes)
+
+    def test_check_consistency_truncated_shp(self):
+
+        shx_tail = struct.pack('>2i', 64, 10)
+
+        self.assertRaises(CompressedShapeError, check_consistency,
+                          read_shp_header(shp_header(156)), 140,
+                          read_shp_header(shp_header(116)), 116, shx_tail,
+                          read_dbf_header(dbf_header(2)), 87)
+
+    def test_check_consistency_record_count(self):
+
+        shx_tail = struct.pack('>2i', 64, 10)
+
+        self.assertRaises(CompressedShapeError, check_consistency,
+                          read_shp_header(shp_header(156)), 156,
+                          read_shp_header(shp_header(116)), 116, shx_tail,
+                          read_dbf_header(dbf_header(3)), 98)
+
+    def test_read_dbf_fields(self):
+
+        data = (b'NAME\0\0\0\0\0\0\0C' + b'\0' * 4 + struct.pack('<BB', 10, 0) + b'\0' * 14 +
+                b'AREA\0\0\0\0\0\0\0N' + b'\0' * 4 + struct.pack('<BB', 12, 3) + b'\0' * 14 +
+                b'\x0d')
+
+        self.assertEquals([(u'NAME', u'C', 10, 0), (u'AREA', u'N', 12, 3)],
+                          read_dbf_fields(data))
+
+    def test_read_dbf_record(self):
+
+        fields = [(u'NAME', u'C', 6, 0), (u'NUM', u'N', 4, 0),
+                  (u'AREA', u'N', 6, 2), (u'DAY', u'D', 8, 0), (u'OK', u'L', 1, 0)]
+        data = b' ' + u'caf\xe9  '.encode('latin-1') + b'  12' + b'      ' + b'20200102' + b'T'
+
+        self.assertEquals({u'NAME': u'caf\xe9', u'NUM': 12, u'AREA': None,
+                           u'DAY': datetime.date(2020, 1, 2), u'OK': True},
+                          read_dbf_record(data, fields))
+
+    def test_get_ogr_field_type(self):
+
+        self.assertEquals('OFTString', get_ogr_field_type('C', 10, 0))
+        self.assertEquals('OFTInteger', get_ogr_field_type('N', 9, 0))
+        self.assertEquals('OFTInteger64', get_ogr_field_type('N', 12, 0))
+        self.assertEquals('OFTReal', get_ogr_field_type('N', 12, 3))
+        self.assertEquals('OFTDate', get_ogr_field_type('D', 8, 0))
+
+    def test_get_dbf_encoding(self):
+
+        self.assertEquals('utf-8', get_dbf_encoding(b'UTF-8\n'))
+        self.assertEquals('cp1252', get_dbf_encoding(b'1252'))
+        self.assertEquals('latin-1', get_dbf_encoding(b'unknown'))
+        self.assertEquals('latin-1', get_dbf_encoding(None))
+
+    def test_read_shp_record(self):
+
+        point = read_shp_record(struct.pack('<i2d', 1, 2, 3))
+        polygon = read_shp_record(struct.pack('<i4d', 5, 0, 0, 1, 1))
+
+        self.assertEquals((2, 3, 2, 3), point['bbox'])
+        self.assertEquals((0, 0, 1, 1), polygon['bbox'])
+        self.assertEquals(None, read_shp_record(struct.pack('<i', 0))['bbox'])
+
+if __name__ == '__main__':
+    unittest.main()
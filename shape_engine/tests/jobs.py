@@ -0,0 +1,88 @@
+# coding: utf-8
+import json
+import logging
+import threading
+import unittest
+
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from shape_engine.shapeimport.forms import DONT_IMPORT_KEY
+from shape_engine.shapeimport.jobs import ThreadPoolJobRunner, logger
+from shape_engine.shapeimport.models import STATUS_FINISHED
+from shape_engine.shapeimport.views import ShapeImportProgressView
+from shape_engine.tests import ImportTestCase
+from shape_engine.tests.models import Place, PlaceImport
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+        self.emitted = threading.Event()
+
+    def emit(self, record):
+        self.records.append(record)
+        self.emitted.set()
+
+
+class ThreadPoolJobRunnerTestCase(unittest.TestCase):
+
+    def test_error(self):
+
+        handler = RecordingHandler()
+        logger.addHandler(handler)
+        try:
+            ThreadPoolJobRunner().submit(fail, u'job failed')
+            self.assertTrue(handler.emitted.wait(10))
+        finally:
+            logger.removeHandler(handler)
+
+        record = handler.records[0]
+        self.assertEquals(logging.ERROR, record.levelno)
+        self.assertIs(ValueError, record.exc_info[0])
+
+    def test_on_error(self):
+
+        failures = []
+        done = threading.Event()
+
+        class Runner(ThreadPoolJobRunner):
+            def on_error(self, func, args):
+                failures.append((func, args))
+                done.set()
+
+        Runner().submit(fail, u'job failed')
+
+        self.assertTrue(done.wait(10))
+        self.assertEquals([(fail, (u'job failed',))], failures)
+
+
+@override_settings(SHAPEIMPORT_JOB_RUNNER='shape_engine.shapeimport.jobs.SynchronousJobRunner')
+class BackgroundImportTestCase(ImportTestCase):
+
+    def test_submit_import(self):
+
+        view = self.get_view(self.get_sites(7), import_batch_size=3)
+        view.submit_import({'id': DONT_IMPORT_KEY, 'name': 'name', 'code': 'num'})
+
+        self.assertEquals(7, Place.objects.count())
+
+        request = RequestFactory().get('/')
+        response = ShapeImportProgressView.as_view(model=PlaceImport)(request, pk=view.shape_import.pk)
+        progress = json.loads(response.content.decode('utf-8'))
+
+        self.assertEquals(STATUS_FINISHED, progress['status'])
+        self.assertEquals(7, progress['total_features'])
+        self.assertEquals(7, progress['processed_features'])
+        self.assertEquals(100, progress['progress'])
+        self.assertEquals(view.shape_import.get_detail_url(), progress['url'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# coding: utf-8
+from django.contrib.gis.db import models
+
+from shape_engine.shapeimport.models import (
+    ImportHashMixIn,
+    ShapeImportLogMixIn,
+    ShapeImportMixIn,
+)
+
+
+class Site(models.Model):
+
+    """
+    Exported from lists of unsaved objects, so the export
+    tests don't need a spatial database
+    """
+
+    class Meta:
+        app_label = 'shape_engine'
+        managed = False
+
+    name = models.CharField(max_length=20)
+    num = models.IntegerField(null=True)
+    big = models.BigIntegerField(null=True)
+    status = models.IntegerField(choices=((1, u'Active'), (2, u'Retired')), default=1)
+    geom = models.PointField(srid=4326)
+
+
+class Site3D(models.Model):
+
+    class Meta:
+        app_label = 'shape_engine'
+        managed = False
+
+    name = models.CharField(max_length=20)
+    geom = models.PointField(dim=3, srid=4326)
+
+
+class Shape(models.Model):
+
+    class Meta:
+        app_label = 'shape_engine'
+        managed = False
+
+    name = models.CharField(max_length=20)
+    geom = models.GeometryField(srid=4326)
+
+
+class Place(ImportHashMixIn):
+
+    """
+    Target of the imports, without a geometry
+    for the same reason
+    """
+
+    class Meta:
+        app_label = 'shape_engine'
+
+    name = models.CharField(max_length=20, null=True)
+    code = models.IntegerField(null=True, unique=True)
+
+
+class PlaceImportLog(ShapeImportLogMixIn):
+
+    class Meta(ShapeImportLogMixIn.Meta):
+        app_label = 'shape_engine'
+
+    shape_import = models.ForeignKey('PlaceImport', related_name='logs', on_delete=models.CASCADE)
+
+
+class PlaceImport(ShapeImportMixIn):
+
+    class Meta(ShapeImportMixIn.Meta):
+        app_label = 'shape_engine'
+
+    target_model = Place
+    log_class = PlaceImportLog
+
+    def get_detail_url(self):
+        return '/imports/%d/' % self.pk
+
+    def get_fields_url(self):
+        return '/imports/%d/fields/' % self.pk
+
+    def get_progress_url(self):
+        return '/imports/%d/progress/' % self.pk
@@ -0,0 +1,106 @@
+# coding: utf-8
+import threading
+import time
+import unittest
+
+from shape_engine.pipeline import Pipeline
+
+
+def double(value):
+    return value * 2
+
+
+def odd(value):
+    return value if value % 2 else None
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def test_stages(self):
+
+        pipeline = Pipeline(range(100), [double, odd], queue_size=3)
+        self.assertEquals([], list(pipeline))
+
+        pipeline = Pipeline(range(100), [odd, double], queue_size=3)
+        self.assertEquals([2 * i for i in range(1, 100, 2)], list(pipeline))
+
+    def test_stage_error(self):
+
+        def fail(value):
+            if value == 50:
+                raise ValueError('stage failed')
+            return value
+
+        pipeline = Pipeline(range(100), [fail], queue_size=3)
+        self.assertRaises(ValueError, list, pipeline)
+        self.assertEquals([], pipeline.threads)
+
+    def test_source_error(self):
+
+        def source():
+            yield 1
+            raise KeyError('source failed')
+
+        self.assertRaises(KeyError, list, Pipeline(source(), [double]))
+
+    def test_stage_exit(self):
+
+        def exit(value):
+            raise SystemExit(1)
+
+        self.assertRaises(SystemExit, list, Pipeline(range(10), [exit]))
+
+    def test_dead_stage(self):
+
+        class DeadPipeline(Pipeline):
+
+            # the stage ends without passing the end on
+            def _convert(self, stage, input, output):
+                pass
+
+        pipeline = DeadPipeline(range(10), [double], queue_size=3)
+        self.assertRaises(RuntimeError, list, pipeline)
+        self.assertEquals([], pipeline.threads)
+
+    def test_cancel(self):
+
+        read = []
+
+        def source():
+            for i in range(10000):
+                read.append(i)
+                yield i
+
+        pipeline = Pipeline(source(), [double], queue_size=2)
+        threads = threading.active_count()
+
+        for value in pipeline:
+            if value == 10:
+                break
+
+        pipeline.close()
+
+        # the bounded queues stopped the reader
+        self.assertTrue(len(read) < 20)
+        self.assertEquals(threads, threading.active_count())
+
+    def test_overlap(self):
+
+        def source():
+            for i in range(10):
+                time.sleep(0.02)
+                yield i
+
+        def convert(value):
+            time.sleep(0.02)
+            return value
+
+        started = time.time()
+        for value in Pipeline(source(), [convert]):
+            time.sleep(0.02)
+
+        # the three stages overlap instead of adding up to 0.6s
+        self.assertTrue(time.time() - started < 0.45)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# coding: utf-8
+import glob
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from django.contrib.gis.gdal import DataSource, GDALException
+from django.contrib.gis.geos import Point
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from shape_engine.shapeimport.util import ShapefileReader, ZipShapefileHandler
+from shape_engine.tests import write_shapefile
+from shape_engine.tests.models import Site
+
+
+class ShapefileReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        sites = [Site(pk=i + 1, name=u'site %d' % i, num=i, geom=Point(i, i, srid=4326))
+                 for i in range(3)]
+        self.path = write_shapefile(self.directory, sites)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_layer(self, reader):
+        layer = reader.datasource[0]
+
+        self.assertEquals(['name', 'num'], layer.fields)
+        self.assertEquals(3, layer.num_feat)
+        self.assertEquals([u'site 0', u'site 1', u'site 2'], layer.get_fields('name'))
+
+    def test_zip_on_disk(self):
+
+        with open(self.path, 'rb') as upload:
+            with ShapefileReader(File(upload, name=self.path)) as reader:
+                self.check_layer(reader)
+
+                self.assertEquals(u'/vsizip/{}/places.shp'.format(self.path), reader.datasource.name)
+                self.assertIsNone(reader._tmp_dir)
+
+    def test_zip_in_memory(self):
+
+        with open(self.path, 'rb') as upload:
+            data = upload.read()
+
+        reader = ShapefileReader(SimpleUploadedFile('places.zip', data, 'application/zip'))
+        with reader:
+            self.check_layer(reader)
+
+            path = reader.datasource.name
+            self.assertTrue(path.startswith('/vsizip//vsimem/'))
+            self.assertIsNone(reader._tmp_dir)
+
+        # the virtual file goes away with the reader
+        self.assertRaises(GDALException, DataSource, path)
+
+    def test_large_zip_in_memory(self):
+
+        with open(self.path, 'rb') as upload:
+            data = upload.read()
+
+        max_size = ZipShapefileHandler.MAX_IN_MEMORY_SIZE
+        ZipShapefileHandler.MAX_IN_MEMORY_SIZE = len(data) - 1
+        try:
+            reader = ShapefileReader(SimpleUploadedFile('places.zip', data, 'application/zip'))
+            with reader:
+                self.check_layer(reader)
+
+                # too large for memory, so it is extracted
+                tmp_dir = reader._tmp_dir
+                self.assertEquals(os.path.join(tmp_dir, 'places.shp'), reader.datasource.name)
+        finally:
+            ZipShapefileHandler.MAX_IN_MEMORY_SIZE = max_size
+
+        self.assertFalse(os.path.exists(tmp_dir))
+
+    def write_tar(self, name, mode):
+        path = os.path.join(self.directory, name)
+        with tarfile.open(path, mode) as archive:
+            for component in glob.glob(os.path.join(self.directory, 'places.*')):
+                archive.add(component, os.path.basename(component))
+        return path
+
+    def test_tar_on_disk(self):
+
+        path = self.write_tar('places.tar.gz', 'w:gz')
+
+        with open(path, 'rb') as upload:
+            with ShapefileReader(File(upload, name=path)) as reader:
+                self.check_layer(reader)
+
+                self.assertEquals(u'/vsitar/{}/places.shp'.format(path), reader.datasource.name)
+                self.assertIsNone(reader._tmp_dir)
+                self.assertEquals(3, reader.check_headers())
+
+    def test_tar_in_memory(self):
+
+        with open(self.write_tar('places.tar', 'w'), 'rb') as upload:
+            data = upload.read()
+
+        reader = ShapefileReader(SimpleUploadedFile('places.tar', data, 'application/x-tar'))
+        with reader:
+            # the members are read in place by the preview
+            preview = reader.preview(2)
+            self.assertEquals(['name', 'num'], preview.fields)
+            self.assertEquals([u'site 0', u'site 1'], [feature['values']['name'] for feature in preview.features])
+            self.assertIsNone(reader._tmp_dir)
+
+            # GDAL only reads tar files from the disk
+            self.check_layer(reader)
+            tmp_dir = reader._tmp_dir
+            self.assertEquals(os.path.join(tmp_dir, 'places.shp'), reader.datasource.name)
+
+        self.assertFalse(os.path.exists(tmp_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
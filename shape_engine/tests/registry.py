@@ -0,0 +1,198 @@
+# coding: utf-8
+import os
+import subprocess
+import sys
+import unittest
+
+from django.db import models
+
+from shape_engine import ENGINE_CTYPES, ENGINE_DIRECT, ENGINE_FIONA, ENGINE_PYOGRIO, ENGINES, engines, register_pyogrio
+from shape_engine.field_map import FieldMapper
+from shape_engine.formats import get_format
+from shape_engine.registry import EngineRegistry, module_exists
+
+HEAVY_MODULES = ('fiona', 'osgeo')
+
+
+def run_python(code):
+
+    """
+    Runs the code in a new interpreter, with the same
+    path as this one, and returns its output lines
+    """
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return output.decode('utf-8').splitlines()
+
+
+class RegistryTestCase(unittest.TestCase):
+
+    def test_import_is_lazy(self):
+
+        seconds, loaded = run_python(
+            "import sys, time\n"
+            "start = time.time()\n"
+            "import shape_engine\n"
+            "print(time.time() - start)\n"
+            "print(','.join(name for name in %r if name in sys.modules))" % (HEAVY_MODULES,)
+        )
+
+        self.assertEquals('', loaded)
+        self.assertTrue(float(seconds) < 2, "importing shape_engine took %ss" % seconds)
+
+    def test_availability_is_lazy(self):
+
+        loaded, = run_python(
+            "import sys\n"
+            "from shape_engine import engines\n"
+            "engines.available()\n"
+            "print(','.join(name for name in %r if name in sys.modules))" % (HEAVY_MODULES,)
+        )
+
+        self.assertEquals('', loaded)
+
+    def test_module_exists(self):
+
+        self.assertTrue(module_exists('os.path'))
+        self.assertFalse(module_exists('shape_engine_missing_module'))
+
+    def test_register(self):
+
+        registry = EngineRegistry()
+        registry.register('MISSING', requires=('shape_engine_missing_module',))
+        registry.register('PLAIN', mapping={})
+
+        self.assertEquals(['MISSING', 'PLAIN'], list(registry))
+        self.assertEquals(['PLAIN'], registry.available())
+        self.assertFalse(registry.is_available('MISSING'))
+        self.assertFalse(registry.is_available('UNKNOWN'))
+        self.assertEquals({}, registry.get_mapping('PLAIN'))
+        self.assertRaises(AttributeError, registry.get, 'UNKNOWN')
+
+    def test_select(self):
+
+        registry = EngineRegistry()
+        registry.register('SLOW', priority=0, options=('dimensions', 'split_geometry_types'))
+        registry.register('FAST', priority=10, options=('dimensions',), formats=('ESRI Shapefile', 'GPKG'))
+        registry.register('FASTEST', priority=20, requires=('shape_engine_missing_module',))
+
+        self.assertEquals(['FAST', 'SLOW'], registry.available())
+        self.assertEquals('FAST', registry.select(format='ESRI Shapefile', options=('dimensions',)))
+        self.assertEquals('SLOW', registry.select(options=('split_geometry_types',)))
+        self.assertEquals('FAST', registry.select(format='GPKG'))
+        self.assertRaises(AttributeError, registry.select, format='GeoJSON')
+
+    def test_select_capabilities(self):
+
+        registry = EngineRegistry()
+        registry.register('BUFFERED', priority=10)
+        registry.register('STREAMING', streaming=True)
+
+        self.assertEquals('BUFFERED', registry.select())
+        self.assertEquals('STREAMING', registry.select(streaming=True))
+
+    def test_select_geometry_type(self):
+
+        registry = EngineRegistry()
+        registry.register('SIMPLE', priority=10, geometry_types=('Point', 'Polygon'))
+        registry.register('ANY')
+
+        self.assertEquals('SIMPLE', registry.select(geometry_type='Point'))
+        self.assertEquals('ANY', registry.select(geometry_type='GeometryCollection'))
+        self.assertEquals('SIMPLE', registry.select())
+
+    def test_writer_class(self):
+
+        registry = EngineRegistry()
+        registry.register('PLAIN', writer='shape_engine.registry.EngineRegistry', mapper=EngineRegistry)
+
+        self.assertTrue(registry.get_writer_class('PLAIN') is EngineRegistry)
+        self.assertTrue(registry.get_mapper_class('PLAIN') is EngineRegistry)
+
+    def test_formats(self):
+
+        self.assertEquals(('shp', 'shx', 'prj', 'dbf'), get_format('ESRI Shapefile').components)
+        self.assertEquals(('cpg', 'qix'), get_format('ESRI Shapefile').optional_components)
+        self.assertTrue(get_format('ESRI Shapefile').zipped)
+        self.assertFalse(get_format('GPKG').zipped)
+        self.assertTrue(get_format('GPKG').single_transaction)
+        self.assertTrue(get_format('FlatGeobuf').streamable)
+        self.assertEquals(10, get_format('MapInfo File').field_name_length)
+
+    def test_default_engines(self):
+
+        self.assertEquals(ENGINE_FIONA, ENGINES[0])
+        self.assertTrue(ENGINE_CTYPES in ENGINES)
+        self.assertFalse(ENGINE_PYOGRIO in ENGINES)
+        self.assertFalse(ENGINE_PYOGRIO in engines)
+
+    def test_fiona_is_the_default(self):
+
+        fiona = engines.get(ENGINE_FIONA)
+        self.assertTrue(all(engines.get(name).priority < fiona.priority
+                            for name in engines if name != ENGINE_FIONA))
+
+        # the direct engine is chosen without Fiona
+        registry = EngineRegistry()
+        for name in engines:
+            if name != ENGINE_FIONA:
+                engine = engines.get(name)
+                registry.register(name, requires=engine.requires, priority=engine.priority,
+                                  formats=engine.formats, options=engine.options,
+                                  geometry_types=engine.geometry_types)
+
+        self.assertEquals(ENGINE_DIRECT, registry.select(format='ESRI Shapefile', geometry_type='Point'))
+
+
+class PyogrioTestCase(unittest.TestCase):
+
+    """
+    The pyogrio engine is registered on demand, and mapping
+    the fields doesn't need pyogrio itself
+    """
+
+    def setUp(self):
+        register_pyogrio()
+
+    def tearDown(self):
+        engines.unregister(ENGINE_PYOGRIO)
+
+    def test_below_fiona(self):
+
+        self.assertTrue(engines.get(ENGINE_PYOGRIO).priority < engines.get(ENGINE_FIONA).priority)
+
+    def test_pyogrio_mapping(self):
+
+        fields = [models.CharField(name='description_en', max_length=20),
+                  models.IntegerField(name='description_pt'),
+                  models.DateField(name='day')]
+        mapping = FieldMapper.create(ENGINE_PYOGRIO).map_fields(fields)
+
+        self.assertEquals([('descriptio', 'object'), ('descript_1', 'int64'), ('day', 'object')],
+                          mapping.get_pyogrio_schema())
+        self.assertEquals(None, mapping.get_fiona_schema())
+
+    def test_long_field_names(self):
+
+        # formats without a name limit keep the names whole
+        fields = [models.CharField(name='description_en', max_length=20),
+                  models.IntegerField(name='description_pt')]
+        mapping = FieldMapper.create(ENGINE_PYOGRIO).map_fields(fields, size=get_format('GPKG').field_name_length)
+
+        self.assertEquals(['description_en', 'description_pt'], mapping.get_field_out_names())
+
+    def test_choices(self):
+
+        # the labels aren't put in int64 columns
+        fields = [models.IntegerField(name='status', choices=((1, u'Active'), (2, u'Retired')))]
+
+        mapping = FieldMapper.create(ENGINE_PYOGRIO).map_fields(fields, choice_display=True)
+        self.assertEquals([('status', 'object')], mapping.get_pyogrio_schema())
+
+        mapping = FieldMapper.create(ENGINE_PYOGRIO).map_fields(fields)
+        self.assertEquals([('status', 'int64')], mapping.get_pyogrio_schema())
+
+
+if __name__ == '__main__':
+    unittest.main()
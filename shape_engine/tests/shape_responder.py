@@ -0,0 +1,82 @@
+# coding: utf-8
+import json
+import unittest
+import zipfile
+from io import BytesIO
+
+from django.contrib.gis.geos import LineString, Point
+from django.db import DEFAULT_DB_ALIAS
+from django.http import FileResponse, StreamingHttpResponse
+
+from shape_engine import ENGINE_FIONA, engines
+from shape_engine.functions import get_as_wkb_function
+from shape_engine.shape_responder import ShpResponder
+from shape_engine.tests import ListQuerySet
+from shape_engine.tests.models import Shape, Site
+
+
+@unittest.skipIf(get_as_wkb_function(DEFAULT_DB_ALIAS) is not None,
+                 'the geometries are fetched by a spatial query')
+@unittest.skipUnless(engines.is_available(ENGINE_FIONA), 'Fiona is not installed')
+class ShpResponderTestCase(unittest.TestCase):
+
+    def get_shapes(self):
+        return ListQuerySet(Shape, [Shape(pk=1, name=u'a', geom=Point(1, 2, srid=4326)),
+                                    Shape(pk=2, name=u'b', geom=LineString((1, 2), (3, 4), srid=4326))])
+
+    def test_single_file(self):
+
+        responder = ShpResponder(self.get_shapes(), file_name='shapes', engine=ENGINE_FIONA, format='GPKG',
+                                 promote_to_multi=True)
+        response = responder()
+
+        self.assertEquals('application/geopackage+sqlite3', response['Content-Type'])
+        self.assertEquals('attachment; filename=shapes.gpkg', response['Content-Disposition'])
+        response.close()
+
+    def test_split_files(self):
+
+        # one file per geometry type, zipped together
+        responder = ShpResponder(self.get_shapes(), file_name='shapes', engine=ENGINE_FIONA, format='GPKG',
+                                 split_geometry_types=True)
+        response = responder()
+
+        self.assertEquals('application/zip', response['Content-Type'])
+        self.assertEquals('attachment; filename=shapes.zip', response['Content-Disposition'])
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEquals(['shapes_linestring.gpkg', 'shapes_point.gpkg'], sorted(archive.namelist()))
+
+    def test_split_parts(self):
+
+        # the parts are zipped on disk and streamed from there
+        sites = ListQuerySet(Site, [Site(pk=i, name=u'site %d' % i, geom=Point(i, i, srid=4326))
+                                    for i in range(1, 21)])
+        response = ShpResponder(sites, file_name='sites', attribute_fields=['name'], max_size=400)()
+
+        self.assertTrue(isinstance(response, FileResponse))
+        self.assertEquals('attachment; filename=sites.zip', response['Content-Disposition'])
+
+        content = b''.join(response.streaming_content)
+        self.assertEquals(str(len(content)), response['Content-Length'])
+        names = zipfile.ZipFile(BytesIO(content)).namelist()
+        self.assertTrue(len([name for name in names if name.endswith('.shp')]) > 1)
+        self.assertTrue('sites.dbf' in names)
+        response.close()
+
+    def test_stream(self):
+
+        # the default engine streams the records rather than Fiona
+        sites = ListQuerySet(Site, [Site(pk=1, name=u'a', geom=Point(1, 2, srid=4326)),
+                                    Site(pk=2, name=u'b', geom=Point(3, 4, srid=4326))])
+        response = ShpResponder(sites, file_name='sites', attribute_fields=['name'], format='GeoJSONSeq')()
+
+        self.assertTrue(isinstance(response, StreamingHttpResponse))
+        self.assertEquals('attachment; filename=sites.geojsons', response['Content-Disposition'])
+
+        records = b''.join(response.streaming_content).split(b'\x1e')[1:]
+        self.assertEquals([u'a', u'b'], [json.loads(record.decode('utf-8'))['properties']['name']
+                                         for record in records])
+
+
+if __name__ == '__main__':
+    unittest.main()
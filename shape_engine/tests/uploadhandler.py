@@ -0,0 +1,58 @@
+# coding: utf-8
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.contrib.gis.geos import Point
+from django.test import RequestFactory
+
+from shape_engine.shapeimport.uploadhandler import HashingFileUploadHandler
+from shape_engine.shapeimport.util import ShapefileReader
+from shape_engine.tests import write_shapefile
+from shape_engine.tests.models import Site
+
+
+class HashingFileUploadHandlerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        sites = [Site(pk=i + 1, name=u'site %d' % i, num=i, geom=Point(i, i, srid=4326))
+                 for i in range(100)]
+        self.path = write_shapefile(self.directory, sites)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_upload(self):
+
+        with open(self.path, 'rb') as upload:
+            data = upload.read()
+            upload.seek(0)
+            request = RequestFactory().post('/', {'shapefile': upload})
+
+        handler = HashingFileUploadHandler(request)
+        # the upload arrives in several chunks
+        handler.chunk_size = 256
+        self.assertTrue(len(data) > 2 * handler.chunk_size)
+
+        request.upload_handlers = [handler]
+        upload = request.FILES['shapefile']
+
+        try:
+            # even small uploads are streamed to disk
+            self.assertTrue(os.path.isfile(upload.temporary_file_path()))
+            self.assertEquals(hashlib.sha1(data).hexdigest(), upload.content_hash)
+
+            with ShapefileReader(upload) as reader:
+                self.assertEquals(100, reader.datasource[0].num_feat)
+                self.assertEquals(u'/vsizip/{%s}/places.shp' % upload.temporary_file_path(),
+                                  reader.datasource.name)
+        finally:
+            upload.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,8 +8,18 @@ from django.contrib.gis.geos import (
     MultiPoint,
     MultiLineString,
     MultiPolygon,
+    GeometryCollection,
+)
+from shape_engine.utils import (
+    GeometryCoercer,
+    SizeLimit,
+    external_sort,
+    geohash,
+    get_hilbert_key,
+    get_part_path,
+    hilbert_index,
+    split_parts,
 )
-from shape_engine.utils import GeometryCoercer
 
 
 class GeometryCoercerTestCase(unittest.TestCase):
@@ -45,6 +55,16 @@ class GeometryCoercerTestCase(unittest.TestCase):
         self.assertTrue(point3d.hasz)
         self.assertEquals(10, point3d.z)
 
+    def test_coerce_point_already_2d(self):
+
+        c = GeometryCoercer()
+
+        point2d = Point(x=0, y=0, srid=4326)
+
+        coerced = c.coerce(point2d)
+
+        self.assertIs(point2d, coerced)
+
     def test_coerce_linestring_2d(self):
 
         c = GeometryCoercer()
@@ -198,5 +218,121 @@ class GeometryCoercerTestCase(unittest.TestCase):
 
         self.assertFalse(multipolygon2d.hasz)
 
+    def test_coerce_geometrycollection_2d(self):
+
+        c = GeometryCoercer()
+        point = Point(0, 0, 1)
+        linestring = LineString((0, 0, 1), (1, 1, 1))
+        collection3d = GeometryCollection(point, linestring, srid=4326)
+
+        self.assertTrue(collection3d.hasz)
+
+        collection2d = c.coerce(collection3d)
+
+        self.assertFalse(collection2d.hasz)
+        self.assertEquals(collection3d.srid, collection2d.srid)
+        self.assertEquals(len(collection3d), len(collection2d))
+
+    def test_coerce_geometrycollection_3d(self):
+
+        c = GeometryCoercer()
+        collection2d = GeometryCollection(Point(0, 0), LineString((0, 0), (1, 1)), srid=4326)
+
+        collection3d = c.coerce(collection2d, dimensions=3, z_value=5)
+
+        self.assertTrue(collection3d.hasz)
+        self.assertEquals(5, collection3d[0].z)
+
+    def test_promote_polygon(self):
+
+        c = GeometryCoercer()
+        polygon = Polygon(((0, 0), (0, 1), (1, 1), (1, 0), (0, 0)), srid=4326)
+
+        multipolygon = c.promote(polygon)
+
+        self.assertEquals("MultiPolygon", multipolygon.geom_type)
+        self.assertEquals(polygon.srid, multipolygon.srid)
+        self.assertEquals(polygon.area, multipolygon.area)
+
+    def test_promote_many_keeps_multi_and_empty(self):
+
+        c = GeometryCoercer()
+        multipoint = MultiPoint(Point(0, 0), Point(1, 1), srid=4326)
+        point = Point(2, 2, srid=4326)
+
+        promoted = c.promote_many([multipoint, point, None])
+
+        self.assertIs(multipoint, promoted[0])
+        self.assertEquals("MultiPoint", promoted[1].geom_type)
+        self.assertIsNone(promoted[2])
+
+
+class SplitPartsTestCase(unittest.TestCase):
+
+    def test_part_path(self):
+
+        self.assertEquals('/tmp/out.shp', get_part_path('/tmp/out.shp', 0))
+        self.assertEquals('/tmp/out_001.shp', get_part_path('/tmp/out.shp', 1))
+        self.assertEquals('/tmp/out_012.shp', get_part_path('/tmp/out.shp', 12))
+
+    def test_split_parts(self):
+
+        # shp records of 10 bytes after its 100 bytes of header,
+        # dbf records of 5 bytes after 33 + 1 bytes
+        size_limit = SizeLimit(130, 33, 5)
+        parts = split_parts(range(7), size_limit, lambda record: 10)
+
+        self.assertEquals([[0, 1, 2], [3, 4, 5], [6]], [list(part) for part in parts])
+
+        size_limit = SizeLimit(130, 33, 50)
+        parts = split_parts(range(3), size_limit, lambda record: 10)
+
+        # a record larger than the limit still gets a part
+        self.assertEquals([[0], [1], [2]], [list(part) for part in parts])
+
+    def test_split_parts_without_limit(self):
+
+        self.assertEquals([[0, 1, 2]], [list(part) for part in split_parts(range(3), None, len)])
+        self.assertEquals([], list(split_parts([], SizeLimit(130, 33, 5), len)))
+
+
+class SpatialSortTestCase(unittest.TestCase):
+
+    def test_hilbert_index(self):
+
+        # the curve of a 2 x 2 grid goes up, right and down
+        self.assertEquals([0, 1, 2, 3], [hilbert_index(x, y, 1) for x, y in [(0, 0), (0, 1), (1, 1), (1, 0)]])
+
+        # every cell of a grid is visited once, each next to the last
+        cells = sorted((hilbert_index(x, y, 3), (x, y)) for x in range(8) for y in range(8))
+        self.assertEquals(list(range(64)), [index for index, cell in cells])
+        for (index, (x, y)), (next_index, (next_x, next_y)) in zip(cells, cells[1:]):
+            self.assertEquals(1, abs(next_x - x) + abs(next_y - y))
+
+    def test_hilbert_key(self):
+
+        extent = (10.0, 20.0, 30.0, 40.0)
+
+        self.assertEquals(0, get_hilbert_key(10.0, 20.0, extent, 1))
+        self.assertEquals(2, get_hilbert_key(30.0, 40.0, extent, 1))
+        self.assertEquals(3, get_hilbert_key(30.0, 20.0, extent, 1))
+        # a single point extent
+        self.assertEquals(0, get_hilbert_key(1.0, 1.0, (1.0, 1.0, 1.0, 1.0)))
+
+    def test_geohash(self):
+
+        self.assertEquals('ezs42', geohash(-5.6, 42.6, 5))
+        self.assertEquals('u4pruydqqvj8', geohash(10.40744, 57.64911))
+
+    def test_external_sort(self):
+
+        items = [(key % 7, key) for key in range(20)]
+
+        # runs of 3 items are spilled to disk and merged
+        self.assertEquals(sorted(items), list(external_sort(items, 3)))
+        self.assertEquals(sorted(items), list(external_sort(items, 100)))
+        self.assertEquals([], list(external_sort([], 3)))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,228 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.contrib.gis.gdal import DataSource, SpatialReference
+from django.contrib.gis.geos import Point
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from shape_engine.shapeimport.forms import DONT_IMPORT_KEY, FEATURE_GEOMETRY_KEY
+from shape_engine.shapeimport.models import LOG_FAILURES, STATUS_FAILED
+from shape_engine.shapeimport.views import ShapeImportDetailView, ShapeImportFieldsView
+from shape_engine.tests import ImportTestCase, write_shapefile
+from shape_engine.tests.models import Place, PlaceImport, PlaceImportLog, Site, Site3D
+
+
+class FieldsViewTestCase(ImportTestCase):
+
+    def test_batches(self):
+
+        mapping = {'id': DONT_IMPORT_KEY, 'name': 'name', 'code': 'num'}
+
+        with CaptureQueriesContext(connection) as queries:
+            shape_import = self.run_import(self.get_sites(12), mapping, import_batch_size=5)
+
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT INTO "%s"' % Place._meta.db_table)]
+        self.assertEquals(3, len(inserts))
+
+        self.assertEquals(12, shape_import.processed_features)
+        self.assertEquals(0, shape_import.failed_features)
+        self.assertEquals(list(range(12)), list(Place.objects.order_by('code').values_list('code', flat=True)))
+        self.assertEquals(12, PlaceImportLog.objects.filter(shape_import=shape_import, success=True).count())
+
+    def test_failing_batch(self):
+
+        # the second batch breaks the unique constraint of code,
+        # so only its duplicate feature is lost
+        codes = [0, 1, 2, 3, 4, 5, 6, 5, 8, 9]
+        mapping = {'id': DONT_IMPORT_KEY, 'name': 'name', 'code': 'num'}
+        shape_import = self.run_import(self.get_sites(10, codes), mapping, import_batch_size=5)
+
+        self.assertEquals(10, shape_import.processed_features)
+        self.assertEquals(1, shape_import.failed_features)
+        self.assertEquals(9, Place.objects.count())
+
+        failure = PlaceImportLog.objects.get(shape_import=shape_import, success=False)
+        self.assertEquals(7, failure.fid)
+        self.assertEquals('IntegrityError', failure.error_class)
+
+    def test_upsert(self):
+
+        for pk in (1, 2, 3):
+            Place.objects.create(pk=pk, name=u'old')
+
+        mapping = {'id': 'num', 'name': 'name', 'code': DONT_IMPORT_KEY}
+        sites = self.get_sites(6, codes=range(1, 7))
+
+        with CaptureQueriesContext(connection) as queries:
+            shape_import = self.run_import(sites, mapping, import_batch_size=3, upsert=True)
+
+        # a single query loads the existing rows of each batch
+        selects = [query for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT') and
+                   'FROM "%s"' % Place._meta.db_table in query['sql']]
+        self.assertEquals(2, len(selects))
+
+        self.assertEquals(0, shape_import.failed_features)
+        self.assertEquals([(pk, u'site %d' % (pk - 1)) for pk in range(1, 7)],
+                          list(Place.objects.order_by('pk').values_list('pk', 'name')))
+
+    def test_missing_rows_without_upsert(self):
+
+        Place.objects.create(pk=1, name=u'old')
+
+        mapping = {'id': 'num', 'name': 'name', 'code': DONT_IMPORT_KEY}
+        shape_import = self.run_import(self.get_sites(3, codes=range(1, 4)), mapping)
+
+        self.assertEquals(2, shape_import.failed_features)
+        self.assertEquals([(1, u'site 0')], list(Place.objects.values_list('pk', 'name')))
+        self.assertEquals(['DoesNotExist', 'DoesNotExist'],
+                          list(PlaceImportLog.objects.filter(success=False).values_list('error_class', flat=True)))
+
+    def test_log_failures(self):
+
+        codes = [0, 1, 1, 3, 1, 5]
+        mapping = {'id': DONT_IMPORT_KEY, 'name': 'name', 'code': 'num'}
+        shape_import = self.run_import(self.get_sites(6, codes), mapping, log_mode=LOG_FAILURES)
+
+        self.assertEquals([(2, False), (4, False)],
+                          list(PlaceImportLog.objects.order_by('fid').values_list('fid', 'success')))
+
+        summary = shape_import.summary_data
+        self.assertEquals(6, summary['total'])
+        self.assertEquals(6, summary['processed'])
+        self.assertEquals(2, summary['failed'])
+        self.assertEquals(4, summary['imported'])
+        self.assertEquals({'IntegrityError': 2}, summary['errors'])
+
+        # the failures are paginated in the detail view
+        request = RequestFactory().get('/', {'page': 2})
+        view = ShapeImportDetailView(model=PlaceImport, request=request, kwargs={'pk': shape_import.pk},
+                                     paginate_by=1)
+        view.object = view.get_object()
+        context = view.get_context_data(object=view.object)
+
+        self.assertEquals(2, context['paginator'].count)
+        self.assertEquals([4], [log.fid for log in context['logs']])
+        self.assertEquals(summary, context['summary'])
+
+    def test_incremental(self):
+
+        mapping = {'id': 'num', 'name': 'name', 'code': DONT_IMPORT_KEY}
+        sites = self.get_sites(4, codes=range(1, 5))
+        self.run_import(sites, mapping, incremental=True)
+
+        sites[1].name = u'changed'
+        with CaptureQueriesContext(connection) as queries:
+            shape_import = self.run_import(sites, mapping, incremental=True)
+
+        # only the changed feature is saved
+        updates = [query for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE "%s"' % Place._meta.db_table)]
+        self.assertEquals(1, len(updates))
+        self.assertEquals([u'Feature unchanged', u'Feature imported successfully'] + [u'Feature unchanged'] * 2,
+                          list(shape_import.logs.order_by('fid').values_list('message', flat=True)))
+        self.assertEquals(u'changed', Place.objects.get(pk=2).name)
+
+    def test_delete_missing(self):
+
+        for pk in range(1, 11):
+            Place.objects.create(pk=pk, name=u'old')
+
+        mapping = {'id': 'num', 'name': 'name', 'code': DONT_IMPORT_KEY}
+        sites = self.get_sites(4, codes=[2, 3, 5, 12])
+        with CaptureQueriesContext(connection) as queries:
+            shape_import = self.run_import(sites, mapping, upsert=True, delete_missing=True, import_batch_size=3)
+
+        self.assertEquals([2, 3, 5, 12], list(Place.objects.order_by('pk').values_list('pk', flat=True)))
+        self.assertEquals(7, shape_import.summary_data['deleted'])
+
+        # the table is walked in batches of import_batch_size
+        deletes = [query for query in queries.captured_queries
+                   if query['sql'].startswith('DELETE FROM "%s"' % Place._meta.db_table)]
+        self.assertEquals(4, len(deletes))
+
+    def test_mapping_without_pk(self):
+
+        mapping = {'id': DONT_IMPORT_KEY, 'name': 'name', 'code': 'num'}
+
+        for options in ({'incremental': True}, {'delete_missing': True, 'upsert': True}):
+            view = self.get_view(self.get_sites(2), **options)
+            self.assertRaises(ValidationError, view.proccess_shape_data, mapping)
+            self.assertEquals(STATUS_FAILED, PlaceImport.objects.get(pk=view.shape_import.pk).status)
+
+        self.assertEquals(0, Place.objects.count())
+
+
+class SiteImport(object):
+    target_model = Site
+
+
+class Site3DImport(object):
+    target_model = Site3D
+
+
+class ConvertGeometriesTestCase(unittest.TestCase):
+
+    mapping = {'name': 'name', 'geom': FEATURE_GEOMETRY_KEY}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        sites = [Site(pk=1, name=u'a', num=1, geom=Point(-45, -23, srid=4326)),
+                 Site(pk=2, name=u'b', num=2, geom=Point(10, 50, srid=4326))]
+        write_shapefile(self.directory, sites, out_srid=3857)
+        self.layer = DataSource(os.path.join(self.directory, 'places.shp'))[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertCoordinates(self, expected, geometries):
+        for coordinates, geometry in zip(expected, geometries):
+            for expected_value, value in zip(coordinates, geometry.coords):
+                self.assertAlmostEqual(expected_value, value, places=6)
+
+    def test_reprojection(self):
+
+        view = ShapeImportFieldsView(model=SiteImport)
+        view.set_source_srs(self.layer.srs.wkt)
+
+        geometries = view.convert_geometries(list(self.layer), self.mapping)
+
+        self.assertEquals([4326, 4326], [geometry.srid for geometry in geometries])
+        self.assertCoordinates([(-45, -23), (10, 50)], geometries)
+
+        # the transform is built once per import
+        field = Site._meta.get_field('geom')
+        self.assertIs(view.get_geometry_transform(field), view.get_geometry_transform(field))
+
+    def test_srs_without_srid(self):
+
+        # the .prj of the shapefile without its EPSG codes
+        srs = SpatialReference(self.layer.srs.proj)
+        self.assertIsNone(srs.srid)
+
+        view = ShapeImportFieldsView(model=SiteImport)
+        view.set_source_srs(srs)
+
+        self.assertCoordinates([(-45, -23), (10, 50)], view.convert_geometries(list(self.layer), self.mapping))
+
+    def test_dimensions(self):
+
+        view = ShapeImportFieldsView(model=Site3DImport)
+        view.set_source_srs(self.layer.srs)
+
+        geometries = view.convert_geometries(list(self.layer), self.mapping)
+
+        self.assertTrue(all(geometry.hasz for geometry in geometries))
+        self.assertCoordinates([(-45, -23, 0), (10, 50, 0)], geometries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,14 @@
 # coding: utf-8
+import heapq
+import os
+import tempfile
+from itertools import islice
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
 from django.contrib.gis.geos import (
     Point,
     LinearRing,
@@ -7,8 +17,40 @@ from django.contrib.gis.geos import (
     MultiPoint,
     MultiLineString,
     MultiPolygon,
+    GeometryCollection,
 )
 
+from .direct import SHP_HEADER_SIZE
+
+
+# the curves the features of an export can be sorted along
+SORT_CURVES = ("hilbert", "geohash")
+DEFAULT_SORT_CURVE = "hilbert"
+
+# a 65536 x 65536 grid over the extent of the export
+HILBERT_ORDER = 16
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+
+MULTI_GEOMETRY_TYPES = {"Point": "MultiPoint",
+                        "LineString": "MultiLineString",
+                        "LinearRing": "MultiLineString",
+                        "Polygon": "MultiPolygon"}
+
+MULTI_GEOMETRY_CLASSES = {"MultiPoint": MultiPoint,
+                          "MultiLineString": MultiLineString,
+                          "MultiPolygon": MultiPolygon}
+
+
+def get_multi_geometry_type(geom_type):
+
+    """Returns the name of the Multi counterpart
+    of a geometry type. Types that already are
+    collections are returned untouched"""
+
+    return MULTI_GEOMETRY_TYPES.get(geom_type, geom_type)
+
 
 class GeometryCoercer(object):
 
@@ -36,6 +78,10 @@ class GeometryCoercer(object):
         if geometry.hasz and dimensions == 3:
             return geometry
 
+        # geometry already is 2d
+        if not geometry.hasz and dimensions == 2:
+            return geometry
+
         if geometry.geom_type == "Point":
             return self._coerce_point(geometry, dimensions, z_value)
 
@@ -131,4 +177,245 @@ class GeometryCoercer(object):
         return MultiPolygon(new_polygons, srid=geometry.srid)
 
     def _coerce_geometrycollection(self, geometry, dimensions=2, z_value=0):
-        raise ValueError("Not implemented")
+
+        new_geometries = []
+
+        for g in geometry:
+            new_geometries.append(self.coerce(g, dimensions, z_value))
+
+        return GeometryCollection(new_geometries, srid=geometry.srid)
+
+    def promote(self, geometry):
+
+        """Promotes a single geometry to its Multi
+        counterpart. Collections are returned as is"""
+
+        multi_type = get_multi_geometry_type(geometry.geom_type)
+
+        if multi_type == geometry.geom_type:
+            return geometry
+
+        if geometry.geom_type == "LinearRing":
+            geometry = LineString(geometry.coords, srid=geometry.srid)
+
+        return MULTI_GEOMETRY_CLASSES[multi_type](geometry, srid=geometry.srid)
+
+    def promote_many(self, geometries):
+
+        """Promotes a batch of geometries to their
+        Multi counterparts, keeping empty values"""
+
+        return [self.promote(g) if g else g for g in geometries]
+
+
+def get_part_path(path, index):
+
+    """Returns the path of a part of a split export:
+    the path itself for the first part, name_001.shp
+    for the second one and so on"""
+
+    if not index:
+        return path
+
+    base_name, extension = os.path.splitext(path)
+    return "%s_%03d%s" % (base_name, index, extension)
+
+
+class SizeLimit(object):
+
+    """Counts the bytes of the .shp and .dbf of the
+    part of a shapefile being written, to end the part
+    before either of them grows past max_size"""
+
+    def __init__(self, max_size, dbf_header_length, dbf_record_length):
+        self.max_size = max_size
+        self.dbf_header_length = dbf_header_length
+        self.dbf_record_length = dbf_record_length
+        self.reset()
+
+    def reset(self):
+        self.num_records = 0
+        self.shp_size = SHP_HEADER_SIZE
+        # the header and the end of file marker
+        self.dbf_size = self.dbf_header_length + 1
+
+    def add(self, shp_record_size):
+
+        """Counts a record of shp_record_size bytes in the .shp.
+        Returns False, without counting it, if it doesn't fit in
+        the part. The first record of a part always fits"""
+
+        shp_size = self.shp_size + shp_record_size
+        dbf_size = self.dbf_size + self.dbf_record_length
+
+        if self.num_records and max(shp_size, dbf_size) > self.max_size:
+            return False
+
+        self.num_records += 1
+        self.shp_size = shp_size
+        self.dbf_size = dbf_size
+        return True
+
+
+def split_parts(records, size_limit, get_size):
+
+    """Splits the records in the consecutive parts of an
+    export, each an iterator of the records that fit in the
+    size limit. get_size returns the size of a record in the
+    .shp. A part must be consumed before the next one is
+    taken. Without a size limit, all records are one part"""
+
+    if size_limit is None:
+        yield iter(records)
+        return
+
+    records = iter(records)
+    pending = []
+
+    def part(first):
+        size_limit.reset()
+        size_limit.add(get_size(first))
+        yield first
+
+        for record in records:
+            if not size_limit.add(get_size(record)):
+                pending.append(record)
+                return
+
+            yield record
+
+    for record in records:
+        pending.append(record)
+
+        while pending:
+            yield part(pending.pop())
+
+
+def get_center(extent):
+
+    """Returns the center of the (xmin, ymin, xmax, ymax)
+    bounding box of a geometry"""
+
+    return (extent[0] + extent[2]) / 2.0, (extent[1] + extent[3]) / 2.0
+
+
+def hilbert_index(x, y, order=HILBERT_ORDER):
+
+    """Returns the distance along a Hilbert curve of the
+    2 ** order x 2 ** order grid of the cell x, y"""
+
+    side = 1 << order
+    index = 0
+    s = side >> 1
+
+    while s:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        index += s * s * ((3 * rx) ^ ry)
+
+        # rotates the quadrant so the curve goes on from it
+        if not ry:
+            if rx:
+                x = side - 1 - x
+                y = side - 1 - y
+            x, y = y, x
+
+        s >>= 1
+
+    return index
+
+
+def get_hilbert_key(x, y, extent, order=HILBERT_ORDER):
+
+    """Returns the Hilbert index of the point in the grid
+    laid over the extent of the export"""
+
+    xmin, ymin, xmax, ymax = extent
+    last = (1 << order) - 1
+
+    column = int((x - xmin) / (xmax - xmin) * last) if xmax > xmin else 0
+    row = int((y - ymin) / (ymax - ymin) * last) if ymax > ymin else 0
+
+    return hilbert_index(min(max(column, 0), last), min(max(row, 0), last), order)
+
+
+def geohash(longitude, latitude, precision=GEOHASH_PRECISION):
+
+    """Returns the geohash of the point, which sort
+    lexically along a Z-order curve"""
+
+    longitudes = [-180.0, 180.0]
+    latitudes = [-90.0, 90.0]
+    characters = []
+    bits = 0
+    value = 0
+    even = True
+
+    while len(characters) < precision:
+        interval, coordinate = (longitudes, longitude) if even else (latitudes, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+
+        even = not even
+        bits += 1
+
+        if bits == 5:
+            characters.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+
+    return "".join(characters)
+
+
+def _dump_run(items):
+
+    """Pickles the sorted items to a temporary file"""
+
+    run = tempfile.TemporaryFile()
+
+    for item in items:
+        pickle.dump(item, run, pickle.HIGHEST_PROTOCOL)
+
+    run.seek(0)
+    return run
+
+
+def _load_run(run):
+
+    try:
+        while True:
+            yield pickle.load(run)
+    except EOFError:
+        pass
+    finally:
+        run.close()
+
+
+def external_sort(items, chunk_size):
+
+    """Sorts more items than fit in memory. Runs of
+    chunk_size items are sorted and pickled to temporary
+    files, which are then merged. Items that fit in a
+    single run are sorted in memory"""
+
+    items = iter(items)
+    runs = []
+
+    while True:
+        chunk = sorted(islice(items, chunk_size))
+
+        if not runs and len(chunk) < chunk_size:
+            return iter(chunk)
+
+        if not chunk:
+            break
+
+        runs.append(_dump_run(chunk))
+
+    return heapq.merge(*[_load_run(run) for run in runs])